@@ -0,0 +1,130 @@
+"""
+Corpus-level aggregates of the processed songs. The per-song n-gram histograms and the key, time signature and
+ambitus distributions are merged into one document per corpus, so overview pages don't have to aggregate
+every song. The state keeps what every song added to the counts, keyed by its file hash, so new songs can be added
+and changed or deleted songs subtracted without reading the whole corpus again.
+"""
+
+import json
+import os
+from collections import Counter
+
+NGRAM_FEATURES = ["ngram_rhythm", "ngram_pitch"]
+
+
+def song_counts(document: dict) -> dict:
+    """Returns what the song adds to the aggregates of its corpus."""
+    ambitus = document.get("ambitus", {}).get("ambitus_semitones")
+    return {
+        "composer": document.get("metadata", {}).get("composer") or None,
+        "time_signatures": document.get("time_signature", []),
+        "key": document.get("key", {}).get("most_certain_key"),
+        "ambitus": str(ambitus) if ambitus is not None else None,
+        "ngrams": {
+            feature: document[feature]["frequency_histogram"]
+            for feature in NGRAM_FEATURES
+            if feature in document
+        },
+    }
+
+
+class CorpusAggregate:
+    """Mergeable counts over all the songs of a corpus."""
+
+    def __init__(self, corpus_id: str):
+        self.corpus_id = corpus_id
+        # the counts of every song, by file hash
+        self.songs = {}
+        self.composers = Counter()
+        self.time_signatures = Counter()
+        self.keys = Counter()
+        self.ambitus = Counter()
+        self.ngrams = {feature: Counter() for feature in NGRAM_FEATURES}
+
+    @property
+    def file_hashes(self) -> set:
+        return set(self.songs)
+
+    def add(self, document: dict) -> bool:
+        """Adds the song to the counts. Returns False if it was already counted."""
+        file_hash = document["file_hash_sha256"]
+        if file_hash in self.songs:
+            return False
+        self.songs[file_hash] = song_counts(document)
+        self._update(self.songs[file_hash], 1)
+        return True
+
+    def remove(self, file_hash: str) -> bool:
+        """Subtracts the song from the counts. Returns False if it wasn't counted."""
+        if file_hash not in self.songs:
+            return False
+        self._update(self.songs.pop(file_hash), -1)
+        return True
+
+    def _update(self, counts: dict, sign: int):
+        if counts["composer"] is not None:
+            _add(self.composers, {counts["composer"]: 1}, sign)
+        _add(self.time_signatures, Counter(counts["time_signatures"]), sign)
+        if counts["key"] is not None:
+            _add(self.keys, {counts["key"]: 1}, sign)
+        if counts["ambitus"] is not None:
+            _add(self.ambitus, {counts["ambitus"]: 1}, sign)
+        for feature, histogram in counts["ngrams"].items():
+            _add(self.ngrams[feature], histogram, sign)
+
+    def to_document(self, top_ngrams: int = 1000) -> dict:
+        """Returns the aggregates stored in the corpus document. Only the most common n-grams are kept."""
+        ambitus = {int(k): v for k, v in self.ambitus.items()}
+        count = sum(ambitus.values())
+        average = sum(k * v for k, v in ambitus.items()) / count if count else None
+        return {
+            "song_count": len(self.songs),
+            "composers_count": len(self.composers),
+            "time_signatures": dict(self.time_signatures.most_common()),
+            "keys": dict(self.keys.most_common()),
+            "ambitus": {
+                "count": count,
+                "min": min(ambitus, default=None),
+                "max": max(ambitus, default=None),
+                "avg": average,
+                "histogram": {str(k): ambitus[k] for k in sorted(ambitus)},
+            },
+            **{
+                feature: dict(self.ngrams[feature].most_common(top_ngrams))
+                for feature in NGRAM_FEATURES
+            },
+        }
+
+    def save(self, state_file: str):
+        tmp_file = state_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"corpus_id": self.corpus_id, "songs": self.songs}, f)
+        os.replace(tmp_file, state_file)
+
+    @staticmethod
+    def load(state_file: str, corpus_id: str) -> "CorpusAggregate":
+        """
+        Loads the state of a previous run or returns empty aggregates if there is none. States written before the
+        counts of every song were kept can't subtract songs, so their songs are counted again.
+        """
+        aggregate = CorpusAggregate(corpus_id)
+        if not os.path.isfile(state_file):
+            return aggregate
+        with open(state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state["corpus_id"] != corpus_id:
+            raise ValueError(
+                f"State file {state_file} belongs to corpus {state['corpus_id']}"
+            )
+        for file_hash, counts in state.get("songs", {}).items():
+            aggregate.songs[file_hash] = counts
+            aggregate._update(counts, 1)
+        return aggregate
+
+
+def _add(counter: Counter, counts: dict, sign: int):
+    """Adds or subtracts the counts, dropping the keys that reach zero."""
+    for key, value in counts.items():
+        counter[key] += sign * value
+        if counter[key] <= 0:
+            del counter[key]
@@ -0,0 +1,182 @@
+"""
+Runs the isolated file workers concurrently. The number of workers is adapted to the memory and CPU pressure of the
+machine, because the memory needed by a single file varies a lot, especially for audio.
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from tqdm import tqdm
+
+import metrics
+from isolation import get_child_pids, get_tree_rss
+
+# stop starting new files above this fraction of used memory and remove workers
+MEMORY_HIGH = 0.85
+# add workers only below this fraction of used memory
+MEMORY_LOW = 0.7
+# 1-minute load average per core above which workers are removed, and below which they are added
+LOAD_HIGH = 1.25
+LOAD_LOW = 0.9
+# seconds between the decisions of the controller
+DECISION_INTERVAL_SECONDS = 2
+
+
+def get_memory():
+    """
+    Returns the used and total bytes of the memory available to this process, from the cgroup limit in containers
+    or /proc/meminfo otherwise. Returns None if they can't be read.
+    """
+    try:
+        with open("/sys/fs/cgroup/memory.max", "r", encoding="utf-8") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            with open("/sys/fs/cgroup/memory.current", "r", encoding="utf-8") as f:
+                return int(f.read()), int(limit)
+    except (OSError, ValueError):
+        pass
+    try:
+        meminfo = {}
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                name, value = line.split(":", 1)
+                meminfo[name] = int(value.split()[0]) * 1024
+        return meminfo["MemTotal"] - meminfo["MemAvailable"], meminfo["MemTotal"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def get_load():
+    """Returns the 1-minute load average per core, or None where it's not available."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (OSError, AttributeError):
+        return None
+
+
+class AdaptiveController:
+    """
+    Decides how many files are processed at the same time, between min_workers and max_workers. Workers are added
+    one at a time while memory and load are low and there is room for the largest worker seen so far, and removed
+    when either gets high. New files are not started under memory pressure unless nothing is running. Every change
+    is logged.
+    """
+
+    def __init__(
+        self,
+        min_workers: int,
+        max_workers: int,
+        memory_high: float = MEMORY_HIGH,
+        memory_low: float = MEMORY_LOW,
+        interval: float = DECISION_INTERVAL_SECONDS,
+    ):
+        if min_workers < 1 or max_workers < min_workers:
+            raise ValueError("Workers must satisfy 1 <= min_workers <= max_workers")
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.memory_high = memory_high
+        self.memory_low = memory_low
+        self.interval = interval
+        self.target = min_workers
+        self.paused = False
+        self.peak_worker_rss = 0
+        self._last_decision = None
+
+    def log(self, message: str):
+        tqdm.write(f"[workers] {message}")
+
+    def read_stats(self) -> dict:
+        # a worker uses the memory of the processes it started too
+        worker_rss = [get_tree_rss(pid) or 0 for pid in get_child_pids(os.getpid())]
+        memory = get_memory()
+        return {
+            "memory": memory[0] / memory[1] if memory is not None else None,
+            "memory_free": memory[1] - memory[0] if memory is not None else None,
+            "load": get_load(),
+            "worker_rss": max(worker_rss, default=0),
+            "total_rss": sum(worker_rss),
+        }
+
+    def decide(self, active: int, stats: dict):
+        """Updates the target and the pause from the stats of the machine."""
+        memory = stats["memory"]
+        load = stats["load"]
+        self.peak_worker_rss = max(self.peak_worker_rss, stats["worker_rss"])
+        metrics.workers_rss.set(stats["total_rss"])
+
+        paused = memory is not None and memory > self.memory_high
+        if paused != self.paused:
+            self.paused = paused
+            self.log(
+                f"{'pausing' if paused else 'resuming'} new files at {_format(memory)} memory used"
+            )
+
+        target = self.target
+        reason = None
+        if paused:
+            target -= 1
+            reason = f"memory pressure ({memory:.0%} used)"
+        elif load is not None and load > LOAD_HIGH:
+            target -= 1
+            reason = f"high load ({load:.2f} per core)"
+        elif active >= self.target and self._has_headroom(stats):
+            target += 1
+            reason = f"headroom ({_format(memory)} memory used, load {_format(load, '.2f')} per core)"
+
+        target = min(max(target, self.min_workers), self.max_workers)
+        if target != self.target:
+            self.log(f"{self.target} -> {target} workers: {reason}")
+            self.target = target
+        metrics.workers_target.set(self.target)
+
+    def _has_headroom(self, stats: dict) -> bool:
+        if stats["memory"] is None or stats["memory"] > self.memory_low:
+            return False
+        if stats["load"] is not None and stats["load"] > LOAD_LOW:
+            return False
+        # there should be room for another worker as large as the largest one so far
+        return stats["memory_free"] >= self.peak_worker_rss
+
+    def can_start(self, active: int) -> bool:
+        now = time.monotonic()
+        if self._last_decision is None or now - self._last_decision >= self.interval:
+            self._last_decision = now
+            self.decide(active, self.read_stats())
+        if active == 0:
+            # always make progress, even if other processes use the memory
+            return True
+        return not self.paused and active < self.target
+
+
+def _format(value, spec: str = ".0%") -> str:
+    return "unknown" if value is None else format(value, spec)
+
+
+def run_adaptive(func, tasks, controller: AdaptiveController):
+    """
+    Calls func(task) for every task in threads, starting new tasks whenever the controller allows it. func should
+    hand the work to a worker process, e.g. with isolation.run_isolated. Yields (task, future) pairs in the order
+    they complete.
+    """
+    tasks = iter(tasks)
+    pending = {}
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=controller.max_workers) as executor:
+        while not exhausted or pending:
+            while not exhausted and controller.can_start(len(pending)):
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    break
+                pending[executor.submit(func, task)] = task
+            metrics.workers_active.set(len(pending))
+            if not pending:
+                continue
+            # wake up periodically, so the controller can add workers while the files are running
+            done, _ = wait(
+                pending, timeout=controller.interval, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                yield pending.pop(future), future
+    metrics.workers_active.set(0)
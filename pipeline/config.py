@@ -2,11 +2,72 @@
 supported_xml_extensions = [".xml", ".musicxml"]
 supported_audio_extensions = [".wav", ".flac", ".ogg", ".mp3"]
 
-from processors import basic_processors, contour_processor, audio_processors  # noqa: E402
+# Settings of the audio processors selected with `--profile`. accurate runs the most expensive settings, fast is
+# meant for a first pass over a new corpus. Processors that depend on the profile append it to their algorithm name,
+# except for the default, e.g. bpm.essentia_degara_fast, so results of different profiles are never mixed up.
+default_audio_profile = "accurate"
+audio_profiles = {
+    "accurate": {
+        "beat_method": "multifeature",
+        "pesto_step_ms": 10.0,
+        "key_sample_rate": 44100,
+        "chroma_sample_rate": 44100,
+        "skip_features": [],
+    },
+    "fast": {
+        "beat_method": "degara",
+        "pesto_step_ms": 40.0,
+        "key_sample_rate": 22050,
+        "chroma_sample_rate": 22050,
+        # autochord has no cheaper settings
+        "skip_features": ["chords"],
+    },
+}
+
+
+def get_audio_profile(profile: str = None) -> dict:
+    """Returns the settings of the profile, the default one if profile is None."""
+    if profile is None:
+        profile = default_audio_profile
+    if profile not in audio_profiles:
+        raise ValueError(
+            f"Unknown profile {profile}, must be one of {', '.join(audio_profiles)}"
+        )
+    return audio_profiles[profile]
+
+
+def get_algorithm_name(algorithm_name: str, profile: str = None) -> str:
+    get_audio_profile(profile)
+    if profile is None or profile == default_audio_profile:
+        return algorithm_name
+    return f"{algorithm_name}_{profile}"
+
+
+# Fields moved to separate blob documents by `process --split-blobs` and `upload --blob-index`.
+# Search results never show them, they are only fetched on the detail pages.
+blob_fields = [
+    "original_file",
+    "pitch_contour.pesto.pitch_contour_hz_voice",
+    "pitch_contour.pesto.pitch_contour_hz_instrumental",
+    "pitch_contour.pesto_fast.pitch_contour_hz_voice",
+    "pitch_contour.pesto_fast.pitch_contour_hz_instrumental",
+    "loudness.rms.loudness_total",
+    "loudness.rms.loudness_vocals",
+    "loudness.rms.loudness_instrumental",
+]
+
+from processors import (  # noqa: E402
+    basic_processors,
+    contour_processor,
+    educational_processor,
+    embedding_processor,
+    audio_processors,
+)
 
 music_xml_processors = [
     # Add musicXML processors here
-    basic_processors.KeyProcessor,
+    # KeyProcessor gives the same results, but is much slower
+    basic_processors.FastKeyProcessor,
     basic_processors.TimeSignatureProcessor,
     basic_processors.TempoProcessor,
     basic_processors.AmbitusProcessor,
@@ -16,6 +77,8 @@ music_xml_processors = [
     contour_processor.RhythmProcessor,
     contour_processor.NGramRhythmProcessor,
     contour_processor.NGramPitchProcessor,
+    educational_processor.EducationalProcessor,
+    embedding_processor.MusicXMLEmbeddingProcessor,
 ]
 
 audio_processors = [
@@ -26,4 +89,15 @@ audio_processors = [
     audio_processors.AudioChordProcessor,
     audio_processors.AudioRMSProcessor,
     audio_processors.AudioKeyExtractProcessor,
+    embedding_processor.AudioEmbeddingProcessor,
 ]
+
+
+def get_audio_processors(profile: str = None) -> list:
+    """Returns the audio processors that run with the profile."""
+    skip_features = get_audio_profile(profile)["skip_features"]
+    return [
+        processor
+        for processor in audio_processors
+        if processor(None, profile=profile).get_feature_name() not in skip_features
+    ]
@@ -1,14 +1,23 @@
 import json
 import os
-from typing import Annotated, Optional
+from typing import Annotated, List, Optional
 
 import urllib3
 from elasticsearch import Elasticsearch
 from dotenv import load_dotenv
 import typer
+from tqdm import tqdm
+
+import partitioning
+import upload
+from aggregates import CorpusAggregate
+from helpers import read_results
 
 app = typer.Typer()
 
+# the aggregates have a key for every n-gram, which must not end up in the mapping
+CORPUS_MAPPING = {"properties": {"aggregates": {"type": "object", "enabled": False}}}
+
 load_dotenv()
 crt_path = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "../certs/ca/ca.crt")
@@ -39,10 +48,41 @@ def create_corpus(
             help="A file containing details about the corpus. The file should be in JSON format. For the schema, see the README.",
         ),
     ],
+    documents_index: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Index the documents of the corpus are uploaded to, e.g. 'songs'. It's created with the mapping and "
+            "settings of --mapping-file if it doesn't exist, and with an index per corpus also the corpus index."
+        ),
+    ] = None,
+    mapping_file: Annotated[
+        Optional[str],
+        typer.Option(help="Mapping file of --documents-index from generate-mapping"),
+    ] = None,
+    shards: Annotated[
+        Optional[int],
+        typer.Option(
+            help="Number of primary shards of the corpus index, with an index per corpus"
+        ),
+    ] = None,
 ):
     """Creates a corpus in the ElasticSearch database."""
+    if documents_index is not None and mapping_file is None:
+        raise typer.BadParameter("Must specify mapping_file with documents_index")
+    mapping = None
+    if mapping_file is not None:
+        with open(mapping_file, "r", encoding="utf-8") as f:
+            mapping = json.load(f)
+    if shards is not None and (
+        mapping is None
+        or partitioning.get_partitioning(mapping) != partitioning.PARTITIONING_INDEX
+    ):
+        raise typer.BadParameter(
+            "Shards of a corpus require a mapping_file with an index per corpus"
+        )
+
     client.options(ignore_status=400).indices.create(
-        index=index
+        index=index, mappings=CORPUS_MAPPING
     )  # create the index if it doesn't exist
     data = {
         "corpus_name": corpus_name,
@@ -57,6 +97,15 @@ def create_corpus(
     api_response = client.index(index=index, document=data)
     print(f'Created corpus {corpus_name} with id {api_response["_id"]}')
 
+    if documents_index is not None:
+        corpus_id = api_response["_id"]
+        index_partitioning = upload.prepare_index(documents_index, mapping)
+        if index_partitioning == partitioning.PARTITIONING_INDEX:
+            partitioning.create_corpus_index(client, documents_index, corpus_id, shards)
+            print(
+                f"Created {partitioning.get_corpus_index(documents_index, corpus_id)}"
+            )
+
 
 @app.command()
 def list_corpuses(index: str):
@@ -64,3 +113,76 @@ def list_corpuses(index: str):
     api_response = client.search(index=index)
     for hit in api_response["hits"]["hits"]:
         print(f'{hit["_id"]}: {hit["_source"]["corpus_name"]}')
+
+
+@app.command()
+def aggregate_corpus(
+    corpus_id: str,
+    results_files: Annotated[
+        List[str], typer.Argument(help="The results files written by `process`")
+    ],
+    index: Annotated[
+        str, typer.Option(help="The index with the corpuses")
+    ] = "corpuses",
+    state_file: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Where the counts are kept between runs. Defaults to aggregates.<corpus_id>.json"
+        ),
+    ] = None,
+    rebuild: Annotated[
+        bool,
+        typer.Option(
+            help="Ignore the state of previous runs and count every song again"
+        ),
+    ] = False,
+    top_ngrams: Annotated[
+        int, typer.Option(help="Number of the most common n-grams stored in the corpus")
+    ] = 1000,
+    upload: Annotated[
+        bool,
+        typer.Option(help="Whether to store the aggregates in the corpus document"),
+    ] = True,
+):
+    """
+    Merges the n-gram histograms and the key, time signature and ambitus distributions of the songs in the
+    corpus into the corpus document. Songs counted in previous runs are skipped, so only new songs are read, and
+    songs that are no longer in the results files (changed or deleted) are subtracted.
+    """
+    for results_file in results_files:
+        if not os.path.isfile(results_file):
+            raise typer.BadParameter(f"File does not exist: {results_file}")
+    if state_file is None:
+        state_file = f"aggregates.{corpus_id}.json"
+    if rebuild and os.path.isfile(state_file):
+        os.remove(state_file)
+
+    aggregate = CorpusAggregate.load(state_file, corpus_id)
+    added = 0
+    file_hashes = set()
+    for document in tqdm(read_results(results_files)):
+        if document.get("corpus_id") != corpus_id:
+            continue
+        file_hashes.add(document["file_hash_sha256"])
+        if aggregate.add(document):
+            added += 1
+    # the results files hold the whole corpus, changed songs have a new hash
+    removed = aggregate.file_hashes - file_hashes
+    for file_hash in removed:
+        aggregate.remove(file_hash)
+    aggregate.save(state_file)
+    print(
+        f"Added {added} and removed {len(removed)} songs, corpus {corpus_id} has "
+        f"{len(aggregate.file_hashes)} songs"
+    )
+
+    if upload:
+        client.options(ignore_status=400).indices.put_mapping(
+            index=index, **CORPUS_MAPPING
+        )
+        client.update(
+            index=index,
+            id=corpus_id,
+            doc={"aggregates": aggregate.to_document(top_ngrams)},
+        )
+        print(f"Uploaded the aggregates to {index}/{corpus_id}")
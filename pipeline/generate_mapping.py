@@ -3,7 +3,13 @@ from typing import Annotated
 import typer
 from typer_config import use_yaml_config
 
-from config import music_xml_processors, audio_processors
+from partitioning import PARTITIONING_NONE, partition_mapping
+from config import (
+    audio_profiles,
+    default_audio_profile,
+    get_audio_processors,
+    music_xml_processors,
+)
 
 app = typer.Typer()
 
@@ -18,41 +24,96 @@ def generate_mapping(
             help="Type of the mapping to generate. Can be 'audio' or 'musicxml'"
         ),
     ],
+    profile: Annotated[
+        str,
+        typer.Option(
+            help="Quality profile of the audio processors the results were processed with"
+        ),
+    ] = default_audio_profile,
+    partitioning: Annotated[
+        str,
+        typer.Option(
+            help="How the documents of the corpora are partitioned: 'none', 'routing' to route them by corpus_id "
+            "or 'index' for an index per corpus behind the index name",
+        ),
+    ] = PARTITIONING_NONE,
+    shards: Annotated[
+        int,
+        typer.Option(
+            help="Number of primary shards of the index, or of every corpus index with --partitioning index"
+        ),
+    ] = None,
+    routing_partition_size: Annotated[
+        int,
+        typer.Option(
+            help="With --partitioning routing, number of shards a corpus is spread over, less than --shards"
+        ),
+    ] = 1,
 ):
-    """Generates a mapping file for the ElasticSearch database."""
+    """Generates a mapping file for the ElasticSearch database, with the settings of the index."""
+    if routing_partition_size > 1 and (
+        shards is None or routing_partition_size >= shards
+    ):
+        raise typer.BadParameter("Routing partition size must be less than the shards")
+    try:
+        mapping = partition_mapping(
+            build_mapping(processor_type, profile),
+            partitioning,
+            shards,
+            routing_partition_size,
+        )
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    with open(out_file, "w", encoding="utf-8") as f:
+        f.write(json.dumps(mapping, indent=4))
+
+    print(f"Mapping file generated at {out_file}")
+
+
+def build_mapping(processor_type: str, profile: str = default_audio_profile) -> dict:
+    """Returns the mapping of the documents written by the 'audio' or 'musicxml' processors."""
     processors = []
     if processor_type == "audio":
-        processors = audio_processors
+        if profile not in audio_profiles:
+            raise typer.BadParameter(
+                f"Unknown profile {profile}, must be one of {', '.join(audio_profiles)}"
+            )
+        processors = get_audio_processors(profile)
     elif processor_type == "musicxml":
         processors = music_xml_processors
     else:
         raise typer.BadParameter("Invalid type. Must be 'audio' or 'musicxml'")
 
-    with open(out_file, "w", encoding="utf-8") as f:
-        mapping = {
-            "properties": {
-                "filename": {"enabled": False},
-                "original_file": {"enabled": False},
-                "corpus_id": {"type": "keyword"},
-                "file_hash_sha256": {"enabled": False},
-            }
+    mapping = {
+        "properties": {
+            "filename": {"enabled": False},
+            "original_file": {"enabled": False},
+            "corpus_id": {"type": "keyword"},
+            "file_hash_sha256": {"enabled": False},
+            # written by the find-near-duplicates command
+            "near_duplicates": {
+                "properties": {
+                    "cluster_id": {"type": "keyword"},
+                    "similar_files": {"type": "keyword"},
+                }
+            },
         }
-        for processor in processors:
+    }
+    for processor in processors:
+        if processor_type == "audio":
+            processor_instance = processor(None, profile=profile)
+        else:
             processor_instance = processor(None)
-            if processor_instance.get_feature_name() not in mapping["properties"]:
-                mapping["properties"][processor_instance.get_feature_name()] = {
-                    "properties": {}
-                }
-            if processor_type == "audio":
-                mapping["properties"][processor_instance.get_feature_name()][
-                    "properties"
-                ][
-                    processor_instance.get_algorithm_name()
-                ] = processor_instance.get_mapping()
-            else:
-                mapping["properties"][processor_instance.get_feature_name()] = (
-                    processor_instance.get_mapping()
-                )
-        f.write(json.dumps(mapping, indent=4))
-
-    print(f"Mapping file generated at {out_file}")
+        if processor_instance.get_feature_name() not in mapping["properties"]:
+            mapping["properties"][processor_instance.get_feature_name()] = {
+                "properties": {}
+            }
+        if processor_type == "audio":
+            mapping["properties"][processor_instance.get_feature_name()]["properties"][
+                processor_instance.get_algorithm_name()
+            ] = processor_instance.get_mapping()
+        else:
+            mapping["properties"][processor_instance.get_feature_name()] = (
+                processor_instance.get_mapping()
+            )
+    return mapping
@@ -1,7 +1,8 @@
+import gzip
+import hashlib
+import json
 import os
 
-import soundfile
-
 
 def filter_files(files):
     filter_extensions = [file for file in files if check_file_extension_allowed(file)]
@@ -17,12 +18,6 @@ def is_split_file(file: str):
     return splits[-2] == "accompaniment" or splits[-2] == "vocals"
 
 
-def check_file_length(path: str):
-    """Returns true if the file is shorter than 10 minutes."""
-    file = soundfile.SoundFile(path)
-    return file.frames / file.samplerate <= 600
-
-
 def check_file_extension_allowed(path: str):
     return check_xml_extension_allowed(path) or check_audio_extension_allowed(path)
 
@@ -43,3 +38,129 @@ def check_audio_extension_allowed(path: str):
         if path.endswith(ext):
             return True
     return False
+
+
+def get_file_type(path: str):
+    """Returns 'musicxml' or 'audio' depending on the extension of the file."""
+    if check_xml_extension_allowed(path):
+        return "musicxml"
+    if check_audio_extension_allowed(path):
+        return "audio"
+    return "unknown"
+
+
+def hash_file(path: str) -> str:
+    """Returns the SHA-256 of the file, read in blocks so large recordings aren't loaded at once."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+# extensions of the compressed NDJSON files, detected by open_ndjson
+COMPRESSED_EXTENSIONS = [".zst", ".gz"]
+# zstd level 3 is about as fast as writing uncompressed JSON to disk
+ZSTD_LEVEL = 3
+
+
+def split_compression(path: str):
+    """Splits the compression extension off the path, e.g. results.json.zst -> (results.json, .zst)."""
+    for extension in COMPRESSED_EXTENSIONS:
+        if path.endswith(extension):
+            return path[: -len(extension)], extension
+    return path, ""
+
+
+def open_ndjson(path: str, mode: str = "r"):
+    """
+    Opens a NDJSON file in text mode for reading ("r"), writing ("w") or appending ("a"). Files ending with .zst or
+    .gz are (de)compressed transparently while streaming. zstd compresses on all cores in background threads, so
+    prefer it for large outputs. It needs the zstandard package, gzip works everywhere.
+    """
+    _, compression = split_compression(path)
+    if compression == ".zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError(
+                f"Reading and writing {path} requires the zstandard package. Install it or use .gz instead."
+            )
+
+        cctx = None
+        if mode != "r":
+            cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+        return zstandard.open(path, mode, cctx=cctx, encoding="utf-8")
+    if compression == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_results(results_files: list[str]):
+    """Yields the documents of the results files. Manifests of sharded results are expanded to their shards."""
+    from output import is_manifest, read_manifest
+
+    for results_file in results_files:
+        if is_manifest(results_file):
+            yield from read_results(read_manifest(results_file))
+            continue
+        with open_ndjson(results_file) as f:
+            for line in f:
+                if line.strip() == "":
+                    continue
+                yield json.loads(line)
+
+
+def merge(source, destination):
+    """
+    Deep merge two dictionaries. https://stackoverflow.com/questions/20656135/python-deep-merge-dictionary-data
+    """
+    for key, value in source.items():
+        if isinstance(value, dict):
+            # get node or create one
+            node = destination.setdefault(key, {})
+            merge(value, node)
+        else:
+            destination[key] = value
+
+    return destination
+
+
+def get_blob_file(results_file: str):
+    """Returns the path of the file with the blob documents that belong to the results file."""
+    path, compression = split_compression(results_file)
+    root, extension = os.path.splitext(path)
+    return root + ".blobs" + extension + compression
+
+
+def split_document(document: dict, fields: list[str] = None):
+    """
+    Moves the heavy fields (dotted paths, `blob_fields` in config.py by default) of the document into a blob
+    document with the same file hash. The document is changed in place. Returns the document and the blob
+    document, which is None if the document has none of the fields.
+    """
+    if fields is None:
+        from config import blob_fields
+
+        fields = blob_fields
+
+    blob = {}
+    for field in fields:
+        *parents, name = field.split(".")
+        source = document
+        for parent in parents:
+            source = source.get(parent)
+            if not isinstance(source, dict):
+                break
+        if not isinstance(source, dict) or name not in source:
+            continue
+        target = blob
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[name] = source.pop(name)
+
+    if len(blob) == 0:
+        return document, None
+    blob["file_hash_sha256"] = document["file_hash_sha256"]
+    blob["corpus_id"] = document.get("corpus_id")
+    return document, blob
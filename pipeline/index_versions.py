@@ -0,0 +1,247 @@
+"""
+Versioned indices for reloading a live index without downtime. The documents are loaded into a new index, e.g.
+songs-v8, while searches keep using the index name, which is an alias of the live version. Once the new version is
+loaded the alias is moved to it in a single request, and the previous versions are kept for rolling back.
+"""
+
+from tqdm import tqdm
+
+import partitioning
+from helpers import merge
+
+VERSION_SEPARATOR = "-v"
+# versions of an index kept, including the live one
+KEEP_VERSIONS = 3
+# settings while the documents are loaded, nothing searches the version yet
+BULK_LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+# seconds a server-side copy of the live version may take
+REINDEX_TIMEOUT_SECONDS = 6 * 60 * 60
+
+
+def get_version_index(alias: str, version: int) -> str:
+    return f"{alias}{VERSION_SEPARATOR}{version}"
+
+
+def get_version(alias: str, index: str) -> int:
+    """Returns the version of an index of the alias, e.g. songs-v8 -> 8, or None if it isn't a version."""
+    prefix = alias + VERSION_SEPARATOR
+    version = index[len(prefix) :]
+    if not index.startswith(prefix) or not version.isdigit():
+        return None
+    return int(version)
+
+
+def get_versions(client, alias: str) -> dict[str, list[str]]:
+    """Returns the versions of the alias from oldest to newest with the aliases of each."""
+    response = client.indices.get_alias(
+        index=alias + VERSION_SEPARATOR + "*", expand_wildcards="open,closed"
+    )
+    versions = {
+        index: list(value["aliases"])
+        for index, value in response.items()
+        if get_version(alias, index) is not None
+    }
+    return dict(sorted(versions.items(), key=lambda item: get_version(alias, item[0])))
+
+
+def get_live_indices(client, alias: str) -> list[str]:
+    """Returns the versions the alias points to."""
+    return [
+        index
+        for index, aliases in get_versions(client, alias).items()
+        if alias in aliases
+    ]
+
+
+def is_versioned(client, alias: str) -> bool:
+    return len(get_live_indices(client, alias)) > 0
+
+
+def create_version(
+    client, alias: str, mapping: dict, merge_mapping: bool = False
+) -> str:
+    """
+    Creates the next version of the alias with the mapping and the bulk load settings and returns its name. The
+    mapping may contain the settings of the index, as written by generate-mapping.
+    """
+    mapping, settings = partitioning.split_settings(mapping)
+    versions = get_versions(client, alias)
+    version = get_version(alias, list(versions)[-1]) + 1 if versions else 1
+    index = get_version_index(alias, version)
+
+    if merge_mapping is True and client.indices.exists(index=alias):
+        existing_mapping = client.indices.get_mapping(index=alias)
+        # keyed by the live version if alias is an alias
+        existing_mapping_dict = next(iter(existing_mapping.values()))["mappings"]
+        mapping = {
+            **mapping,
+            "properties": merge(mapping, existing_mapping_dict)["properties"],
+        }
+
+    client.indices.create(
+        index=index,
+        settings={**settings, **BULK_LOAD_SETTINGS},
+        mappings=mapping,
+    )
+    return index
+
+
+def reindex_live(client, alias: str, index: str) -> dict:
+    """
+    Copies the documents of the live index into the new version with ElasticSearch's _reindex, without sending them
+    through the pipeline. Returns the reindex response, None if there is nothing to copy.
+    """
+    if not client.indices.exists(index=alias):
+        return None
+    # the documents are routed like the new version, which may be partitioned differently
+    script = None
+    dest = {"index": index, "routing": "discard"}
+    if (
+        partitioning.get_index_partitioning(client, index)
+        == partitioning.PARTITIONING_ROUTING
+    ):
+        script = {"source": "ctx._routing = ctx._source.corpus_id", "lang": "painless"}
+        dest = {"index": index}
+    return client.options(request_timeout=REINDEX_TIMEOUT_SECONDS).reindex(
+        source={"index": alias},
+        dest=dest,
+        script=script,
+        slices="auto",
+        wait_for_completion=True,
+    )
+
+
+def publish_version(
+    client, alias: str, index: str, keep_versions: int = KEEP_VERSIONS
+) -> list[str]:
+    """
+    Restores the search settings of the loaded version and moves the alias to it in a single request. An index
+    from before versioning, named like the alias, is cloned into version 0 and replaced by the alias. Returns the
+    old versions that were deleted.
+    """
+    live = get_live_indices(client, alias)
+    # the replicas of the live version, the cluster default for the first one
+    replicas = None
+    if len(live) > 0:
+        settings = client.indices.get_settings(
+            index=live[-1], name="index.number_of_replicas"
+        )
+        replicas = settings[live[-1]]["settings"]["index"]["number_of_replicas"]
+    client.indices.put_settings(
+        index=index,
+        settings={"refresh_interval": None, "number_of_replicas": replicas},
+    )
+    client.indices.refresh(index=index)
+
+    actions = [{"remove": {"index": live_index, "alias": alias}} for live_index in live]
+    if len(live) == 0 and client.indices.exists(index=alias):
+        legacy_index = get_version_index(alias, 0)
+        client.indices.put_settings(index=alias, settings={"index.blocks.write": True})
+        client.indices.clone(index=alias, target=legacy_index)
+        client.indices.put_settings(
+            index=legacy_index, settings={"index.blocks.write": None}
+        )
+        actions.append({"remove_index": {"index": alias}})
+    actions.append({"add": {"index": index, "alias": alias}})
+    client.indices.update_aliases(actions=actions)
+
+    return delete_old_versions(client, alias, keep_versions)
+
+
+def delete_old_versions(
+    client, alias: str, keep_versions: int = KEEP_VERSIONS
+) -> list[str]:
+    """Deletes all but the newest keep_versions versions, never the live one. Returns the deleted versions."""
+    versions = get_versions(client, alias)
+    old_versions = [
+        index
+        for index, aliases in list(versions.items())[: -max(keep_versions, 1)]
+        if alias not in aliases
+    ]
+    if len(old_versions) > 0:
+        client.indices.delete(index=",".join(old_versions))
+    return old_versions
+
+
+def rollback(client, alias: str, version: int = None) -> str:
+    """Points the alias to the version, by default the one before the live version. Returns the new live version."""
+    versions = get_versions(client, alias)
+    live = get_live_indices(client, alias)
+    if len(live) == 0:
+        raise ValueError(f"{alias} is not an alias of versioned indices")
+
+    if version is None:
+        live_version = max(get_version(alias, index) for index in live)
+        previous = [
+            index for index in versions if get_version(alias, index) < live_version
+        ]
+        if len(previous) == 0:
+            raise ValueError(f"There is no version of {alias} before {live[-1]}")
+        target = previous[-1]
+    else:
+        target = get_version_index(alias, version)
+        if target not in versions:
+            raise ValueError(f"{target} does not exist")
+
+    actions = [{"remove": {"index": index, "alias": alias}} for index in live]
+    actions.append({"add": {"index": target, "alias": alias}})
+    client.indices.update_aliases(actions=actions)
+    return target
+
+
+class NewVersion:
+    """
+    Loads a new version of the index. Entering creates the version and returns its name, optionally with the
+    documents of the live version already copied into it. Leaving publishes it, or deletes it if loading failed.
+    """
+
+    def __init__(
+        self,
+        client,
+        alias: str,
+        mapping: dict,
+        merge_mapping: bool = False,
+        reindex: bool = False,
+        keep_versions: int = KEEP_VERSIONS,
+    ):
+        self.client = client
+        self.alias = alias
+        self.mapping = mapping
+        self.merge_mapping = merge_mapping
+        self.reindex = reindex
+        self.keep_versions = keep_versions
+        self.index = None
+
+    def __enter__(self) -> str:
+        self.index = create_version(
+            self.client, self.alias, self.mapping, self.merge_mapping
+        )
+        tqdm.write(f"Loading {self.index}")
+        if self.reindex:
+            try:
+                response = reindex_live(self.client, self.alias, self.index)
+            except BaseException:
+                self._delete()
+                raise
+            if response is not None:
+                tqdm.write(f"Copied {response['total']} documents of {self.alias}")
+                for failure in response["failures"]:
+                    tqdm.write(
+                        f"Document {failure.get('id')} was not copied: {failure}"
+                    )
+        return self.index
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self._delete()
+            return False
+        deleted = publish_version(
+            self.client, self.alias, self.index, self.keep_versions
+        )
+        tqdm.write(f"{self.alias} now points to {self.index}")
+        if len(deleted) > 0:
+            tqdm.write(f"Deleted old versions {', '.join(deleted)}")
+        return False
+
+    def _delete(self):
+        self.client.options(ignore_status=404).indices.delete(index=self.index)
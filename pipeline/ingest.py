@@ -2,10 +2,14 @@
 This file is the main entry point for the program.
 """
 
+import contextlib
 import hashlib
 import json
 import os
+import queue
 import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Type, List
 
 from tqdm import tqdm
@@ -15,19 +19,50 @@ import music21
 from typer_config.decorators import use_yaml_config
 
 import generate_mapping
+import index_versions
+import isolation
+import partitioning
+from concurrency import AdaptiveController, run_adaptive
+import melodic_index
+import metrics
+import near_duplicates
 import preprocess
 import processors.musicxml_processor
 import processors.audio_processors
+from processors import pcm_cache, streaming
 from helpers import (
     check_xml_extension_allowed,
     check_audio_extension_allowed,
-    check_file_length,
     filter_files,
+    get_blob_file,
+    get_file_type,
+    merge,
+    open_ndjson,
+    split_compression,
+)
+from config import (
+    audio_processors,
+    audio_profiles,
+    default_audio_profile,
+    get_audio_processors,
+    music_xml_processors,
 )
-from config import music_xml_processors, audio_processors
 import upload
 import corpus
+import watch as watch_module
 from processors.metadata_processors import CSVMetadataProcessor
+from processors.musicxml_reader import UnsupportedMusicXML, read_musicxml
+from output import (
+    ResultsWriter,
+    ShardedResultsWriter,
+    count_records,
+    get_manifest_file,
+    get_shard_files,
+    is_manifest,
+    read_manifest,
+    remove_results,
+    write_manifest,
+)
 
 app = typer.Typer()
 app.registered_commands = (
@@ -35,6 +70,8 @@ app.registered_commands = (
     + corpus.app.registered_commands
     + preprocess.app.registered_commands
     + generate_mapping.app.registered_commands
+    + melodic_index.app.registered_commands
+    + near_duplicates.app.registered_commands
 )
 
 
@@ -47,13 +84,21 @@ def process(
     corpus_id: Annotated[
         str, typer.Option(help="Id of the corpus which the file belongs to.")
     ],
-    out_file: str = None,
+    out_file: Annotated[
+        str,
+        typer.Option(
+            help="Defaults to results.json in out_dir. Use a .json.zst or .json.gz extension to compress it"
+        ),
+    ] = None,
     out_dir: str = None,
     in_dir: Annotated[
         str, typer.Option(help="Path to the directory to process")
     ] = None,
     dump: Annotated[
-        str, typer.Option(help="Path to the elasticsearch dump file to process")
+        str,
+        typer.Option(
+            help="Path to the elasticsearch dump file to process, optionally compressed with .zst or .gz"
+        ),
     ] = None,
     include_original: Annotated[
         bool,
@@ -74,19 +119,201 @@ def process(
             "'all' to overwrite them all"
         ),
     ] = None,
+    metrics_file: Annotated[
+        str,
+        typer.Option(help="Periodically write OpenMetrics metrics of the run here"),
+    ] = None,
+    metrics_port: Annotated[
+        int,
+        typer.Option(help="Serve OpenMetrics metrics of the run on this local port"),
+    ] = None,
+    split_blobs: Annotated[
+        bool,
+        typer.Option(
+            help="Write the original files and raw audio arrays (blob_fields in config.py) to a separate "
+            "<out_file>.blobs.json, linked to the results by file_hash_sha256"
+        ),
+    ] = False,
+    shards: Annotated[
+        int,
+        typer.Option(
+            help="Split the results by file hash into this many results-0000i-of-0000N.jsonl files, listed in "
+            "results.manifest.json. A manifest passed as --dump is always processed shard by shard in parallel."
+        ),
+    ] = None,
+    timeout: Annotated[
+        float,
+        typer.Option(
+            help="Seconds after which processing a single file is stopped and the file is dead-lettered"
+        ),
+    ] = isolation.FILE_TIMEOUT_SECONDS,
+    memory_limit: Annotated[
+        int,
+        typer.Option(
+            help="Megabytes of memory a single file may use before it is stopped and dead-lettered"
+        ),
+    ] = None,
+    dead_letter_file: Annotated[
+        str,
+        typer.Option(
+            help="Where files that failed are written, defaults to results.dead_letter.jsonl next to the out "
+            "file. Retry them with `retry-failed`"
+        ),
+    ] = None,
+    min_workers: Annotated[
+        int,
+        typer.Option(
+            help="Number of files processed at the same time when memory or CPU are under pressure"
+        ),
+    ] = 1,
+    max_workers: Annotated[
+        int,
+        typer.Option(
+            help="Most files processed at the same time. Workers are added while there is free memory and CPU"
+        ),
+    ] = os.cpu_count(),
+    profile: Annotated[
+        str,
+        typer.Option(
+            help="Quality profile of the audio processors, 'accurate' or 'fast' (see audio_profiles in "
+            "config.py). Results of other profiles than accurate get the profile in their algorithm name"
+        ),
+    ] = default_audio_profile,
+    pcm_cache_dir: Annotated[
+        str,
+        typer.Option(
+            help="Cache decoded audio here as memory-mapped arrays, so reruns on the same audio skip decoding"
+        ),
+    ] = None,
+    pcm_cache_size: Annotated[
+        float,
+        typer.Option(
+            help="Gigabytes the PCM cache may use, the least recently used audio is removed above it"
+        ),
+    ] = pcm_cache.CACHE_MAX_GB,
+    watch: Annotated[
+        bool,
+        typer.Option(
+            help="Keep running and process files added to or changed in in_dir, and remove the results of "
+            "deleted files. A <out_file>.watch.json manifest remembers which files were processed"
+        ),
+    ] = False,
+    watch_interval: Annotated[
+        float, typer.Option(help="Seconds between the scans of in_dir in watch mode")
+    ] = watch_module.WATCH_INTERVAL_SECONDS,
+    index: Annotated[
+        str,
+        typer.Option(
+            help="In watch mode, also index new results into and delete removed ones from this index"
+        ),
+    ] = None,
+    blob_index: Annotated[
+        str,
+        typer.Option(help="Blob index of --index, see `upload --blob-index`"),
+    ] = None,
 ):
     """Processes MusicXMLs and outputs the results in JSON."""
     if in_dir is None and dump is None:
         raise typer.BadParameter("Must specify either in_dir or dump")
     if in_dir is not None and dump is not None:
         raise typer.BadParameter("Cannot specify both in_dir and dump")
-    
+    if shards is not None and shards < 1:
+        raise typer.BadParameter("Number of shards must be at least 1")
+    check_workers(min_workers, max_workers)
+    check_profile(profile)
+    configure_pcm_cache(pcm_cache_dir, pcm_cache_size)
+    if watch:
+        if in_dir is None:
+            raise typer.BadParameter("Watch mode needs in_dir")
+        if shards is not None or print_output:
+            raise typer.BadParameter(
+                "Watch mode can't be combined with --shards or --print-output"
+            )
+    elif index is not None or blob_index is not None:
+        raise typer.BadParameter("--index and --blob-index only apply to watch mode")
+
+    metrics.registry.start(metrics_file, metrics_port)
+    try:
+        if watch:
+            if out_file is None:
+                out_file = os.path.join(out_dir or in_dir, "results.json")
+            watch_directory(
+                in_dir,
+                out_file,
+                corpus_id,
+                include_original,
+                csv_path,
+                split_blobs,
+                watch_interval,
+                index,
+                blob_index,
+                timeout,
+                memory_limit,
+                dead_letter_file,
+                min_workers,
+                max_workers,
+                profile,
+            )
+            return
+        _process(
+            corpus_id,
+            out_file,
+            out_dir,
+            in_dir,
+            dump,
+            include_original,
+            print_output,
+            csv_path,
+            overwrite_features,
+            split_blobs,
+            shards,
+            timeout,
+            memory_limit,
+            dead_letter_file,
+            min_workers,
+            max_workers,
+            profile,
+        )
+    finally:
+        metrics.registry.flush()
+
+
+def _process(
+    corpus_id: str,
+    out_file: str,
+    out_dir: str,
+    in_dir: str,
+    dump: str,
+    include_original: bool,
+    print_output: bool,
+    csv_path: str,
+    overwrite_features: list,
+    split_blobs: bool,
+    shards: int,
+    timeout: float = isolation.FILE_TIMEOUT_SECONDS,
+    memory_limit: int = None,
+    dead_letter_file: str = None,
+    min_workers: int = 1,
+    max_workers: int = 1,
+    profile: str = default_audio_profile,
+):
     if dump is not None:
         if out_dir is None:
             out_dir = os.path.dirname(dump)
         if out_file is None:
             out_file = os.path.join(out_dir, "results.json")
-        process_dump(dump, out_file, corpus_id, include_original, print_output, csv_path, overwrite_features)
+        if is_manifest(dump):
+            process_dump_shards(
+                dump,
+                out_file,
+                corpus_id,
+                include_original,
+                csv_path,
+                overwrite_features,
+                split_blobs,
+            )
+        else:
+            process_dump(dump, out_file, corpus_id, include_original, print_output, csv_path, overwrite_features, split_blobs, shards)
         return
     
     if out_dir is None:
@@ -95,42 +322,742 @@ def process(
         out_file = os.path.join(out_dir, "results.json")
 
     # remove old results.json
-    existing_out_file = out_file
-    if os.path.exists(out_file):
-        # if we overwrite all, just delete the file
-        if "all" in overwrite_features:
-            os.remove(out_file)
-        else:
-            existing_out_file = out_file + ".backup.json"
-            with open(out_file, "r") as file1, open(existing_out_file, "w") as file2:
-                file2.write(file1.read())
-            os.remove(out_file)
+    writer, existing_json = open_output(
+        out_file, shards, split_blobs, overwrite_features
+    )
+
+    if dead_letter_file is None:
+        dead_letter_file = isolation.get_dead_letter_file(out_file)
+    # everything needed to retry the failed files into the same output
+    retry_options = {
+        "corpus_id": corpus_id,
+        "out_file": os.path.abspath(out_file),
+        "include_original": include_original,
+        "csv_path": os.path.abspath(csv_path) if csv_path is not None else None,
+        "split_blobs": split_blobs,
+        "shards": shards,
+        "profile": profile,
+    }
 
     # process all files in the directory
     files = sorted(os.listdir(in_dir))
     filtered_files = filter_files(files)
 
-    with tqdm(total=len(filtered_files)) as pbar:
-        existing_json = None
-        existing_json = read_existing_output_file(existing_out_file)
-        for file in filtered_files:
-            in_file = os.path.join(in_dir, file)
-            results = process_file(
-                in_file,
+    dead_letters = isolation.DeadLetterWriter(dead_letter_file, retry_options)
+    with tqdm(total=len(filtered_files)) as pbar, writer, dead_letters:
+        for in_file, results, failure in process_files_isolated(
+            [os.path.join(in_dir, file) for file in filtered_files],
+            (
                 print_output,
                 include_original,
                 corpus_id,
                 existing_json,
                 csv_path,
                 overwrite_features,
+                profile,
+            ),
+            timeout,
+            memory_limit,
+            min_workers,
+            max_workers,
+        ):
+            pbar.update(1)
+            if failure is not None:
+                dead_letters.write(in_file, failure)
+            elif print_output is True:
+                print(results)
+            else:
+                writer.write(results)
+
+    if shards is not None:
+        write_manifest(
+            get_manifest_file(out_file), get_shard_files(out_file, shards), writer.records
+        )
+
+    if dead_letters.failures > 0:
+        print(
+            f"{dead_letters.failures} files failed, see {dead_letter_file}. Retry them with "
+            f"`python ingest.py retry-failed {dead_letter_file}`"
+        )
+
+
+def watch_directory(
+    in_dir: str,
+    out_file: str,
+    corpus_id: str,
+    include_original: bool,
+    csv_path: str,
+    split_blobs: bool,
+    interval: float,
+    index: str = None,
+    blob_index: str = None,
+    timeout: float = isolation.FILE_TIMEOUT_SECONDS,
+    memory_limit: int = None,
+    dead_letter_file: str = None,
+    min_workers: int = 1,
+    max_workers: int = 1,
+    profile: str = default_audio_profile,
+):
+    """
+    Scans in_dir every interval seconds until interrupted. New and changed files are processed and appended to
+    out_file, the results of deleted and changed files are removed from it. With index set, the same changes are
+    sent to the index.
+    """
+    manifest = watch_module.WatchManifest(
+        watch_module.get_watch_manifest_file(out_file), in_dir
+    )
+    # files whose results are already in the output aren't processed again, e.g. when starting after `process`
+    existing_hashes = set(read_existing_output_file(out_file) or {})
+    if dead_letter_file is None:
+        dead_letter_file = isolation.get_dead_letter_file(out_file)
+    dead_letters = isolation.DeadLetterWriter(
+        dead_letter_file,
+        {
+            "corpus_id": corpus_id,
+            "out_file": os.path.abspath(out_file),
+            "include_original": include_original,
+            "csv_path": os.path.abspath(csv_path) if csv_path is not None else None,
+            "split_blobs": split_blobs,
+            "shards": None,
+            "profile": profile,
+        },
+        # failures before a restart are only in the dead letters, the manifest doesn't retry them
+        append=True,
+    )
+    # file types whose mapping was put into the index
+    mapped_types = set()
+    # results can be deleted before the first file is processed, they are routed like the existing index.
+    # prepare_index sets the partitioning of a new index
+    index_partitioning = partitioning.PARTITIONING_NONE
+    if index is not None:
+        index_partitioning = (
+            partitioning.get_index_partitioning(upload.client, index)
+            or partitioning.PARTITIONING_NONE
+        )
+
+    print(f"Watching {in_dir} every {interval} seconds, stop with Ctrl+C")
+    try:
+        with dead_letters:
+            while True:
+                ready, deleted = manifest.scan()
+                old_hashes = {manifest.remove(name) for name in deleted}
+                to_process = []
+                for name, signature, file_hash in ready:
+                    if manifest.get_hash(name) is None and file_hash in existing_hashes:
+                        # a copy of a file that is already processed
+                        manifest.add(name, signature, file_hash)
+                        continue
+                    old_hashes.add(manifest.get_hash(name))
+                    to_process.append((name, signature, file_hash))
+
+                documents = {}
+                failures = 0
+                signatures = {
+                    name: (signature, file_hash)
+                    for name, signature, file_hash in to_process
+                }
+                for in_file, results, failure in process_files_isolated(
+                    [os.path.join(in_dir, name) for name, _, _ in to_process],
+                    (False, include_original, corpus_id, None, csv_path, None, profile),
+                    timeout,
+                    memory_limit,
+                    min_workers,
+                    max_workers,
+                ):
+                    name = os.path.basename(in_file)
+                    signature, file_hash = signatures[name]
+                    manifest.add(name, signature, file_hash, failed=failure is not None)
+                    if failure is not None:
+                        dead_letters.write(in_file, failure)
+                        failures += 1
+                    else:
+                        document = json.loads(results)
+                        documents[document["file_hash_sha256"]] = document
+
+                # results of deleted and changed files, unless another file has the same content
+                deleted_hashes = old_hashes - manifest.hashes() - {None}
+                # files processed again replace their previous results
+                replaced_hashes = deleted_hashes | (existing_hashes & set(documents))
+                if len(replaced_hashes) > 0:
+                    remove_results(out_file, replaced_hashes)
+                if len(documents) > 0:
+                    with ResultsWriter(out_file, split_blobs) as writer:
+                        for document in documents.values():
+                            writer.write(json.dumps(document))
+                existing_hashes = (existing_hashes - deleted_hashes) | set(documents)
+                if index is not None:
+                    for file_type in {get_file_type(name) for name, _, _ in to_process}:
+                        if file_type not in mapped_types:
+                            index_partitioning = upload.prepare_index(
+                                index,
+                                generate_mapping.build_mapping(file_type, profile),
+                                blob_index=blob_index,
+                            )
+                            mapped_types.add(file_type)
+                    upload.bulk_delete(
+                        deleted_hashes,
+                        index,
+                        blob_index,
+                        index_partitioning,
+                        corpus_id,
+                    )
+                    upload.bulk_index(
+                        documents.values(),
+                        index,
+                        blob_index=blob_index,
+                        index_partitioning=index_partitioning,
+                    )
+
+                manifest.save()
+                if len(to_process) > 0 or len(deleted_hashes) > 0:
+                    tqdm.write(
+                        f"[watch] {len(to_process) - failures} files processed, {failures} failed, "
+                        f"{len(deleted_hashes)} results removed"
+                    )
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        manifest.save()
+        print("Stopped watching")
+
+
+def check_workers(min_workers: int, max_workers: int):
+    if min_workers < 1:
+        raise typer.BadParameter("Minimum number of workers must be at least 1")
+    if max_workers < min_workers:
+        raise typer.BadParameter(
+            "Maximum number of workers must be at least the minimum number of workers"
+        )
+
+
+def configure_pcm_cache(cache_dir: str, size: float):
+    if size <= 0:
+        raise typer.BadParameter("Size of the PCM cache must be positive")
+    pcm_cache.configure(cache_dir, size)
+
+
+def check_profile(profile: str):
+    if profile not in audio_profiles:
+        raise typer.BadParameter(
+            f"Unknown profile {profile}, must be one of {', '.join(audio_profiles)}"
+        )
+
+
+def process_files_isolated(
+    in_files: list[str],
+    process_args: tuple,
+    timeout: float,
+    memory_limit: int,
+    min_workers: int,
+    max_workers: int,
+):
+    """
+    Processes the files with process_file(in_file, *process_args) in isolated workers, as many at once as the
+    adaptive controller allows. Yields (in_file, results, failure) in the order the files finish.
+    """
+    controller = AdaptiveController(min_workers, max_workers)
+    # long recordings of the workers share the cores
+    streaming.configure(max_workers)
+
+    def run(in_file: str):
+        return isolation.run_isolated(
+            process_file, (in_file, *process_args), timeout, memory_limit
+        )
+
+    for in_file, future in run_adaptive(run, in_files, controller):
+        file_type = get_file_type(in_file)
+        try:
+            results = future.result()
+        except isolation.FileFailure as failure:
+            metrics.file_failures.inc(file_type=file_type)
+            tqdm.write(f"{in_file} failed, {failure}")
+            yield in_file, None, failure
+            continue
+        metrics.files_processed.inc(file_type=file_type)
+        metrics.last_progress.set(time.time())
+        yield in_file, results, None
+
+
+@app.command()
+@use_yaml_config()
+def retry_failed(
+    dead_letter_file: Annotated[
+        str, typer.Argument(help="Dead-letter file written by `process`")
+    ],
+    timeout: Annotated[
+        float,
+        typer.Option(help="Seconds after which processing a single file is stopped"),
+    ] = isolation.FILE_TIMEOUT_SECONDS,
+    memory_limit: Annotated[
+        int,
+        typer.Option(help="Megabytes of memory a single file may use"),
+    ] = None,
+    out_file: Annotated[
+        str,
+        typer.Option(
+            help="Append the results here instead of the out file of the failed run"
+        ),
+    ] = None,
+    min_workers: Annotated[
+        int,
+        typer.Option(
+            help="Number of files processed at the same time when memory or CPU are under pressure"
+        ),
+    ] = 1,
+    max_workers: Annotated[
+        int,
+        typer.Option(
+            help="Most files processed at the same time. Workers are added while there is free memory and CPU"
+        ),
+    ] = os.cpu_count(),
+    pcm_cache_dir: Annotated[
+        str,
+        typer.Option(
+            help="Cache decoded audio here as memory-mapped arrays, so reruns on the same audio skip decoding"
+        ),
+    ] = None,
+    pcm_cache_size: Annotated[
+        float,
+        typer.Option(
+            help="Gigabytes the PCM cache may use, the least recently used audio is removed above it"
+        ),
+    ] = pcm_cache.CACHE_MAX_GB,
+):
+    """
+    Processes the files of a dead-letter file again and appends the results to the output of the run they failed
+    in. Files that fail again stay in the dead-letter file.
+    """
+    check_workers(min_workers, max_workers)
+    configure_pcm_cache(pcm_cache_dir, pcm_cache_size)
+    records = isolation.read_dead_letter(dead_letter_file)
+    groups = {}
+    for record in records:
+        if out_file is not None:
+            record["options"]["out_file"] = os.path.abspath(out_file)
+        if record["options"]["out_file"] is None:
+            raise typer.BadParameter(
+                f"{record['file']} failed in a run without an out file, specify --out-file"
+            )
+        groups.setdefault(json.dumps(record["options"], sort_keys=True), []).append(
+            record
+        )
+
+    tmp_file = dead_letter_file + ".tmp"
+    with isolation.DeadLetterWriter(tmp_file) as dead_letters:
+        for group in groups.values():
+            retry_files(
+                group,
+                group[0]["options"],
+                timeout,
+                memory_limit,
+                min_workers,
+                max_workers,
+                dead_letters,
             )
+    os.replace(tmp_file, dead_letter_file)
+    print(
+        f"{len(records) - dead_letters.failures} files processed, {dead_letters.failures} still failing"
+    )
+
+
+def retry_files(
+    records: list[dict],
+    options: dict,
+    timeout: float,
+    memory_limit: int,
+    min_workers: int,
+    max_workers: int,
+    dead_letters: isolation.DeadLetterWriter,
+):
+    out_file = options["out_file"]
+    shards = options["shards"]
+    if shards is None:
+        writer = ResultsWriter(out_file, options["split_blobs"])
+    else:
+        writer = ShardedResultsWriter(out_file, shards, options["split_blobs"])
 
+    attempts = {record["file"]: record["attempts"] for record in records}
+    with writer, tqdm(total=len(records)) as pbar:
+        for in_file, results, failure in process_files_isolated(
+            list(attempts),
+            (
+                False,
+                options["include_original"],
+                options["corpus_id"],
+                None,
+                options["csv_path"],
+                None,
+                options.get("profile", default_audio_profile),
+            ),
+            timeout,
+            memory_limit,
+            min_workers,
+            max_workers,
+        ):
             pbar.update(1)
-            if print_output is True:
-                print(results)
+            if failure is not None:
+                dead_letters.write(in_file, failure, attempts[in_file] + 1, options)
             else:
-                with open(out_file, "a", encoding="utf-8") as f:
-                    f.write(results + "\n")
+                writer.write(results)
+
+    if shards is not None:
+        # the shards were appended to, so their records are counted again
+        shard_files = get_shard_files(out_file, shards)
+        paths = shard_files + [get_blob_file(x) for x in shard_files]
+        write_manifest(
+            get_manifest_file(out_file),
+            shard_files,
+            {x: count_records(x) for x in paths if os.path.exists(x)},
+        )
+
+
+# processed documents waiting for the indexer of `ingest`, processing pauses while the queue is full
+INGEST_QUEUE_SIZE = 1000
+
+
+@app.command()
+@use_yaml_config()
+def ingest(
+    index: str,
+    corpus_id: Annotated[
+        str, typer.Option(help="Id of the corpus which the file belongs to.")
+    ],
+    in_dir: Annotated[str, typer.Option(help="Path to the directory to process")],
+    processor_type: Annotated[
+        str,
+        typer.Option(
+            help="Type of the mapping, 'audio' or 'musicxml'. Inferred from the files if not specified"
+        ),
+    ] = None,
+    out_file: Annotated[
+        str,
+        typer.Option(
+            help="Also write the results to this file, as `process` would. Use a .json.zst or .json.gz "
+            "extension to compress it"
+        ),
+    ] = None,
+    include_original: Annotated[
+        bool,
+        typer.Option(
+            help="Whether to include the original musicXML file in the documents"
+        ),
+    ] = True,
+    csv_path: Annotated[
+        str,
+        typer.Option(help="Path to the CSV file containing the metadata for the files"),
+    ] = None,
+    delete_index: Annotated[
+        bool, typer.Option(help="Whether to delete the index before indexing.")
+    ] = False,
+    new_version: Annotated[
+        bool,
+        typer.Option(
+            help="Index into a new version of the index and point the index name to it at the end, see "
+            "`upload --new-version`"
+        ),
+    ] = False,
+    keep_versions: Annotated[
+        int,
+        typer.Option(
+            help="Number of versions of the index kept for `rollback`, including the live one"
+        ),
+    ] = index_versions.KEEP_VERSIONS,
+    merge_mapping: Annotated[
+        bool, typer.Option(help="Whether to merge the mapping with the existing one.")
+    ] = False,
+    chunk_size: Annotated[
+        int, typer.Option(help="Number of documents sent in a single bulk request.")
+    ] = upload.BULK_CHUNK_SIZE,
+    queue_size: Annotated[
+        int,
+        typer.Option(
+            help="Number of processed documents waiting to be indexed before processing pauses"
+        ),
+    ] = INGEST_QUEUE_SIZE,
+    blob_index: Annotated[
+        str,
+        typer.Option(
+            help="Index for the original files and raw audio arrays, e.g. 'songs-blobs'. They are split off the "
+            "documents before indexing."
+        ),
+    ] = None,
+    metrics_file: Annotated[
+        str,
+        typer.Option(help="Periodically write OpenMetrics metrics of the run here"),
+    ] = None,
+    metrics_port: Annotated[
+        int,
+        typer.Option(help="Serve OpenMetrics metrics of the run on this local port"),
+    ] = None,
+    timeout: Annotated[
+        float,
+        typer.Option(
+            help="Seconds after which processing a single file is stopped and the file is dead-lettered"
+        ),
+    ] = isolation.FILE_TIMEOUT_SECONDS,
+    memory_limit: Annotated[
+        int,
+        typer.Option(
+            help="Megabytes of memory a single file may use before it is stopped and dead-lettered"
+        ),
+    ] = None,
+    dead_letter_file: Annotated[
+        str,
+        typer.Option(
+            help="Where files that failed are written, defaults to results.dead_letter.jsonl next to the out "
+            "file or <index>.dead_letter.jsonl. Retry them with `retry-failed`"
+        ),
+    ] = None,
+    min_workers: Annotated[
+        int,
+        typer.Option(
+            help="Number of files processed at the same time when memory or CPU are under pressure"
+        ),
+    ] = 1,
+    max_workers: Annotated[
+        int,
+        typer.Option(
+            help="Most files processed at the same time. Workers are added while there is free memory and CPU"
+        ),
+    ] = os.cpu_count(),
+    profile: Annotated[
+        str,
+        typer.Option(
+            help="Quality profile of the audio processors, 'accurate' or 'fast' (see audio_profiles in "
+            "config.py). Results of other profiles than accurate get the profile in their algorithm name"
+        ),
+    ] = default_audio_profile,
+    pcm_cache_dir: Annotated[
+        str,
+        typer.Option(
+            help="Cache decoded audio here as memory-mapped arrays, so reruns on the same audio skip decoding"
+        ),
+    ] = None,
+    pcm_cache_size: Annotated[
+        float,
+        typer.Option(
+            help="Gigabytes the PCM cache may use, the least recently used audio is removed above it"
+        ),
+    ] = pcm_cache.CACHE_MAX_GB,
+):
+    """
+    Processes the files and indexes them into ElasticSearch in one run. Documents are indexed while the next
+    files are processed, so the run takes about as long as the slower of the two.
+    """
+    if queue_size < 1:
+        raise typer.BadParameter("Queue size must be at least 1")
+    if new_version and delete_index:
+        raise typer.BadParameter("Cannot specify both new_version and delete_index")
+    check_workers(min_workers, max_workers)
+    check_profile(profile)
+    configure_pcm_cache(pcm_cache_dir, pcm_cache_size)
+    if dead_letter_file is None:
+        dead_letter_file = (
+            isolation.get_dead_letter_file(out_file)
+            if out_file is not None
+            else index + isolation.DEAD_LETTER_SUFFIX
+        )
+
+    files = filter_files(sorted(os.listdir(in_dir)))
+    if len(files) == 0:
+        raise typer.BadParameter(f"No files to process in {in_dir}")
+    if processor_type is None:
+        file_types = {get_file_type(file) for file in files}
+        if len(file_types) > 1:
+            raise typer.BadParameter(
+                "Directory contains audio and MusicXML files, specify --processor-type"
+            )
+        processor_type = file_types.pop()
+
+    # the mapping is put before the first document, so nothing is indexed with dynamic mappings
+    mapping = generate_mapping.build_mapping(processor_type, profile)
+    if new_version:
+        # the new version is partitioned like the live one
+        mapping = partitioning.inherit_partitioning(upload.client, index, mapping)
+        index_partitioning = partitioning.get_partitioning(mapping)
+        if index_partitioning == partitioning.PARTITIONING_INDEX:
+            raise typer.BadParameter(
+                "Corpus indices are not versioned, use --new-version with routed indices"
+            )
+        upload.prepare_blob_index(blob_index)
+        target = index_versions.NewVersion(
+            upload.client, index, mapping, merge_mapping, keep_versions=keep_versions
+        )
+    else:
+        index_partitioning = upload.prepare_index(
+            index, mapping, delete_index, merge_mapping, blob_index
+        )
+        target = contextlib.nullcontext(index)
+
+    metrics.registry.start(metrics_file, metrics_port)
+    try:
+        with target as target_index:
+            _ingest(
+                [os.path.join(in_dir, file) for file in files],
+                target_index,
+                corpus_id,
+                include_original,
+                csv_path,
+                out_file,
+                chunk_size,
+                queue_size,
+                blob_index,
+                timeout,
+                memory_limit,
+                dead_letter_file,
+                min_workers,
+                max_workers,
+                profile,
+                index_partitioning,
+            )
+    finally:
+        metrics.registry.flush()
+
+
+def _ingest(
+    in_files: list[str],
+    index: str,
+    corpus_id: str,
+    include_original: bool,
+    csv_path: str,
+    out_file: str,
+    chunk_size: int,
+    queue_size: int,
+    blob_index: str,
+    timeout: float = isolation.FILE_TIMEOUT_SECONDS,
+    memory_limit: int = None,
+    dead_letter_file: str = None,
+    min_workers: int = 1,
+    max_workers: int = 1,
+    profile: str = default_audio_profile,
+    index_partitioning: str = partitioning.PARTITIONING_NONE,
+):
+    document_queue = queue.Queue(maxsize=queue_size)
+    writer = None
+    if out_file is not None:
+        # the results of a previous run are moved to the backup, so they are not written to the file twice
+        backup_output_file(out_file, [])
+        writer = ResultsWriter(out_file, False)
+    dead_letters = isolation.DeadLetterWriter(
+        dead_letter_file,
+        {
+            "corpus_id": corpus_id,
+            "out_file": os.path.abspath(out_file) if out_file is not None else None,
+            "include_original": include_original,
+            "csv_path": os.path.abspath(csv_path) if csv_path is not None else None,
+            "split_blobs": False,
+            "shards": None,
+            "profile": profile,
+        },
+    )
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        indexer = executor.submit(
+            upload.bulk_index,
+            read_queue(document_queue),
+            index,
+            chunk_size,
+            blob_index,
+            index_partitioning,
+        )
+        try:
+            # while the queue is full, no new files are started
+            for in_file, results, failure in tqdm(
+                process_files_isolated(
+                    in_files,
+                    (False, include_original, corpus_id, None, csv_path, None, profile),
+                    timeout,
+                    memory_limit,
+                    min_workers,
+                    max_workers,
+                ),
+                total=len(in_files),
+            ):
+                if failure is not None:
+                    dead_letters.write(in_file, failure)
+                    continue
+                if writer is not None:
+                    writer.write(results)
+                put_document(document_queue, json.loads(results), indexer)
+        finally:
+            if writer is not None:
+                writer.close()
+            dead_letters.close()
+            # tell the indexer to send the rest of the documents and stop
+            if not indexer.done():
+                put_document(document_queue, None, indexer)
+        indexer.result()
+
+
+def put_document(document_queue: queue.Queue, document, indexer: Future):
+    """Puts the document in the queue, waiting while it's full. Raises the error of the indexer if it stopped."""
+    while True:
+        if indexer.done():
+            indexer.result()
+            raise RuntimeError("Indexer stopped before all documents were indexed")
+        try:
+            document_queue.put(document, timeout=1)
+        except queue.Full:
+            continue
+        metrics.ingest_queue_depth.set(document_queue.qsize())
+        return
+
+
+def read_queue(document_queue: queue.Queue):
+    """Yields the documents from the queue until it gets None."""
+    while True:
+        document = document_queue.get()
+        metrics.ingest_queue_depth.set(document_queue.qsize())
+        if document is None:
+            return
+        yield document
+
+
+def open_output(
+    out_file: str, shards: int, split_blobs: bool, overwrite_features: list
+):
+    """
+    Moves the results of the previous run out of the way and opens the writer for the new ones. Returns the
+    writer and the previous results, see read_existing_output_file.
+    """
+    if shards is None:
+        existing_out_file = backup_output_file(out_file, overwrite_features)
+        writer = ResultsWriter(out_file, split_blobs)
+        return writer, read_existing_output_file(existing_out_file)
+
+    # the previous run may have used a different number of shards, so all of them are read
+    existing_json = None
+    manifest_file = get_manifest_file(out_file)
+    if os.path.exists(manifest_file):
+        for shard_file in read_manifest(manifest_file):
+            existing = read_existing_output_file(
+                backup_output_file(shard_file, overwrite_features)
+            )
+            if existing is not None:
+                existing_json = {**(existing_json or {}), **existing}
+    return ShardedResultsWriter(out_file, shards, split_blobs), existing_json
+
+
+def backup_output_file(out_file: str, overwrite_features: list) -> str:
+    """
+    Moves the output file and its blob file out of the way, so they can be merged with the new results.
+    Returns the path of the backup.
+    """
+    path, compression = split_compression(out_file)
+    backup_out_file = path + ".backup.json" + compression
+    existing_out_file = out_file
+    for file, backup_file in [
+        (out_file, backup_out_file),
+        (get_blob_file(out_file), get_blob_file(backup_out_file)),
+    ]:
+        if not os.path.exists(file):
+            continue
+        # if we overwrite all, just delete the file
+        if overwrite_features and "all" in overwrite_features:
+            os.remove(file)
+        else:
+            os.replace(file, backup_file)
+            if file == out_file:
+                existing_out_file = backup_file
+    return existing_out_file
 
 
 def read_existing_output_file(output_file: str):
@@ -139,7 +1066,7 @@ def read_existing_output_file(output_file: str):
     results = {}
     if not os.path.exists(output_file):
         return None
-    with open(output_file, "r", encoding="utf-8") as file:
+    with open_ndjson(output_file) as file:
         for line in file:
             try:
                 row = json.loads(line)
@@ -153,6 +1080,15 @@ def read_existing_output_file(output_file: str):
                     "Invalid JSON on existing output file. Ignoring... Recommended to rename the existing file"
                 )
 
+    # put the fields split off by --split-blobs back
+    blob_file = get_blob_file(output_file)
+    if os.path.exists(blob_file):
+        with open_ndjson(blob_file) as file:
+            for line in file:
+                blob = json.loads(line)
+                if blob["file_hash_sha256"] in results:
+                    merge(blob, results[blob["file_hash_sha256"]])
+
     return results
 
 
@@ -164,6 +1100,7 @@ def process_file(
     existing_json: dict,
     csv_path: str = None,
     overwrite_features=None,
+    profile: str = default_audio_profile,
 ):
     """Processes a single file and writes the results in JSON."""
     if overwrite_features is None:
@@ -177,20 +1114,23 @@ def process_file(
         raise typer.BadParameter(f"File does not exist: {in_file}")
 
     results = {}
+    isolation.set_stage("metadata")
     metadata = process_metadata(in_file, csv_path)
 
     results["corpus_id"] = corpus_id
     results["filename"] = os.path.basename(in_file)
 
     # calculate file hash
+    isolation.set_stage("hash")
     with open(in_file, "rb") as file_to_hash:
         data = file_to_hash.read()
+        metrics.bytes_read.inc(len(data))
         m = hashlib.sha256()
         m.update(data)
         results["file_hash_sha256"] = m.hexdigest()
 
     filtered_musicxml_processors = music_xml_processors
-    filtered_audio_processors = audio_processors
+    filtered_audio_processors = get_audio_processors(profile)
 
     # don't process features that won't be overwritten
     if should_merge_existing:
@@ -211,8 +1151,9 @@ def process_file(
             # filter only if we have a match
             filtered_audio_processors = [
                 proc
-                for proc in audio_processors
-                if (proc(in_file).get_feature_name()) in overwrite_features
+                for proc in filtered_audio_processors
+                if (proc(None, profile=profile).get_feature_name())
+                in overwrite_features
             ]
             filtered_musicxml_processors = [
                 proc
@@ -223,7 +1164,7 @@ def process_file(
     if check_xml_extension_allowed(in_file):
         results.update(process_musicxml(in_file, filtered_musicxml_processors))
     elif check_audio_extension_allowed(in_file):
-        results.update(process_audio(in_file, filtered_audio_processors))
+        results.update(process_audio(in_file, filtered_audio_processors, profile))
     else:
         raise typer.BadParameter(f"File type not supported: {in_file}")
 
@@ -247,23 +1188,24 @@ def process_file(
 
 
 def process_audio(
-    path: str, processor_list: list[Type[processors.audio_processors.AudioProcessor]]
+    path: str,
+    processor_list: list[Type[processors.audio_processors.AudioProcessor]],
+    profile: str = default_audio_profile,
 ) -> dict[str, dict[str, object]]:
     """Processes a single audio file and spits out the results in dictionary form."""
     results = {}
-    if not check_file_length(path):
-        raise typer.BadParameter(
-            f"{path} is too long. Must be less than 10 minutes. Refer to the preprocess "
-            f"command to preprocess the files."
-        )
-
     for processor in processor_list:
-        processor_instance = processor(path)
+        processor_instance = processor(path, profile=profile)
+        isolation.set_stage(processor.__name__)
         if processor_instance.get_feature_name() not in results:
             results[processor_instance.get_feature_name()] = {}
+        with metrics.processor_seconds.time(
+            processor=processor_instance.get_feature_name()
+        ):
+            processor_result = processor_instance.process()
         results[processor_instance.get_feature_name()][
             processor_instance.get_algorithm_name()
-        ] = processor_instance.process()
+        ] = processor_result
 
     return results
 
@@ -272,12 +1214,45 @@ def process_musicxml(
     path: str,
     processor_list: list[Type[processors.musicxml_processor.MusicXMLProcessor]],
 ) -> dict[str, object]:
-    """Processes a single MusicXML file and spits out the results in dictionary form."""
-    music21_song = music21.converter.parse(path)
+    """
+    Processes a single MusicXML file and spits out the results in dictionary form. If all the processors support it,
+    they run on the note events of the streaming reader and the file isn't parsed with music21, unless the reader
+    can't read it.
+    """
+    if processor_list and all(
+        processor.supports_events() for processor in processor_list
+    ):
+        isolation.set_stage("musicxml_read")
+        try:
+            with metrics.processor_seconds.time(processor="musicxml_read"):
+                events = read_musicxml(path)
+        except UnsupportedMusicXML:
+            metrics.musicxml_reads.inc(result="music21")
+        else:
+            metrics.musicxml_reads.inc(result="streamed")
+            return run_musicxml_processors(
+                processor_list, None, lambda p: p.process_events(events)
+            )
+
+    isolation.set_stage("music21_parse")
+    with metrics.processor_seconds.time(processor="music21_parse"):
+        music21_song = music21.converter.parse(path)
+    return run_musicxml_processors(
+        processor_list, music21_song, lambda p: p.process()
+    )
+
+
+def run_musicxml_processors(processor_list, song, process) -> dict[str, object]:
     results = {}
     for processor in processor_list:
-        processor_instance = processor(music21_song)
-        results[processor_instance.get_feature_name()] = processor_instance.process()
+        processor_instance = processor(song)
+        isolation.set_stage(processor.__name__)
+        with metrics.processor_seconds.time(
+            processor=processor_instance.get_feature_name()
+        ):
+            results[processor_instance.get_feature_name()] = process(
+                processor_instance
+            )
 
     return results
 
@@ -302,46 +1277,102 @@ def process_dump(
     print_output: bool,
     csv_path: str = None,
     overwrite_features: list = None,
-):
-    """Processes records from an elasticsearch dump file."""
+    split_blobs: bool = False,
+    shards: int = None,
+) -> dict:
+    """Processes records from an elasticsearch dump file. Returns the number of records written to each file."""
     if overwrite_features is None:
         overwrite_features = []
 
     # remove old results.json
-    existing_out_file = out_file
-    if os.path.exists(out_file):
-        # if we overwrite all, just delete the file
-        if "all" in overwrite_features:
-            os.remove(out_file)
-        else:
-            existing_out_file = out_file + ".backup.json"
-            with open(out_file, "r") as file1, open(existing_out_file, "w") as file2:
-                file2.write(file1.read())
-            os.remove(out_file)
+    writer, existing_json = open_output(
+        out_file, shards, split_blobs, overwrite_features
+    )
 
     # read and process dump file
     dump_records = read_dump_file(dump_file, corpus_id)
     
-    with tqdm(total=len(dump_records)) as pbar:
-        existing_json = read_existing_output_file(existing_out_file)
-        
+    with tqdm(total=len(dump_records), desc=os.path.basename(dump_file)) as pbar, writer:
         for record in dump_records:
-            results = process_dump_record(
-                record,
-                print_output,
-                include_original,
-                corpus_id,
-                existing_json,
-                csv_path,
-                overwrite_features,
-            )
+            try:
+                results = process_dump_record(
+                    record,
+                    print_output,
+                    include_original,
+                    corpus_id,
+                    existing_json,
+                    csv_path,
+                    overwrite_features,
+                )
+            except Exception:
+                metrics.file_failures.inc(file_type="musicxml")
+                raise
+            metrics.files_processed.inc(file_type="musicxml")
+            metrics.last_progress.set(time.time())
 
             pbar.update(1)
             if print_output is True:
                 print(results)
             else:
-                with open(out_file, "a", encoding="utf-8") as f:
-                    f.write(results + "\n")
+                writer.write(results)
+
+    if shards is not None:
+        write_manifest(
+            get_manifest_file(out_file), get_shard_files(out_file, shards), writer.records
+        )
+
+    return writer.records
+
+
+def process_dump_shards(
+    manifest_file: str,
+    out_file: str,
+    corpus_id: str,
+    include_original: bool,
+    csv_path: str = None,
+    overwrite_features: list = None,
+    split_blobs: bool = False,
+):
+    """
+    Processes all the shards of a manifest in parallel. Every shard is written to the output shard with the same
+    number, so the songs stay in the same shards.
+    """
+    shard_files = read_manifest(manifest_file)
+    out_shard_files = get_shard_files(out_file, len(shard_files))
+    records = {}
+    with ProcessPoolExecutor(
+        max_workers=min(len(shard_files), os.cpu_count())
+    ) as executor:
+        futures = [
+            executor.submit(
+                process_dump_shard,
+                shard_file,
+                out_shard_file,
+                corpus_id,
+                include_original,
+                False,
+                csv_path,
+                overwrite_features,
+                split_blobs,
+            )
+            for shard_file, out_shard_file in zip(shard_files, out_shard_files)
+        ]
+        for future in futures:
+            shard_records, snapshot = future.result()
+            records.update(shard_records)
+            metrics.registry.merge(snapshot)
+
+    for out_shard_file in out_shard_files:
+        if not os.path.exists(out_shard_file):
+            open_ndjson(out_shard_file, "a").close()
+    write_manifest(get_manifest_file(out_file), out_shard_files, records)
+
+
+def process_dump_shard(*args) -> tuple[dict, dict]:
+    """Runs process_dump in a worker process and returns its records with the metrics of the shard."""
+    # the worker starts with a copy of the metrics of the parent and may process several shards
+    metrics.registry.reset()
+    return process_dump(*args), metrics.registry.snapshot()
 
 
 def read_dump_file(dump_file: str, corpus_id: str = None) -> list:
@@ -349,12 +1380,26 @@ def read_dump_file(dump_file: str, corpus_id: str = None) -> list:
     if not os.path.exists(dump_file):
         raise typer.BadParameter(f"Dump file does not exist: {dump_file}")
     
+    # results written with --split-blobs have the original files in the blob file
+    blobs = {}
+    if os.path.exists(get_blob_file(dump_file)):
+        with open_ndjson(get_blob_file(dump_file)) as f:
+            for line in f:
+                blob = json.loads(line)
+                blobs[blob["file_hash_sha256"]] = blob
+
     records = []
-    with open(dump_file, "r", encoding="utf-8") as f:
+    with open_ndjson(dump_file) as f:
         for line in f:
             try:
                 record = json.loads(line.strip())
-                if "_source" in record and "original_file" in record["_source"]:
+                if "_source" not in record:
+                    # results of the process command instead of an elasticsearch dump
+                    record = {"_source": record}
+                file_hash = record["_source"].get("file_hash_sha256")
+                if file_hash in blobs:
+                    merge(blobs[file_hash], record["_source"])
+                if "original_file" in record["_source"]:
                     # Filter by corpus_id if provided
                     if corpus_id is not None:
                         record_corpus_id = record["_source"].get("corpus_id")
@@ -389,6 +1434,8 @@ def process_dump_record(
         print(f"No original_file content found for {filename}, skipping...")
         return json.dumps({})
 
+    metrics.bytes_read.inc(len(original_file_content.encode("utf-8")))
+
     # Create temporary file with the original content
     with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False, encoding='utf-8') as temp_file:
         temp_file.write(original_file_content)
@@ -0,0 +1,251 @@
+"""
+Runs the processing of a single file in a separate worker process, so files that hang or exhaust the memory can be
+killed without stopping the whole run. Files that fail are written to a dead-letter file, from which they can be
+retried with the `retry-failed` command.
+"""
+
+import json
+import multiprocessing
+import os
+import signal
+import time
+import traceback
+from datetime import datetime, timezone
+
+import metrics
+
+# default wall-clock limit for processing a single file
+FILE_TIMEOUT_SECONDS = 900
+# how often the parent checks the worker for results, timeouts and memory usage
+POLL_INTERVAL_SECONDS = 0.2
+DEAD_LETTER_SUFFIX = ".dead_letter.jsonl"
+
+# connection to the parent, only set in the worker processes
+_stage_connection = None
+
+
+class FileFailure(Exception):
+    """Processing a file raised an error, timed out, ran out of memory or crashed its worker."""
+
+    def __init__(
+        self,
+        error_type: str,
+        error: str,
+        stage: str,
+        elapsed_seconds: float,
+        error_traceback: str = None,
+    ):
+        super().__init__(f"{error_type} in stage {stage}: {error}")
+        self.error_type = error_type
+        self.error = error
+        self.stage = stage
+        self.elapsed_seconds = elapsed_seconds
+        self.error_traceback = error_traceback
+
+
+def set_stage(stage: str):
+    """Reports the current stage of the worker, so it's known where a killed worker was. No-op outside workers."""
+    if _stage_connection is not None:
+        _stage_connection.send(("stage", stage))
+
+
+def get_rss(pid: int) -> int:
+    """Returns the resident memory of a process in bytes, or None if it can't be read (e.g. not on Linux)."""
+    try:
+        with open(f"/proc/{pid}/statm", "r", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_child_pids(pid: int) -> list[int]:
+    """Returns the child processes of a process (Linux only)."""
+    pids = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children", "r", encoding="utf-8") as f:
+                pids.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return pids
+
+
+def get_tree_rss(pid: int) -> int:
+    """
+    Returns the resident memory of a process and all the processes it started, e.g. the window workers of
+    processors/streaming.py, or None if it can't be read.
+    """
+    rss = get_rss(pid)
+    if rss is None:
+        return None
+    return rss + sum(get_tree_rss(child) or 0 for child in get_child_pids(pid))
+
+
+def kill_worker(process):
+    """Kills the worker together with the processes it started, which are in its process group."""
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            # the worker didn't start its group yet
+            pass
+    if process.is_alive():
+        process.kill()
+
+
+def _worker(connection, func, args):
+    global _stage_connection
+    if hasattr(os, "setsid"):
+        # a new process group, so the processes started by func are killed with the worker
+        os.setsid()
+    _stage_connection = connection
+    # only the metrics of this file are sent back to the parent
+    metrics.registry.reset()
+    try:
+        result = func(*args)
+        connection.send(("result", result, metrics.registry.snapshot()))
+    except BaseException as e:
+        connection.send(
+            (
+                "error",
+                type(e).__name__,
+                str(e),
+                traceback.format_exc(),
+                metrics.registry.snapshot(),
+            )
+        )
+    finally:
+        connection.close()
+
+
+def get_worker_context():
+    """Forked workers don't have to import the processors again and get their arguments without pickling."""
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def run_isolated(
+    func,
+    args: tuple,
+    timeout: float = FILE_TIMEOUT_SECONDS,
+    memory_limit_mb: int = None,
+):
+    """
+    Runs func(*args) in a new worker process and returns its result. The worker and the processes it started are
+    killed if it runs longer than timeout seconds or they use more than memory_limit_mb of resident memory together.
+    Raises FileFailure if func fails.
+    """
+    context = get_worker_context()
+    parent_connection, child_connection = context.Pipe(duplex=False)
+    # not a daemon, so the worker can start its own processes, see processors/streaming.py
+    process = context.Process(target=_worker, args=(child_connection, func, args))
+    start = time.perf_counter()
+    process.start()
+    child_connection.close()
+
+    stage = "start"
+    try:
+        while True:
+            message_ready = parent_connection.poll(POLL_INTERVAL_SECONDS)
+            elapsed = time.perf_counter() - start
+            if message_ready:
+                try:
+                    message = parent_connection.recv()
+                except EOFError:
+                    process.join()
+                    raise FileFailure(
+                        "crash",
+                        f"Worker exited with code {process.exitcode}",
+                        stage,
+                        elapsed,
+                    )
+                if message[0] == "stage":
+                    stage = message[1]
+                    continue
+                metrics.registry.merge(message[-1])
+                if message[0] == "result":
+                    return message[1]
+                _, error_type, error, error_traceback, _ = message
+                kind = "memory" if error_type == "MemoryError" else "error"
+                raise FileFailure(
+                    kind, f"{error_type}: {error}", stage, elapsed, error_traceback
+                )
+
+            if timeout is not None and elapsed > timeout:
+                raise FileFailure(
+                    "timeout", f"Timed out after {timeout} seconds", stage, elapsed
+                )
+            if memory_limit_mb is not None:
+                rss = get_tree_rss(process.pid)
+                if rss is not None and rss > memory_limit_mb * 1024 * 1024:
+                    raise FileFailure(
+                        "memory",
+                        f"Used {rss // (1024 * 1024)} MB, more than the limit of {memory_limit_mb} MB",
+                        stage,
+                        elapsed,
+                    )
+    finally:
+        # also kills the processes left behind by a worker that crashed, before its pid can be reused
+        kill_worker(process)
+        process.join()
+        parent_connection.close()
+
+
+def get_dead_letter_file(out_file: str) -> str:
+    """Returns the default dead-letter file of a results file, e.g. results.json.zst -> results.dead_letter.jsonl"""
+    path = out_file
+    for extension in [".zst", ".gz", ".json", ".jsonl"]:
+        if path.endswith(extension):
+            path = path[: -len(extension)]
+    return path + DEAD_LETTER_SUFFIX
+
+
+class DeadLetterWriter:
+    """
+    Writes the files that failed to the dead-letter file, together with the options of the run, so they can be
+    retried into the same output. Every record is flushed, so the file is complete even if the run is killed.
+    With append, the records of earlier runs are kept.
+    """
+
+    def __init__(self, path: str, options: dict = None, append: bool = False):
+        self.path = path
+        self.options = options
+        self.failures = 0
+        self.file = open(path, "a" if append else "w", encoding="utf-8")
+
+    def write(
+        self,
+        in_file: str,
+        failure: FileFailure,
+        attempts: int = 1,
+        options: dict = None,
+    ):
+        record = {
+            "file": os.path.abspath(in_file),
+            "stage": failure.stage,
+            "error_type": failure.error_type,
+            "error": failure.error,
+            "traceback": failure.error_traceback,
+            "elapsed_seconds": round(failure.elapsed_seconds, 3),
+            "failed_at": datetime.now(timezone.utc).isoformat(),
+            "attempts": attempts,
+            "options": options if options is not None else self.options,
+        }
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        self.failures += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_dead_letter(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip() != ""]
@@ -0,0 +1,319 @@
+"""
+A local suffix array index over the melodies and rhythms of processed corpora. It answers exact and
+transposition-invariant pattern queries without ElasticSearch.
+
+The index is a directory of .npy files which are memory-mapped when searching, so opening it is instant and
+only the pages touched by the binary search are read from disk.
+"""
+
+import json
+import os
+import time
+from typing import Annotated, List
+
+import numpy as np
+import typer
+
+from helpers import read_results
+
+app = typer.Typer()
+
+# separates the documents in the concatenated token sequences, so matches can't span two documents
+SENTINEL = np.iinfo(np.int32).max
+
+# name of the sequence: (field in the results, field with the measure starts)
+SEQUENCES = {
+    "pitches": ("contour", "melodic_contour_string_absolute"),
+    "intervals": ("contour", "melodic_contour_string_relative"),
+    "rhythm": ("rhythm", "rhythm_string"),
+}
+
+# which sequence each query mode searches
+MODES = {
+    "exact": "pitches",
+    "transposed": "intervals",
+    "intervals": "intervals",
+    "rhythm": "rhythm",
+}
+# notes between the position of a match and its first note. The interval at a position leads to the next note, a
+# pitch query searched by its intervals starts at the note before them.
+NOTE_OFFSETS = {"intervals": 1}
+
+
+def build_suffix_array(tokens: np.ndarray) -> np.ndarray:
+    """Builds the suffix array of an integer sequence with prefix doubling."""
+    n = len(tokens)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    _, rank = np.unique(tokens, return_inverse=True)
+    rank = rank.astype(np.int64)
+    k = 1
+    while True:
+        # rank of the suffix k positions later, -1 if it is past the end
+        second = np.full(n, -1, dtype=np.int64)
+        if k < n:
+            second[: n - k] = rank[k:]
+        suffix_array = np.lexsort((second, rank))
+        sorted_rank = rank[suffix_array]
+        sorted_second = second[suffix_array]
+        is_new = np.ones(n, dtype=bool)
+        is_new[1:] = (sorted_rank[1:] != sorted_rank[:-1]) | (
+            sorted_second[1:] != sorted_second[:-1]
+        )
+        rank = np.empty(n, dtype=np.int64)
+        rank[suffix_array] = np.cumsum(is_new) - 1
+        if rank.max() == n - 1 or k >= n:
+            return suffix_array
+        k *= 2
+
+
+class MelodicIndex:
+    """Suffix array index over the token sequences of many documents."""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "index.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        self.documents = info["documents"]
+        self.rhythm_vocabulary = info["rhythm_vocabulary"]
+        self.arrays = {}
+        for name in SEQUENCES:
+            self.arrays[name] = {
+                array: np.load(
+                    os.path.join(index_dir, f"{name}.{array}.npy"), mmap_mode="r"
+                )
+                for array in (
+                    "tokens",
+                    "sa",
+                    "doc_starts",
+                    "measures",
+                    "measure_numbers",
+                    "measure_offsets",
+                )
+            }
+
+    @staticmethod
+    def build(documents, index_dir: str):
+        """Builds the index from an iterable of processed documents and writes it to index_dir."""
+        os.makedirs(index_dir, exist_ok=True)
+        rhythm_vocabulary = {}
+        doc_info = []
+        sequences = {
+            name: {
+                "tokens": [],
+                "doc_starts": [0],
+                "measures": [],
+                "measure_numbers": [],
+                "offsets": [0],
+            }
+            for name in SEQUENCES
+        }
+
+        for document in documents:
+            if "contour" not in document or "rhythm" not in document:
+                continue
+            doc_info.append(
+                {
+                    "filename": document.get("filename"),
+                    "corpus_id": document.get("corpus_id"),
+                    "file_hash_sha256": document.get("file_hash_sha256"),
+                }
+            )
+            for name, (feature, field) in SEQUENCES.items():
+                tokens = document[feature][field].split()
+                if name == "rhythm":
+                    tokens = [
+                        rhythm_vocabulary.setdefault(x, len(rhythm_vocabulary))
+                        for x in tokens
+                    ]
+                else:
+                    tokens = [int(x) for x in tokens]
+                sequence = sequences[name]
+                sequence["tokens"].extend(tokens)
+                sequence["tokens"].append(SENTINEL)
+                sequence["doc_starts"].append(len(sequence["tokens"]))
+                measure_starts = document[feature]["measure_starts"]
+                sequence["measures"].extend(measure_starts)
+                # results processed before the measure numbers were stored count the measures from 1
+                sequence["measure_numbers"].extend(
+                    document[feature].get(
+                        "measure_numbers", range(1, len(measure_starts) + 1)
+                    )
+                )
+                sequence["offsets"].append(len(sequence["measures"]))
+
+        for name, sequence in sequences.items():
+            tokens = np.asarray(sequence["tokens"], dtype=np.int32)
+            suffix_array = build_suffix_array(tokens)
+            # the sentinels never match, so their suffixes are not needed
+            suffix_array = suffix_array[tokens[suffix_array] != SENTINEL]
+            index_dtype = np.int32 if len(tokens) < np.iinfo(np.int32).max else np.int64
+            arrays = {
+                "tokens": tokens,
+                "sa": suffix_array.astype(index_dtype),
+                "doc_starts": np.asarray(sequence["doc_starts"], dtype=np.int64),
+                "measures": np.asarray(sequence["measures"], dtype=np.int32),
+                "measure_numbers": np.asarray(
+                    sequence["measure_numbers"], dtype=np.int32
+                ),
+                "measure_offsets": np.asarray(sequence["offsets"], dtype=np.int64),
+            }
+            for array_name, array in arrays.items():
+                np.save(os.path.join(index_dir, f"{name}.{array_name}.npy"), array)
+
+        with open(os.path.join(index_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {"documents": doc_info, "rhythm_vocabulary": rhythm_vocabulary}, f
+            )
+        return len(doc_info)
+
+    def encode_query(self, query: str, mode: str) -> np.ndarray | None:
+        """
+        Turns a query string into the tokens of the searched sequence. Returns None if it can't match, raises
+        ValueError if the pitches or intervals are not whole numbers.
+        """
+        tokens = query.split()
+        if mode == "rhythm":
+            if any(x not in self.rhythm_vocabulary for x in tokens):
+                return None
+            return np.asarray([self.rhythm_vocabulary[x] for x in tokens], np.int32)
+        try:
+            values = np.asarray([int(x) for x in tokens], dtype=np.int32)
+        except ValueError:
+            raise ValueError(
+                f"Query must be whole numbers separated by spaces in mode {mode}: {query}"
+            )
+        if mode == "transposed":
+            # the pitches are turned into intervals, which don't depend on the starting pitch
+            values = np.diff(values).astype(np.int32)
+        return values
+
+    def _compare(self, tokens: np.ndarray, start: int, pattern: np.ndarray) -> int:
+        """Compares the suffix at start with the pattern, only looking at the first len(pattern) tokens."""
+        window = np.asarray(tokens[start : start + len(pattern)])
+        different = np.flatnonzero(window != pattern[: len(window)])
+        if len(different) > 0:
+            i = different[0]
+            return -1 if window[i] < pattern[i] else 1
+        return -1 if len(window) < len(pattern) else 0
+
+    def _find_range(self, name: str, pattern: np.ndarray) -> tuple[int, int]:
+        """Returns the range of the suffix array with all the suffixes that start with the pattern."""
+        tokens = self.arrays[name]["tokens"]
+        suffix_array = self.arrays[name]["sa"]
+
+        lo, hi = 0, len(suffix_array)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._compare(tokens, int(suffix_array[mid]), pattern) < 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = lo
+
+        hi = len(suffix_array)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._compare(tokens, int(suffix_array[mid]), pattern) <= 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        return start, lo
+
+    def search(self, query: str, mode: str = "transposed", limit: int = 100) -> dict:
+        """
+        Searches for a pattern and returns the number of matches and up to `limit` positions, with the index of
+        the first note and the number of its measure in the score.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode}. Must be one of {list(MODES)}")
+        name = MODES[mode]
+        pattern = self.encode_query(query, mode)
+        if pattern is None or len(pattern) == 0:
+            return {"count": 0, "matches": []}
+
+        start, end = self._find_range(name, pattern)
+        arrays = self.arrays[name]
+        positions = np.sort(np.asarray(arrays["sa"][start : min(end, start + limit)]))
+        doc_ids = np.searchsorted(arrays["doc_starts"], positions, side="right") - 1
+
+        matches = []
+        for position, doc_id in zip(positions.tolist(), doc_ids.tolist()):
+            note_index = (
+                position - int(arrays["doc_starts"][doc_id]) + NOTE_OFFSETS.get(mode, 0)
+            )
+            measures = slice(
+                arrays["measure_offsets"][doc_id], arrays["measure_offsets"][doc_id + 1]
+            )
+            measure_starts = arrays["measures"][measures]
+            measure_numbers = arrays["measure_numbers"][measures]
+            measure = None
+            if len(measure_starts) > 0:
+                # the measure that started last before the note
+                i = int(np.searchsorted(measure_starts, note_index, side="right")) - 1
+                measure = int(measure_numbers[max(i, 0)])
+            matches.append(
+                {**self.documents[doc_id], "note_index": note_index, "measure": measure}
+            )
+        return {"count": int(end - start), "matches": matches}
+
+
+@app.command()
+def build_melodic_index(
+    index_dir: str,
+    results_files: Annotated[
+        List[str], typer.Argument(help="The results files written by `process`")
+    ],
+):
+    """Builds a local suffix array index over the melodies and rhythms of processed files."""
+    for results_file in results_files:
+        if not os.path.isfile(results_file):
+            raise typer.BadParameter(f"File does not exist: {results_file}")
+    count = MelodicIndex.build(read_results(results_files), index_dir)
+    print(f"Indexed {count} documents into {index_dir}")
+
+
+@app.command()
+def search_melodic_index(
+    index_dir: str,
+    query: Annotated[
+        str,
+        typer.Option(
+            help="Space separated MIDI pitches, intervals in semitones or durations like '1/2', depending on the mode"
+        ),
+    ] = None,
+    queries_file: Annotated[
+        str, typer.Option(help="File with one query per line")
+    ] = None,
+    mode: Annotated[
+        str,
+        typer.Option(
+            help="'exact' matches MIDI pitches, 'transposed' matches MIDI pitches in any transposition, "
+            "'intervals' matches intervals and 'rhythm' matches durations"
+        ),
+    ] = "transposed",
+    limit: Annotated[
+        int, typer.Option(help="Maximum number of positions returned per query")
+    ] = 100,
+):
+    """Searches the local melodic index. Prints one JSON result per query."""
+    if query is None and queries_file is None:
+        raise typer.BadParameter("Must specify either query or queries_file")
+    if mode not in MODES:
+        raise typer.BadParameter(f"Mode must be one of {list(MODES)}")
+
+    queries = [query] if query is not None else []
+    if queries_file is not None:
+        with open(queries_file, "r", encoding="utf-8") as f:
+            queries.extend(line.strip() for line in f if line.strip() != "")
+
+    index = MelodicIndex(index_dir)
+    for q in queries:
+        start = time.perf_counter()
+        try:
+            result = index.search(q, mode, limit)
+        except ValueError as e:
+            # one bad query doesn't stop the others
+            print(json.dumps({"query": q, "mode": mode, "error": str(e)}))
+            continue
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        print(json.dumps({"query": q, "mode": mode, **result}))
@@ -0,0 +1,369 @@
+"""
+Counters and histograms for long-running pipeline commands, exposed in the OpenMetrics text format.
+
+The metrics can be written periodically to a file (e.g. for the node_exporter textfile collector) or served
+over HTTP on a local port so they can be scraped directly.
+"""
+
+import copy
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in labels.items():
+        value = (
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metric:
+    """Base class for all metrics. Values are stored per combination of label values."""
+
+    metric_type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        """Yields (suffix, labels, value) tuples for the exposition."""
+        raise NotImplementedError
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return copy.deepcopy(self._values)
+
+    def merge(self, values: dict):
+        """Adds the values of a snapshot, e.g. from a worker process."""
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def reset(self):
+        # a new lock, because forked workers may inherit a lock held by another thread
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# TYPE {self.name} {self.metric_type}",
+            f"# HELP {self.name} {self.documentation}",
+        ]
+        with self._lock:
+            samples = list(self._samples())
+        for suffix, labels, value in samples:
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}"
+            )
+        return lines
+
+
+class Counter(Metric):
+    """A monotonically increasing value, e.g. the number of processed files."""
+
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only be increased")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        for key, value in self._values.items():
+            yield "_total", dict(zip(self.labelnames, key)), value
+
+
+class Gauge(Metric):
+    """A value that can go up and down, e.g. the depth of a queue."""
+
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def merge(self, values: dict):
+        # the latest value wins
+        with self._lock:
+            self._values.update(values)
+
+    def _samples(self):
+        for key, value in self._values.items():
+            yield "", dict(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative buckets, e.g. latencies in seconds."""
+
+    metric_type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0}
+            state = self._values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+
+    def time(self, **labels):
+        """Context manager that observes the duration of the enclosed block."""
+        return _Timer(self, labels)
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, other in values.items():
+                if key not in self._values:
+                    self._values[key] = {
+                        "buckets": [0] * len(self.buckets),
+                        "sum": 0.0,
+                    }
+                state = self._values[key]
+                state["buckets"] = [
+                    a + b for a, b in zip(state["buckets"], other["buckets"])
+                ]
+                state["sum"] += other["sum"]
+
+    def _samples(self):
+        for key, state in self._values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["buckets"]):
+                cumulative += count
+                yield "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield "_count", labels, cumulative
+            yield "_sum", labels, state["sum"]
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Holds all the metrics of the process and renders them in the OpenMetrics format."""
+
+    def __init__(self):
+        self.metrics = {}
+        self._writer = None
+        self._server = None
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Returns the values of all the metrics, so they can be sent from a worker process to the parent."""
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def merge(self, snapshot: dict):
+        """Merges a snapshot of a worker process into the metrics of this process."""
+        for name, values in snapshot.items():
+            self.metrics[name].merge(values)
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def write_textfile(self, path: str):
+        """Writes the metrics to a file. The file is replaced atomically so readers never see a partial file."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def start(self, metrics_file: str = None, metrics_port: int = None, interval=15):
+        """
+        Starts exporting the metrics. If metrics_file is set, the metrics are written to it every `interval`
+        seconds. If metrics_port is set, they are served on http://localhost:<metrics_port>/metrics.
+        """
+        if metrics_file is not None and self._writer is None:
+            self._writer = _TextfileWriter(self, metrics_file, interval)
+            self._writer.start()
+        if metrics_port is not None and self._server is None:
+            self._server = _start_http_server(self, metrics_port)
+
+    def flush(self):
+        """Writes the current state of the metrics to the metrics file, if one is configured."""
+        if self._writer is not None:
+            self.write_textfile(self._writer.path)
+
+
+class _TextfileWriter(threading.Thread):
+    def __init__(self, registry: MetricsRegistry, path: str, interval: float):
+        super().__init__(daemon=True)
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+
+    def run(self):
+        while True:
+            self.registry.write_textfile(self.path)
+            time.sleep(self.interval)
+
+
+def _start_http_server(registry: MetricsRegistry, port: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # don't interfere with the progress bar
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+registry = MetricsRegistry()
+
+files_processed = registry.counter(
+    "pipeline_files_processed",
+    "Number of files that were processed successfully.",
+    ["file_type"],
+)
+file_failures = registry.counter(
+    "pipeline_file_failures",
+    "Number of files whose processing failed.",
+    ["file_type"],
+)
+bytes_read = registry.counter(
+    "pipeline_bytes_read",
+    "Number of bytes of source files read by the pipeline.",
+)
+processor_seconds = registry.histogram(
+    "pipeline_processor_seconds",
+    "Time spent in a single processor for a single file.",
+    ["processor"],
+)
+last_progress = registry.gauge(
+    "pipeline_last_progress_timestamp_seconds",
+    "Unix time of the last finished file or bulk request. Use it to alert on stalled runs.",
+)
+documents_indexed = registry.counter(
+    "pipeline_documents_indexed",
+    "Number of documents indexed into ElasticSearch.",
+)
+bulk_request_seconds = registry.histogram(
+    "pipeline_bulk_request_seconds",
+    "Latency of bulk requests to ElasticSearch.",
+)
+bulk_rejections = registry.counter(
+    "pipeline_bulk_rejections",
+    "Number of documents rejected by ElasticSearch in bulk requests, by HTTP status.",
+    ["status"],
+)
+ingest_queue_depth = registry.gauge(
+    "pipeline_ingest_queue_depth",
+    "Number of processed documents waiting for the indexer of the ingest command.",
+)
+workers_active = registry.gauge(
+    "pipeline_workers_active",
+    "Number of files being processed at the same time.",
+)
+workers_target = registry.gauge(
+    "pipeline_workers_target",
+    "Number of workers the adaptive controller currently allows.",
+)
+workers_rss = registry.gauge(
+    "pipeline_workers_rss_bytes",
+    "Resident memory of all the worker processes.",
+)
+pcm_cache_requests = registry.counter(
+    "pipeline_pcm_cache_requests",
+    "Number of decoded audio arrays requested from the PCM cache, by hit or miss.",
+    ["result"],
+)
+musicxml_reads = registry.counter(
+    "pipeline_musicxml_reads",
+    "Number of MusicXML files read by the streaming reader, by whether it read them or fell back to music21.",
+    ["result"],
+)
@@ -0,0 +1,239 @@
+"""
+Finds near-duplicate songs (arrangements, transcriptions, ...) across corpora with MinHash signatures of the
+interval and rhythm n-grams and locality sensitive hashing, so no all-pairs comparison is needed.
+"""
+
+import json
+import os
+from typing import Annotated, List
+
+import numpy as np
+import typer
+from tqdm import tqdm
+
+from helpers import open_ndjson, read_results
+from processors.shingles import shingle_hash
+
+app = typer.Typer()
+
+# prime larger than 2^32, so (a * x + b) mod PRIME is a random permutation of 32-bit hashes without overflow
+PRIME = np.uint64(4294967311)
+# buckets larger than this are not compared pairwise, but with a representative of every cluster found in them
+MAX_PAIRWISE_BUCKET = 100
+
+
+def song_shingles(document: dict, ngram_size: int) -> np.ndarray:
+    """Returns the 32-bit hashes of all interval and rhythm n-grams of a processed document."""
+    hashes = set()
+    sequences = []
+    if "contour" in document:
+        sequences.append(
+            ("i", document["contour"]["melodic_contour_string_relative"].split())
+        )
+    if "rhythm" in document:
+        sequences.append(("r", document["rhythm"]["rhythm_string"].split()))
+    for prefix, tokens in sequences:
+        for i in range(len(tokens) - ngram_size + 1):
+            gram = [prefix] + tokens[i : i + ngram_size]
+            hashes.add(int(shingle_hash(gram)[:8], 16))
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+class MinHasher:
+    """Computes MinHash signatures with `num_perm` random hash functions."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2**32, size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.integers(0, 2**32, size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray:
+        permuted = (self.a * shingles[None, :] + self.b) % PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x: int, y: int):
+        x, y = self.find(x), self.find(y)
+        if x != y:
+            self.parent[max(x, y)] = min(x, y)
+
+
+def find_clusters(
+    signatures: np.ndarray, bands: int, threshold: float
+) -> list[list[int]]:
+    """
+    Groups the rows of the (n, num_perm) signature matrix into clusters of near-duplicates. Candidates share at
+    least one LSH band and are kept if their estimated Jaccard similarity is at least the threshold.
+    """
+    n, num_perm = signatures.shape
+    if num_perm % bands != 0:
+        raise ValueError(
+            "The number of permutations must be divisible by the number of bands"
+        )
+    rows = num_perm // bands
+    union_find = UnionFind(n)
+
+    def similar(x: int, y: int) -> bool:
+        return np.mean(signatures[x] == signatures[y]) >= threshold
+
+    for band in range(bands):
+        band_signatures = np.ascontiguousarray(
+            signatures[:, band * rows : (band + 1) * rows]
+        )
+        keys = band_signatures.view(np.dtype((np.void, rows * 4))).ravel()
+        _, bucket_ids, bucket_sizes = np.unique(
+            keys, return_inverse=True, return_counts=True
+        )
+        # only the songs that share the bucket with at least one other song
+        shared = np.flatnonzero(bucket_sizes[bucket_ids] > 1)
+        shared = shared[np.argsort(bucket_ids[shared], kind="stable")]
+        boundaries = np.flatnonzero(np.diff(bucket_ids[shared])) + 1
+        for members in np.split(shared, boundaries):
+            members = members.tolist()
+            if len(members) < 2:
+                continue
+            if len(members) <= MAX_PAIRWISE_BUCKET:
+                pairs = (
+                    (x, y) for j, x in enumerate(members) for y in members[j + 1 :]
+                )
+                for x, y in pairs:
+                    if union_find.find(x) != union_find.find(y) and similar(x, y):
+                        union_find.union(x, y)
+                continue
+            representatives = []
+            for y in members:
+                joined = False
+                for x in representatives:
+                    if union_find.find(x) == union_find.find(y):
+                        joined = True
+                    elif similar(x, y):
+                        union_find.union(x, y)
+                        joined = True
+                if not joined:
+                    # the first member of a new cluster in the bucket
+                    representatives.append(y)
+
+    clusters = {}
+    for i in range(n):
+        clusters.setdefault(union_find.find(i), []).append(i)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+@app.command()
+def find_near_duplicates(
+    results_files: Annotated[
+        List[str], typer.Argument(help="The results files written by `process`")
+    ],
+    report_file: Annotated[
+        str, typer.Option(help="Where to write the report with all the clusters")
+    ] = "near_duplicates.json",
+    threshold: Annotated[
+        float, typer.Option(help="Minimal estimated Jaccard similarity of duplicates")
+    ] = 0.5,
+    num_perm: Annotated[
+        int, typer.Option(help="Length of the MinHash signatures")
+    ] = 128,
+    bands: Annotated[int, typer.Option(help="Number of LSH bands")] = 32,
+    ngram_size: Annotated[
+        int, typer.Option(help="Length of the interval and rhythm n-grams")
+    ] = 4,
+    write_field: Annotated[
+        bool,
+        typer.Option(
+            help="Whether to add the near_duplicates field to the documents in the results files"
+        ),
+    ] = True,
+):
+    """Finds near-duplicate songs across the results files with MinHash and LSH."""
+    for results_file in results_files:
+        if not os.path.isfile(results_file):
+            raise typer.BadParameter(f"File does not exist: {results_file}")
+
+    hasher = MinHasher(num_perm)
+    signatures = []
+    songs = []
+    for results_file in results_files:
+        for document in tqdm(read_results([results_file]), desc=results_file):
+            shingles = song_shingles(document, ngram_size)
+            if len(shingles) == 0:
+                continue
+            signatures.append(hasher.signature(shingles))
+            songs.append(
+                {
+                    "file_hash_sha256": document["file_hash_sha256"],
+                    "filename": document.get("filename"),
+                    "corpus_id": document.get("corpus_id"),
+                }
+            )
+
+    clusters = []
+    if len(signatures) > 0:
+        clusters = find_clusters(np.stack(signatures), bands, threshold)
+
+    song_clusters = {}
+    report = []
+    for members in clusters:
+        hashes = sorted({songs[i]["file_hash_sha256"] for i in members})
+        if len(hashes) < 2:
+            continue  # the same file in several corpora
+        cluster_id = hashes[0]
+        for file_hash in hashes:
+            song_clusters[file_hash] = {
+                "cluster_id": cluster_id,
+                "similar_files": [x for x in hashes if x != file_hash],
+            }
+        report.append(
+            {
+                "cluster_id": cluster_id,
+                "size": len(hashes),
+                "members": [songs[i] for i in members],
+            }
+        )
+    report.sort(key=lambda x: x["size"], reverse=True)
+
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "parameters": {
+                    "threshold": threshold,
+                    "num_perm": num_perm,
+                    "bands": bands,
+                    "ngram_size": ngram_size,
+                },
+                "clusters": report,
+            },
+            f,
+            indent=4,
+        )
+    print(f"Found {len(report)} clusters of near-duplicates, report at {report_file}")
+
+    if write_field:
+        for results_file in results_files:
+            write_near_duplicates(results_file, song_clusters)
+
+
+def write_near_duplicates(results_file: str, song_clusters: dict):
+    """Rewrites the results file with the near_duplicates field of every document."""
+    # keeps the extension, so the compression stays the same
+    tmp_file = os.path.join(
+        os.path.dirname(results_file), ".tmp." + os.path.basename(results_file)
+    )
+    with open_ndjson(tmp_file, "w") as f:
+        for document in read_results([results_file]):
+            document.pop("near_duplicates", None)
+            if document.get("file_hash_sha256") in song_clusters:
+                document["near_duplicates"] = song_clusters[
+                    document["file_hash_sha256"]
+                ]
+            f.write(json.dumps(document) + "\n")
+    os.replace(tmp_file, results_file)
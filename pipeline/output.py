@@ -0,0 +1,176 @@
+"""
+Writers for the results of `process`. Results can be written to a single file or split deterministically by file
+hash into shards, which are listed in a manifest so `upload` and `process --dump` can read them in parallel.
+"""
+
+import json
+import os
+
+from helpers import get_blob_file, open_ndjson, split_compression, split_document
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+class ResultsWriter:
+    """
+    Appends the results to the output file, with split_blobs the blob fields go to the blob file. The files stay
+    open for the whole run, so compressed outputs are written as a single stream.
+    """
+
+    def __init__(self, out_file: str, split_blobs: bool):
+        self.out_file = out_file
+        self.split_blobs = split_blobs
+        self.files = {}
+        # number of records written to every file
+        self.records = {}
+
+    def _write(self, path: str, line: str):
+        if path not in self.files:
+            self.files[path] = open_ndjson(path, "a")
+            self.records[path] = 0
+        self.files[path].write(line + "\n")
+        self.records[path] += 1
+
+    def write(self, results: str):
+        if self.split_blobs:
+            document, blob = split_document(json.loads(results))
+            results = json.dumps(document)
+            if blob is not None:
+                self._write(get_blob_file(self.out_file), json.dumps(blob))
+        self._write(self.out_file, results)
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def shard_for(file_hash: str, shards: int) -> int:
+    """Returns the shard of a document. Only depends on the file hash, so reruns put songs in the same shard."""
+    return int(file_hash[:16], 16) % shards
+
+
+def get_shard_files(out_file: str, shards: int) -> list[str]:
+    """Returns the paths of the shards, e.g. results.json.zst -> results-00000-of-00004.jsonl.zst, ..."""
+    path, compression = split_compression(out_file)
+    root, _ = os.path.splitext(path)
+    return [
+        f"{root}-{shard:05d}-of-{shards:05d}.jsonl{compression}"
+        for shard in range(shards)
+    ]
+
+
+def get_manifest_file(out_file: str) -> str:
+    path, _ = split_compression(out_file)
+    root, _ = os.path.splitext(path)
+    return root + MANIFEST_SUFFIX
+
+
+class ShardedResultsWriter:
+    """Writes every result to the shard of its file hash."""
+
+    def __init__(self, out_file: str, shards: int, split_blobs: bool):
+        self.writers = [
+            ResultsWriter(shard_file, split_blobs)
+            for shard_file in get_shard_files(out_file, shards)
+        ]
+
+    @property
+    def records(self) -> dict:
+        records = {}
+        for writer in self.writers:
+            records.update(writer.records)
+        return records
+
+    def write(self, results: str):
+        file_hash = json.loads(results)["file_hash_sha256"]
+        self.writers[shard_for(file_hash, len(self.writers))].write(results)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+            # empty shards are still created, so every shard in the manifest exists
+            if not os.path.exists(writer.out_file):
+                open_ndjson(writer.out_file, "a").close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_manifest(manifest_file: str, shard_files: list[str], records: dict):
+    """
+    Writes the manifest with the sizes and record counts of the shards and their blob files. Paths are relative
+    to the manifest, so the files can be moved together.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+
+    def describe(path: str):
+        if not os.path.exists(path):
+            return None
+        return {
+            "path": os.path.relpath(os.path.abspath(path), base_dir),
+            "bytes": os.path.getsize(path),
+            "records": records.get(path, 0),
+        }
+
+    shards = []
+    for shard_file in shard_files:
+        shard = describe(shard_file)
+        blob = describe(get_blob_file(shard_file))
+        if blob is not None:
+            shard["blobs"] = blob
+        shards.append(shard)
+
+    with open(manifest_file, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "shard_count": len(shards),
+                "records": sum(x["records"] for x in shards),
+                "bytes": sum(x["bytes"] for x in shards),
+                "shards": shards,
+            },
+            f,
+            indent=4,
+        )
+
+
+def count_records(path: str) -> int:
+    with open_ndjson(path) as f:
+        return sum(1 for line in f if line.strip() != "")
+
+
+def read_manifest(manifest_file: str) -> list[str]:
+    """Returns the absolute paths of the shards in the manifest."""
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    return [os.path.join(base_dir, shard["path"]) for shard in manifest["shards"]]
+
+
+def is_manifest(path: str) -> bool:
+    return path.endswith(MANIFEST_SUFFIX)
+
+
+def remove_results(out_file: str, file_hashes: set[str]):
+    """Rewrites the results file and its blob file without the documents of the file hashes."""
+    for path in [out_file, get_blob_file(out_file)]:
+        if not os.path.exists(path):
+            continue
+        root, compression = split_compression(path)
+        tmp_file = root + ".tmp" + compression
+        with open_ndjson(path) as f, open_ndjson(tmp_file, "w") as out:
+            for line in f:
+                if line.strip() == "":
+                    continue
+                if json.loads(line)["file_hash_sha256"] not in file_hashes:
+                    out.write(line if line.endswith("\n") else line + "\n")
+        os.replace(tmp_file, path)
@@ -0,0 +1,134 @@
+"""
+Partitioning of the song and audio indices by corpus. Almost every search filters on corpus_id, so documents can be
+routed by their corpus, keeping a corpus on one shard, or stored in an index per corpus behind an alias of the index
+name, so corpora are sized independently and searches skip the indices of other corpora. The partitioning is chosen
+by `generate-mapping` and stored in the _meta of the mapping, so everything writing to the index routes the same way.
+"""
+
+import copy
+
+# documents are routed by the hash of their id
+PARTITIONING_NONE = "none"
+# documents are routed by their corpus_id
+PARTITIONING_ROUTING = "routing"
+# every corpus has its own index, e.g. songs-corpus-<corpus_id>, behind the songs alias
+PARTITIONING_INDEX = "index"
+PARTITIONINGS = [PARTITIONING_NONE, PARTITIONING_ROUTING, PARTITIONING_INDEX]
+CORPUS_INDEX_SEPARATOR = "-corpus-"
+
+
+def check_partitioning(partitioning: str):
+    if partitioning not in PARTITIONINGS:
+        raise ValueError(
+            f"Unknown partitioning {partitioning}, must be one of {', '.join(PARTITIONINGS)}"
+        )
+
+
+def partition_mapping(
+    mapping: dict,
+    partitioning: str,
+    shards: int = None,
+    routing_partition_size: int = 1,
+) -> dict:
+    """
+    Returns the mapping with the partitioning and the settings of the index. Routed indices require a routing and
+    can spread a corpus over routing_partition_size shards, indices of corpora have a constant corpus_id.
+    """
+    check_partitioning(partitioning)
+    mapping = copy.deepcopy(mapping)
+    mapping["_meta"] = {**mapping.get("_meta", {}), "partitioning": partitioning}
+    settings = {}
+    if shards is not None:
+        settings["number_of_shards"] = shards
+    if partitioning == PARTITIONING_ROUTING:
+        mapping["_routing"] = {"required": True}
+        if routing_partition_size > 1:
+            settings["routing_partition_size"] = routing_partition_size
+    elif partitioning == PARTITIONING_INDEX:
+        # set by the first document, searches for other corpora skip the index without touching its shards
+        mapping["properties"]["corpus_id"] = {"type": "constant_keyword"}
+    if len(settings) > 0:
+        mapping["settings"] = settings
+    return mapping
+
+
+def split_settings(mapping: dict) -> tuple[dict, dict]:
+    """Splits a mapping file into the mapping and the index settings."""
+    mapping = dict(mapping)
+    settings = mapping.pop("settings", {})
+    return mapping, settings
+
+
+def get_partitioning(mapping: dict) -> str:
+    return mapping.get("_meta", {}).get("partitioning", PARTITIONING_NONE)
+
+
+def get_index_partitioning(client, index: str) -> str:
+    """Returns the partitioning of an existing index or alias, None if it doesn't exist."""
+    if not client.indices.exists(index=index):
+        return None
+    response = client.indices.get_mapping(index=index)
+    # every index of the alias has the same partitioning
+    return get_partitioning(next(iter(response.values()))["mappings"])
+
+
+def inherit_partitioning(client, index: str, mapping: dict) -> dict:
+    """Returns the mapping with the partitioning and the shards of the existing index or alias."""
+    index_partitioning = get_index_partitioning(client, index)
+    if index_partitioning is None:
+        return mapping
+    response = client.indices.get_settings(index=index)
+    settings = next(iter(response.values()))["settings"]["index"]
+    return partition_mapping(
+        mapping,
+        index_partitioning,
+        int(settings["number_of_shards"]),
+        int(settings.get("routing_partition_size", 1)),
+    )
+
+
+def get_corpus_index(index: str, corpus_id: str) -> str:
+    """
+    Returns the index of the corpus. Index names must be lowercase, two ids that only differ in case would share
+    the index, which their constant corpus_id rejects.
+    """
+    return f"{index}{CORPUS_INDEX_SEPARATOR}{corpus_id.lower()}"
+
+
+def get_target(index: str, corpus_id: str, partitioning: str) -> tuple[str, str]:
+    """Returns the index and the routing a document of the corpus is written to, None for the default routing."""
+    if corpus_id is None:
+        return index, None
+    if partitioning == PARTITIONING_ROUTING:
+        return index, corpus_id
+    if partitioning == PARTITIONING_INDEX:
+        return get_corpus_index(index, corpus_id), None
+    return index, None
+
+
+def put_corpus_template(client, index: str, mapping: dict, settings: dict):
+    """
+    Puts the index template of the corpus indices of the alias, so the index of a new corpus is created with the
+    mapping and joins the alias when its first document is written.
+    """
+    # a merged mapping has the corpus_id of an existing corpus
+    mapping = {
+        **mapping,
+        "properties": {
+            **mapping["properties"],
+            "corpus_id": {"type": "constant_keyword"},
+        },
+    }
+    client.indices.put_index_template(
+        name=index + CORPUS_INDEX_SEPARATOR.rstrip("-"),
+        index_patterns=[index + CORPUS_INDEX_SEPARATOR + "*"],
+        template={"settings": settings, "mappings": mapping, "aliases": {index: {}}},
+    )
+
+
+def create_corpus_index(client, index: str, corpus_id: str, shards: int = None):
+    """Creates the index of the corpus with its own number of shards, the rest comes from the template."""
+    settings = {"number_of_shards": shards} if shards is not None else None
+    client.options(ignore_status=400).indices.create(
+        index=get_corpus_index(index, corpus_id), settings=settings
+    )
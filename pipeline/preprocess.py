@@ -11,7 +11,7 @@ app = typer.Typer()
 
 @app.command()
 def preprocess(in_dir: str, out_dir: str):
-    """Shortens all the audio files to below 10 minutes and reduces the sampling rate to 8kHz."""
+    """Reduces the sampling rate of all the audio files to 8kHz, or 16kHz for the separated vocals and accompaniment."""
     if not os.path.isdir(in_dir):
         raise typer.BadParameter(f"{in_dir} is not a directory")
     if not os.path.isdir(out_dir):
@@ -35,7 +35,6 @@ def preprocess(in_dir: str, out_dir: str):
 
 def preprocess_file(in_file, out_file):
     input = ffmpeg.input(in_file)
-    audio_cut = input.audio.filter("atrim", duration=180)
     file_without_extension = os.path.splitext(out_file)[0]
 
     # Set the sample rate to 16000 if the file is vocals or accompaniment because PESTO requires 16kHz sample rate
@@ -46,7 +45,7 @@ def preprocess_file(in_file, out_file):
         else 8000
     )
 
-    audio_resampled = audio_cut.output(
+    audio_resampled = input.audio.output(
         file_without_extension + ".mp3",
         ar=sample_rate,
         loglevel="error",
@@ -1,9 +1,25 @@
 import os
+from functools import lru_cache, partial
 
+import numpy as np
 import soundfile
 
 from helpers import check_audio_extension_allowed
+from processors import pcm_cache, streaming
 from processors.base_processor import BaseProcessor
+from processors.chord_progressions import roman_numerals
+from processors.shingles import hashed_shingles
+
+# number of raw samples per point at every zoom level of the downsampled series
+PYRAMID_BUCKET_SIZES = [16, 64, 256]
+# raw time series are only read from _source by the detail pages, searches use the summaries
+RAW_ARRAY_MAPPING = {"type": "float", "index": False, "doc_values": False}
+# PESTO confidence above which a frame of the vocals counts as voiced
+VOICING_CONFIDENCE = 0.5
+# RMS frames quieter than this are silence and left out of the loudness summary
+SILENCE_DB = -60.0
+# chord recognizers label frames without a chord with N
+NO_CHORD = "N"
 
 
 class AudioProcessor(BaseProcessor):
@@ -18,11 +34,21 @@ class AudioProcessor(BaseProcessor):
         algorithm_name: str = None,
         feature_name: str = None,
         mapping=None,
+        profile: str = None,
+        profiled: bool = False,
     ):
         """
         any song: The path to the song to process.
         str name: The name of the processor. This is the name of the field that the results will be stored in.
+        str profile: The quality profile from audio_profiles in config.py, the default one if None.
+        bool profiled: Whether the results depend on the profile, then it's appended to the algorithm name.
         """
+        from config import get_algorithm_name, get_audio_profile
+
+        self.profile = profile
+        self.settings = get_audio_profile(profile)
+        if profiled and algorithm_name is not None:
+            algorithm_name = get_algorithm_name(algorithm_name, profile)
         # Song is None when using it for mapping generation
         if song is not None:
             if not isinstance(song, str):
@@ -50,8 +76,8 @@ class AudioProcessor(BaseProcessor):
 class AudioFileInfoProcessor(AudioProcessor):
     """Gets the file information of the song like the duration, sample rate, and bit rate."""
 
-    def __init__(self, song: any):
-        super().__init__(song, "file_info", "sample_rate")
+    def __init__(self, song: any, profile: str = None):
+        super().__init__(song, "file_info", "sample_rate", profile=profile)
         self.mapping = {
             "properties": {
                 "sample_rate": {"type": "float"},
@@ -72,21 +98,37 @@ class AudioFileInfoProcessor(AudioProcessor):
 class AudioBPMProcessor(AudioProcessor):
     """Gets the BPM of the song."""
 
-    def __init__(self, song: any):
-        super().__init__(song, "essentia_multifeature", "bpm")
+    def __init__(self, song: any, profile: str = None):
+        from config import get_audio_profile
+
+        beat_method = get_audio_profile(profile)["beat_method"]
+        super().__init__(
+            song, f"essentia_{beat_method}", "bpm", profile=profile, profiled=True
+        )
         self.mapping = {
-            "properties": {"bpm": {"type": "float"}, "beat_ticks": {"type": "float"}}
+            "properties": {"bpm": {"type": "float"}, "beat_ticks": RAW_ARRAY_MAPPING}
         }
 
     def process(self):
         import essentia.standard
 
+        if streaming.should_stream(self.song):
+            windows = streaming.map_windows(
+                partial(streaming.beats_window, method=self.settings["beat_method"]),
+                self.song,
+                context_seconds=streaming.BEATS_CONTEXT_SECONDS,
+            )
+            beat_ticks = [tick for window in windows for tick in window]
+            bpm = streaming.bpm_from_ticks(beat_ticks)
+            return {"bpm": round_floats(bpm), "beat_ticks": round_floats(beat_ticks)}
+
         # let the loader resample here! if we include the original sample rate it ruins the accuracy
         # of the algorithm
-        loader = essentia.standard.MonoLoader(filename=self.song)
-        audio = loader()
+        audio = pcm_cache.load_mono(self.song, streaming.ESSENTIA_SAMPLE_RATE)
 
-        rhythm_extractor = essentia.standard.RhythmExtractor2013(method="multifeature")
+        rhythm_extractor = essentia.standard.RhythmExtractor2013(
+            method=self.settings["beat_method"]
+        )
         beats = rhythm_extractor(audio)
 
         bpm = round_floats(beats[0])
@@ -98,24 +140,30 @@ class AudioBPMProcessor(AudioProcessor):
 class AudioPitchContourProcessor(AudioProcessor):
     """Gets the pitch contour of the song."""
 
-    def __init__(self, song: any):
-        super().__init__(song, "pesto", "pitch_contour")
+    def __init__(self, song: any, profile: str = None):
+        super().__init__(song, "pesto", "pitch_contour", profile=profile, profiled=True)
         self.mapping = {
             "properties": {
-                "pitch_contour_hz_voice": {"type": "float"},
-                "pitch_contour_hz_instrumental": {"type": "float"},
+                "pitch_contour_hz_voice": RAW_ARRAY_MAPPING,
+                "pitch_contour_hz_instrumental": RAW_ARRAY_MAPPING,
                 "time_step_ms": {"type": "float"},
+                "voice_pitch_median_hz": {"type": "float"},
+                "voice_pitch_low_hz": {"type": "float"},
+                "voice_pitch_high_hz": {"type": "float"},
+                "voice_pitch_range_semitones": {"type": "float"},
+                "voiced_percent": {"type": "float"},
+                # downsampled series for overview charts
+                "pyramid": {"type": "object", "enabled": False},
             }
         }
 
     def process(self):
-        import torchaudio
         import torch
         from pesto import predict
 
         file_extension = self.song.split(".")[-1]
         rest_of_path = self.song[: -len(file_extension) - 1]
-        step_size = 10.0
+        step_size = self.settings["pesto_step_ms"]
 
         voice_path = rest_of_path + ".vocals.mp3"
         instrumental_path = rest_of_path + ".accompaniment.mp3"
@@ -129,42 +177,85 @@ class AudioPitchContourProcessor(AudioProcessor):
                 f"{instrumental_path} does not exist. Please run the voice extraction first. Refer to extract_voice.md for more information."
             )
 
-        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-
-        x, sr = torchaudio.load(voice_path)
-        x = x.mean(dim=0)  # PESTO takes mono audio as input
-        x = x.to(device)
+        if streaming.should_stream(self.song):
+            contours = []
+            for path in [voice_path, instrumental_path]:
+                windows = streaming.map_windows(
+                    partial(streaming.pitch_window, step_size=step_size),
+                    path,
+                    context_seconds=streaming.PITCH_CONTEXT_SECONDS,
+                )
+                contours.append(
+                    (
+                        [x for predictions, _ in windows for x in predictions],
+                        [x for _, confidence in windows for x in confidence],
+                    )
+                )
+            (pitch_contour_hz_voice, confidence_voice) = contours[0]
+            pitch_contour_hz_instrumental = contours[1][0]
+            pitch_contour_hz_voice = round_floats(pitch_contour_hz_voice)
+            pitch_contour_hz_instrumental = round_floats(pitch_contour_hz_instrumental)
+        else:
+            device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+            # PESTO takes mono audio as input, copied because cached arrays are read-only
+            sr = get_sample_rate(voice_path)
+            x = torch.from_numpy(
+                np.array(pcm_cache.load_mono(voice_path, sr, decoder="torchaudio"))
+            )
+            x = x.to(device)
 
-        timesteps, predictions_voice, confidence, activations = predict(
-            x, sr, step_size
-        )
+            timesteps, predictions_voice, confidence, activations = predict(
+                x, sr, step_size
+            )
+            confidence_voice = confidence.tolist()
 
-        x, sr = torchaudio.load(instrumental_path)
-        x = x.mean(dim=0)
-        x = x.to(device)
-        timesteps, predictions_instrumental, confidence, activations = predict(
-            x, sr, step_size
-        )
+            sr = get_sample_rate(instrumental_path)
+            x = torch.from_numpy(
+                np.array(
+                    pcm_cache.load_mono(instrumental_path, sr, decoder="torchaudio")
+                )
+            )
+            x = x.to(device)
+            timesteps, predictions_instrumental, confidence, activations = predict(
+                x, sr, step_size
+            )
 
-        return {
-            "pitch_contour_hz_voice": round_floats(predictions_voice.tolist()),
-            "pitch_contour_hz_instrumental": round_floats(
+            pitch_contour_hz_voice = round_floats(predictions_voice.tolist())
+            pitch_contour_hz_instrumental = round_floats(
                 predictions_instrumental.tolist()
-            ),
+            )
+        return {
+            "pitch_contour_hz_voice": pitch_contour_hz_voice,
+            "pitch_contour_hz_instrumental": pitch_contour_hz_instrumental,
             "time_step_ms": step_size,
+            **pitch_summary(pitch_contour_hz_voice, confidence_voice),
+            "pyramid": {
+                "pitch_contour_hz_voice": downsample_pyramid(pitch_contour_hz_voice),
+                "pitch_contour_hz_instrumental": downsample_pyramid(
+                    pitch_contour_hz_instrumental
+                ),
+            },
         }
 
 
 class AudioChordProcessor(AudioProcessor):
-    """Gets the chord progression of the song."""
+    """
+    Gets the chord progression of the song, also as Roman numerals in the key of AudioKeyExtractProcessor with
+    hashed shingles, so progressions like ii V I are found with term queries in any key.
+    """
 
-    def __init__(self, song: any):
-        super().__init__(song, "autochord", "chords")
+    def __init__(self, song: any, profile: str = None):
+        super().__init__(song, "autochord", "chords", profile=profile)
         self.mapping = {
             "properties": {
                 "chord_name": {"type": "keyword"},
-                "chord_start": {"type": "float"},
-                "chord_end": {"type": "float"},
+                "chord_start": RAW_ARRAY_MAPPING,
+                "chord_end": RAW_ARRAY_MAPPING,
+                "chord_changes_per_minute": {"type": "float"},
+                "distinct_chords": {"type": "integer"},
+                "chord_roman": {"type": "keyword"},
+                "chord_progression_shingles": {"type": "keyword", "doc_values": False},
             }
         }
 
@@ -175,22 +266,31 @@ class AudioChordProcessor(AudioProcessor):
         chord_names = [x[2] for x in output]
         chord_starts = round_floats([x[0] for x in output])
         chord_ends = round_floats([x[1] for x in output])
+        key, scale, _ = get_key(self.song, self.settings["key_sample_rate"])
+        chord_roman = roman_numerals(chord_names, key, scale)
         return {
             "chord_name": chord_names,
             "chord_start": chord_starts,
             "chord_end": chord_ends,
+            **chord_summary(chord_names, chord_starts, chord_ends),
+            "chord_roman": chord_roman,
+            "chord_progression_shingles": hashed_shingles(chord_roman),
         }
 
 
 class AudioRMSProcessor(AudioProcessor):
-    def __init__(self, song: any):
-        super().__init__(song, "rms", "loudness")
+    def __init__(self, song: any, profile: str = None):
+        super().__init__(song, "rms", "loudness", profile=profile)
         self.mapping = {
             "properties": {
-                "loudness_total": {"type": "float"},
-                "loudness_vocals": {"type": "float"},
-                "loudness_instrumental": {"type": "float"},
+                "loudness_total": RAW_ARRAY_MAPPING,
+                "loudness_vocals": RAW_ARRAY_MAPPING,
+                "loudness_instrumental": RAW_ARRAY_MAPPING,
                 "timestep_seconds": {"type": "float"},
+                "loudness_mean_db": {"type": "float"},
+                "loudness_range_db": {"type": "float"},
+                # downsampled series for overview charts
+                "pyramid": {"type": "object", "enabled": False},
             }
         }
 
@@ -200,9 +300,17 @@ class AudioRMSProcessor(AudioProcessor):
         sample_rate = get_sample_rate(song)
         frame_size = int(sample_rate / 16)
         hop_size = int(frame_size / 2)
+        rms_timestep_seconds = hop_size / sample_rate
+
+        if streaming.should_stream(song):
+            windows = streaming.map_windows(
+                partial(streaming.rms_window, frame_size=frame_size, hop_size=hop_size),
+                song,
+                context_seconds=streaming.RMS_CONTEXT_SECONDS,
+            )
+            return ([x for window in windows for x in window], rms_timestep_seconds)
 
-        loader = es.MonoLoader(filename=song, sampleRate=sample_rate)
-        audio = loader()
+        audio = pcm_cache.load_mono(song, sample_rate)
 
         rms = es.RMS()
         rms_values = []
@@ -210,8 +318,6 @@ class AudioRMSProcessor(AudioProcessor):
         for frame in es.FrameGenerator(audio, frameSize=frame_size, hopSize=hop_size):
             rms_values.append(rms(frame))
 
-        rms_timestep_seconds = hop_size / sample_rate
-
         return (rms_values, rms_timestep_seconds)
 
     def process(self):
@@ -230,12 +336,20 @@ class AudioRMSProcessor(AudioProcessor):
             "loudness_vocals": rms_values_vocals,
             "loudness_instrumental": rms_values_instrumental,
             "timestep_seconds": timestep,
+            **loudness_summary(rms_values_total),
+            "pyramid": {
+                "loudness_total": downsample_pyramid(rms_values_total),
+                "loudness_vocals": downsample_pyramid(rms_values_vocals),
+                "loudness_instrumental": downsample_pyramid(rms_values_instrumental),
+            },
         }
 
 
 class AudioKeyExtractProcessor(AudioProcessor):
-    def __init__(self, song: any):
-        super().__init__(song, "essentia_key_extractor", "key")
+    def __init__(self, song: any, profile: str = None):
+        super().__init__(
+            song, "essentia_key_extractor", "key", profile=profile, profiled=True
+        )
         self.mapping = {
             "properties": {
                 "key": {"type": "keyword"},
@@ -245,15 +359,32 @@ class AudioKeyExtractProcessor(AudioProcessor):
         }
 
     def process(self):
-        import essentia.standard as es
+        key, scale, confidence = get_key(self.song, self.settings["key_sample_rate"])
+        return {"key": key, "scale": scale, "confidence": confidence}
+
 
-        loader = es.MonoLoader(filename=self.song)
-        audio = loader()
-        key_extract = es.KeyExtractor()
+def get_key(song: str, sample_rate: int) -> tuple[str, str, float]:
+    """
+    Returns the key, scale and confidence of the song. They are kept for the last file, the chord processor reads
+    the key the key processor estimates.
+    """
+    return _get_key(os.path.abspath(song), sample_rate, os.stat(song).st_mtime_ns)
 
-        (key, scale, confidence) = key_extract(audio)
 
-        return {"key": key, "scale": scale, "confidence": confidence}
+@lru_cache(maxsize=1)
+def _get_key(song: str, sample_rate: int, mtime_ns: int) -> tuple[str, str, float]:
+    import essentia.standard as es
+
+    if streaming.should_stream(song):
+        return streaming.key_from_hpcp(
+            streaming.map_windows(
+                partial(streaming.hpcp_window, sample_rate=sample_rate), song
+            )
+        )
+
+    audio = pcm_cache.load_mono(song, sample_rate)
+    key_extract = es.KeyExtractor(sampleRate=sample_rate)
+    return key_extract(audio)
 
 
 def round_floats(o):
@@ -266,6 +397,94 @@ def round_floats(o):
     return o
 
 
+def pitch_summary(pitch_hz, confidence, threshold=VOICING_CONFIDENCE) -> dict:
+    """
+    Summarizes the pitch contour of the vocals over the frames PESTO is confident about: the median, the 5th and
+    95th percentiles as the range, and the percentage of voiced frames. None if nothing is voiced.
+    """
+    pitch_hz = np.asarray(pitch_hz, dtype=np.float64)
+    voiced = (np.asarray(confidence, dtype=np.float64) >= threshold) & (pitch_hz > 0)
+    summary = {
+        "voice_pitch_median_hz": None,
+        "voice_pitch_low_hz": None,
+        "voice_pitch_high_hz": None,
+        "voice_pitch_range_semitones": None,
+        "voiced_percent": round_floats(100 * float(voiced.mean()))
+        if len(voiced) > 0
+        else None,
+    }
+    if voiced.any():
+        low, median, high = np.percentile(pitch_hz[voiced], [5, 50, 95])
+        summary["voice_pitch_median_hz"] = round_floats(float(median))
+        summary["voice_pitch_low_hz"] = round_floats(float(low))
+        summary["voice_pitch_high_hz"] = round_floats(float(high))
+        summary["voice_pitch_range_semitones"] = round_floats(
+            float(12 * np.log2(high / low))
+        )
+    return summary
+
+
+def loudness_summary(rms_values) -> dict:
+    """
+    Summarizes the loudness of the non-silent frames in dB: the mean, and the range between the 10th and 95th
+    percentiles as the dynamics, like the loudness range of EBU R 128. None if the recording is silent.
+    """
+    rms_values = np.asarray(rms_values, dtype=np.float64)
+    loudness_db = 20 * np.log10(np.maximum(rms_values, 10 ** (SILENCE_DB / 20)))
+    loudness_db = loudness_db[loudness_db > SILENCE_DB]
+    if len(loudness_db) == 0:
+        return {"loudness_mean_db": None, "loudness_range_db": None}
+    low, high = np.percentile(loudness_db, [10, 95])
+    return {
+        "loudness_mean_db": round_floats(float(loudness_db.mean())),
+        "loudness_range_db": round_floats(float(high - low)),
+    }
+
+
+def chord_summary(chord_names, chord_starts, chord_ends) -> dict:
+    """
+    Summarizes the chord progression: the changes between different chords per minute of the chords, and the
+    number of distinct chords. Stretches without a chord are left out.
+    """
+    chords = [
+        (name, start, end)
+        for name, start, end in zip(chord_names, chord_starts, chord_ends)
+        if name != NO_CHORD
+    ]
+    if len(chords) == 0:
+        return {"chord_changes_per_minute": None, "distinct_chords": 0}
+    names = [name for name, _, _ in chords]
+    changes = sum(1 for previous, name in zip(names, names[1:]) if name != previous)
+    minutes = sum(end - start for _, start, end in chords) / 60
+    return {
+        "chord_changes_per_minute": round_floats(changes / minutes)
+        if minutes > 0
+        else None,
+        "distinct_chords": len(set(names)),
+    }
+
+
+def downsample_pyramid(values, bucket_sizes=PYRAMID_BUCKET_SIZES) -> dict:
+    """
+    Downsamples a time series to the min, max and mean of every bucket at several zoom levels. The keys are the
+    numbers of raw samples per bucket, the last bucket may be shorter.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    pyramid = {}
+    for bucket_size in bucket_sizes:
+        if len(values) == 0:
+            pyramid[str(bucket_size)] = {"min": [], "max": [], "mean": []}
+            continue
+        starts = np.arange(0, len(values), bucket_size)
+        counts = np.diff(np.append(starts, len(values)))
+        pyramid[str(bucket_size)] = {
+            "min": np.round(np.minimum.reduceat(values, starts), 6).tolist(),
+            "max": np.round(np.maximum.reduceat(values, starts), 6).tolist(),
+            "mean": np.round(np.add.reduceat(values, starts) / counts, 6).tolist(),
+        }
+    return pyramid
+
+
 def get_sample_rate(song):
     import soundfile
 
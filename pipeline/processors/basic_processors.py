@@ -1,5 +1,7 @@
 from music21 import stream, tempo, note, interval, metadata, key
+from processors.key_finding import find_keys, pitch_class_histogram
 from processors.musicxml_processor import MusicXMLProcessor
+from processors.musicxml_reader import ScoreEvents
 
 
 class KeyProcessor(MusicXMLProcessor):
@@ -33,6 +35,40 @@ class KeyProcessor(MusicXMLProcessor):
         }
 
 
+class FastKeyProcessor(KeyProcessor):
+    """
+    Get the key signature of the song. Uses the same algorithm and output as KeyProcessor but builds the
+    pitch-class histogram directly from the notes and correlates it with all keys at once in NumPy.
+    """
+
+    def __init__(self, song: stream.Stream, feature_name="key"):
+        super().__init__(song, feature_name)
+
+    def process(self) -> dict[str, list[str] | str]:
+        result = find_keys(song_pitch_class_histogram(self.song))[0]
+        if result is None:
+            raise ValueError("Can't find the key of a song without notes")
+        return result
+
+    @staticmethod
+    def process_batch(songs: list[stream.Stream]) -> list[dict[str, list[str] | str]]:
+        """Finds the keys of many songs with a single matrix multiplication."""
+        return find_keys([song_pitch_class_histogram(song) for song in songs])
+
+
+def song_pitch_class_histogram(song: stream.Stream):
+    """Duration weighted pitch-class histogram of all the notes in all the parts of the song."""
+    pitch_classes = []
+    durations = []
+    for n in song.flatten().notes:
+        if isinstance(n, note.Unpitched):
+            continue
+        for p in n.pitches:
+            pitch_classes.append(p.pitchClass)
+            durations.append(float(n.quarterLength))
+    return pitch_class_histogram(pitch_classes, durations)
+
+
 class TimeSignatureProcessor(MusicXMLProcessor):
     """Get all time signatures in the song."""
 
@@ -55,6 +91,9 @@ class TimeSignatureProcessor(MusicXMLProcessor):
         # Convert set to sorted list for consistent ordering
         return sorted(list(time_signatures))
 
+    def process_events(self, events: ScoreEvents) -> list[str]:
+        return sorted({ts for part in events.parts for ts in part.time_signatures})
+
 
 class TempoProcessor(MusicXMLProcessor):
     """Get the tempo of the song."""
@@ -80,6 +119,12 @@ class TempoProcessor(MusicXMLProcessor):
             tempo_str = None
         return tempo_str
 
+    def process_events(self, events: ScoreEvents) -> str:
+        tempo_numbers = [number for part in events.parts for number in part.tempos]
+        if len(tempo_numbers) == 0 or tempo_numbers[0] is None:
+            return None
+        return str(tempo_numbers[0])
+
 
 class AmbitusProcessor(MusicXMLProcessor):
     """Gets the 'ambitus' of a song. This is the range of the song."""
@@ -120,6 +165,22 @@ class AmbitusProcessor(MusicXMLProcessor):
 
         return result
 
+    def process_events(self, events: ScoreEvents):
+        pitches = [
+            event.pitches[0]
+            for part in events.parts
+            for event in part.notes
+            if event.is_note
+        ]
+        # C8 and A0, like in process
+        min_note = min(pitches + [108])
+        max_note = max(pitches + [21])
+        return {
+            "min_note": min_note,
+            "max_note": max_note,
+            "ambitus_semitones": max_note - min_note,
+        }
+
 
 class MetadataProcessor(MusicXMLProcessor):
     """Gets the metadata of a song."""
@@ -165,3 +226,6 @@ class DurationProcessor(MusicXMLProcessor):
             if x.measureNumber is not None and x.measureNumber > measures:
                 measures = x.measureNumber
         return {"measures": measures, "beats": beats}
+
+    def process_events(self, events: ScoreEvents):
+        return {"measures": events.max_measure_number, "beats": events.highest_time}
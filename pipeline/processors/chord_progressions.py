@@ -0,0 +1,86 @@
+"""
+Roman numerals of recognized chords relative to the key of the recording, so the same progression has the same
+tokens in every key, e.g. ii V I.
+
+Progression queries in the web app are written with the same numerals, e.g. ii V I, or i VI VII in minor keys.
+"""
+
+PITCH_CLASSES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+# numerals of the semitones above the tonic, relative to the major or the natural minor scale
+NUMERALS = {
+    "major": [
+        "I",
+        "bII",
+        "II",
+        "bIII",
+        "III",
+        "IV",
+        "#IV",
+        "V",
+        "bVI",
+        "VI",
+        "bVII",
+        "VII",
+    ],
+    "minor": [
+        "I",
+        "bII",
+        "II",
+        "III",
+        "#III",
+        "IV",
+        "#IV",
+        "V",
+        "VI",
+        "#VI",
+        "VII",
+        "#VII",
+    ],
+}
+
+
+def pitch_class(note: str) -> int:
+    """Returns the pitch class of a note name like C, F# or Bb, raises ValueError for anything else."""
+    if len(note) == 0 or note[0].upper() not in PITCH_CLASSES:
+        raise ValueError(f"Unknown note {note}")
+    accidentals = note[1:]
+    if accidentals.strip("#b") != "":
+        raise ValueError(f"Unknown note {note}")
+    return (
+        PITCH_CLASSES[note[0].upper()] + accidentals.count("#") - accidentals.count("b")
+    ) % 12
+
+
+def roman_numeral(chord: str, key: str, scale: str) -> str:
+    """
+    Returns the numeral of a chord label like A:min in the key, uppercase for major and lowercase for minor chords,
+    or None for labels without a chord (N) or with an unknown root.
+    """
+    root, _, quality = chord.partition(":")
+    try:
+        degree = (pitch_class(root) - pitch_class(key)) % 12
+    except ValueError:
+        return None
+    numeral = NUMERALS["minor" if scale == "minor" else "major"][degree]
+    if quality.startswith("min"):
+        return numeral.lower()
+    if quality.startswith("dim"):
+        return numeral.lower() + "o"
+    if quality.startswith("aug"):
+        return numeral + "+"
+    return numeral
+
+
+def roman_numerals(chord_names: list[str], key: str, scale: str) -> list[str]:
+    """
+    Returns the progression of the chords in the key. Stretches without a chord are left out and repeated chords
+    are collapsed, a chord recognized over several segments is one chord of the progression.
+    """
+    progression = []
+    for chord in chord_names:
+        numeral = roman_numeral(chord, key, scale)
+        if numeral is not None and (
+            len(progression) == 0 or progression[-1] != numeral
+        ):
+            progression.append(numeral)
+    return progression
@@ -1,6 +1,8 @@
 import music21
 
 from processors.musicxml_processor import MusicXMLProcessor
+from processors.musicxml_reader import ScoreEvents
+from processors.shingles import hashed_shingles
 
 
 class ContourProcessor(MusicXMLProcessor):
@@ -21,10 +23,13 @@ class ContourProcessor(MusicXMLProcessor):
                     "fields": {"keyword": {"type": "keyword", "ignore_above": 8192}},
                 },
                 "measure_starts": {"type": "long"},
+                "measure_numbers": {"type": "long"},
                 "melodic_contour_string_absolute": {
                     "type": "text",
                     "fields": {"keyword": {"type": "keyword", "ignore_above": 8192}},
                 },
+                # hashed n-grams of the relative intervals, only used for lookups
+                "melodic_contour_shingles": {"type": "keyword", "doc_values": False},
             }
         }
 
@@ -50,7 +55,6 @@ class ContourProcessor(MusicXMLProcessor):
                 pitch_values.append(note)
                 beats.append(x.beat)
         melodic_contour = []
-        melodic_contour_string = ""
         for i in range(len(pitch_values) - 1):
             pitch_interval = music21.interval.Interval(
                 pitch_values[i], pitch_values[i + 1]
@@ -58,36 +62,66 @@ class ContourProcessor(MusicXMLProcessor):
             semi = pitch_interval.semitones
             melodic_contour.append(semi)
 
-        melodic_contour_string_absolute = " ".join(
-            [str(x.pitch.midi) for x in pitch_values]
+        return contour_result(
+            melodic_contour, [x.pitch.midi for x in pitch_values], measure_numbers
         )
 
-        melodic_contour_string = ""
-        for x in melodic_contour:
-            if x > 0:
-                melodic_contour_string += "U"
-            elif x < 0:
-                melodic_contour_string += "D"
-            else:
-                melodic_contour_string += "S"
-            melodic_contour_string += (
-                " "  # this is here so we can better search for the contour
-            )
-
-        measure_starts = [
-            i
-            for i in range(len(pitch_values))
-            if measure_numbers[i] != measure_numbers[i - 1]
+    def process_events(self, events: ScoreEvents):
+        pitch_values = []
+        measure_numbers = []
+        beats = []
+        for event in events.parts[0].notes:
+            if (
+                len(measure_numbers) != 0
+                and measure_numbers[-1] == event.measure_number
+                and beats[-1] is not None
+                and beats[-1] == event.beat
+            ):
+                continue  # prevents adding two notes that are played at the same time
+            if event.is_note or event.is_chord:
+                # the highest note of chords
+                pitch_values.append(event.pitches[-1])
+                measure_numbers.append(event.measure_number)
+                beats.append(event.beat)
+
+        melodic_contour = [
+            pitch_values[i + 1] - pitch_values[i] for i in range(len(pitch_values) - 1)
         ]
+        return contour_result(melodic_contour, pitch_values, measure_numbers)
+
+
+def contour_result(
+    melodic_contour: list[int], midi_values: list[int], measure_numbers: list[int]
+) -> dict:
+    """Builds the contour strings from the intervals and MIDI numbers of the melody."""
+    melodic_contour_string_absolute = " ".join([str(x) for x in midi_values])
+
+    melodic_contour_string = ""
+    for x in melodic_contour:
+        if x > 0:
+            melodic_contour_string += "U"
+        elif x < 0:
+            melodic_contour_string += "D"
+        else:
+            melodic_contour_string += "S"
+        melodic_contour_string += (
+            " "  # this is here so we can better search for the contour
+        )
 
-        return {
-            "melodic_contour_string_relative": " ".join(
-                [str(x) for x in melodic_contour]
-            ),
-            "melodic_contour_string": melodic_contour_string,
-            "melodic_contour_string_absolute": melodic_contour_string_absolute,
-            "measure_starts": measure_starts,
-        }
+    measure_starts = [
+        i
+        for i in range(len(midi_values))
+        if measure_numbers[i] != measure_numbers[i - 1]
+    ]
+
+    return {
+        "melodic_contour_string_relative": " ".join([str(x) for x in melodic_contour]),
+        "melodic_contour_string": melodic_contour_string,
+        "melodic_contour_string_absolute": melodic_contour_string_absolute,
+        "measure_starts": measure_starts,
+        "measure_numbers": [measure_numbers[i] for i in measure_starts],
+        "melodic_contour_shingles": hashed_shingles([str(x) for x in melodic_contour]),
+    }
 
 
 class RhythmProcessor(MusicXMLProcessor):
@@ -100,6 +134,7 @@ class RhythmProcessor(MusicXMLProcessor):
         self.mapping = {
             "properties": {
                 "measure_starts": {"type": "long"},
+                "measure_numbers": {"type": "long"},
                 "rhythm_string": {
                     "type": "text",
                     "fields": {"keyword": {"type": "keyword", "ignore_above": 8192}},
@@ -109,6 +144,8 @@ class RhythmProcessor(MusicXMLProcessor):
                     "fields": {"keyword": {"type": "keyword", "ignore_above": 8192}},
                 },
                 "num_rests": {"type": "long"},
+                # hashed n-grams of the durations, only used for lookups
+                "rhythm_shingles": {"type": "keyword", "doc_values": False},
             }
         }
 
@@ -149,18 +186,65 @@ class RhythmProcessor(MusicXMLProcessor):
             if not is_rest:
                 rhythm_numeric_no_rests.append(duration_string)
 
-        rhythm_string = " ".join([str(x) for x in rhythm_numeric])
-        rhythm_string_no_rests = " ".join([str(x) for x in rhythm_numeric_no_rests])
-        return {
-            "rhythm_string": rhythm_string,
-            "rhythm_string_no_rests": rhythm_string_no_rests,
-            "measure_starts": [
-                i
-                for i in range(len(rhythm_numeric))
-                if measure_numbers[i] != measure_numbers[i - 1]
-            ],
-            "num_rests": num_rests,
-        }
+        return rhythm_result(
+            rhythm_numeric, rhythm_numeric_no_rests, measure_numbers, num_rests
+        )
+
+    def process_events(self, events: ScoreEvents):
+        rhythm_numeric = []
+        rhythm_numeric_no_rests = []
+        measure_numbers = []
+        beats = []
+        num_rests = 0
+        for event in events.parts[0].notes:
+            if (
+                len(measure_numbers) != 0
+                and measure_numbers[-1] == event.measure_number
+                and beats[-1] is not None
+                and beats[-1] == event.beat
+            ):
+                continue  # prevents adding two notes that are played at the same time
+            if event.is_rest:
+                num_rests += 1
+            elif not (event.is_note or event.is_chord):
+                continue
+
+            # the notes of a chord have no beat, so music21 never skips the element after a chord
+            beats.append(None if event.is_chord else event.beat)
+            measure_numbers.append(event.measure_number)
+            fraction = event.quarter_length.as_integer_ratio()
+            duration_string = f"{fraction[0]}/{fraction[1]}"
+            rhythm_numeric.append(duration_string)
+            if not event.is_rest:
+                rhythm_numeric_no_rests.append(duration_string)
+
+        return rhythm_result(
+            rhythm_numeric, rhythm_numeric_no_rests, measure_numbers, num_rests
+        )
+
+
+def rhythm_result(
+    rhythm_numeric: list[str],
+    rhythm_numeric_no_rests: list[str],
+    measure_numbers: list[int],
+    num_rests: int,
+) -> dict:
+    """Builds the rhythm strings from the durations of the melody."""
+    rhythm_string = " ".join([str(x) for x in rhythm_numeric])
+    rhythm_string_no_rests = " ".join([str(x) for x in rhythm_numeric_no_rests])
+    measure_starts = [
+        i
+        for i in range(len(rhythm_numeric))
+        if measure_numbers[i] != measure_numbers[i - 1]
+    ]
+    return {
+        "rhythm_string": rhythm_string,
+        "rhythm_string_no_rests": rhythm_string_no_rests,
+        "measure_starts": measure_starts,
+        "measure_numbers": [measure_numbers[i] for i in measure_starts],
+        "num_rests": num_rests,
+        "rhythm_shingles": hashed_shingles(rhythm_numeric),
+    }
 
 
 class NGramRhythmProcessor(MusicXMLProcessor):
@@ -0,0 +1,64 @@
+import music21
+
+from processors.basic_processors import TimeSignatureProcessor
+from processors.contour_processor import ContourProcessor, RhythmProcessor
+from processors.musicxml_processor import MusicXMLProcessor
+
+# Time signatures allowed by the simple rhythm filters
+DUPLE_TIME_SIGNATURES = {"2/4", "4/4", "2/2"}
+
+
+class EducationalProcessor(MusicXMLProcessor):
+    """
+    Precomputes the features used by the educational filters in the web app, so they can be searched with
+    simple term and range queries instead of regular expressions and scripts.
+    """
+
+    song: music21.stream.Stream
+
+    def __init__(self, song: music21.stream.Stream, feature_name="educational"):
+        super().__init__(song, feature_name)
+        self.c_processor = ContourProcessor(song)
+        self.r_processor = RhythmProcessor(song)
+        self.ts_processor = TimeSignatureProcessor(song)
+        self.mapping = {
+            "properties": {
+                "max_abs_interval": {"type": "long"},
+                "interval_sizes": {"type": "long"},
+                "consecutive_semitones": {"type": "boolean"},
+                "quarter_eighth_ratio": {"type": "float"},
+                "quarter_eighth_half_ratio": {"type": "float"},
+                "time_signature_count": {"type": "long"},
+                "duple_time_signatures": {"type": "boolean"},
+            }
+        }
+
+    def process(self):
+        contour = self.c_processor.process()["melodic_contour_string_relative"]
+        intervals = [int(x) for x in contour.split()]
+        durations = self.r_processor.process()["rhythm_string_no_rests"].split()
+        time_signatures = self.ts_processor.process()
+
+        return {
+            "max_abs_interval": max([abs(x) for x in intervals], default=None),
+            "interval_sizes": sorted(set(abs(x) for x in intervals)),
+            # two semitone steps in a row in the same direction
+            "consecutive_semitones": any(
+                abs(a) == 1 and a == b for a, b in zip(intervals, intervals[1:])
+            ),
+            "quarter_eighth_ratio": duration_ratio(durations, {"1/1", "1/2"}),
+            "quarter_eighth_half_ratio": duration_ratio(
+                durations, {"1/1", "1/2", "2/1"}
+            ),
+            "time_signature_count": len(time_signatures),
+            "duple_time_signatures": all(
+                x in DUPLE_TIME_SIGNATURES for x in time_signatures
+            ),
+        }
+
+
+def duration_ratio(durations: list[str], allowed: set[str]):
+    """Returns the share of the durations that are in the allowed set or None if there are no durations."""
+    if len(durations) == 0:
+        return None
+    return sum(1 for x in durations if x in allowed) / len(durations)
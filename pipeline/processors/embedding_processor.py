@@ -0,0 +1,161 @@
+"""
+Fixed-length feature vectors of the songs. They are indexed as dense_vector fields with HNSW, so similar songs
+can be found with an approximate kNN query instead of comparing the songs on the client.
+"""
+
+import music21
+import numpy as np
+
+from processors import pcm_cache
+from processors.audio_processors import AudioProcessor, AudioRMSProcessor
+from processors.basic_processors import song_pitch_class_histogram
+from processors.contour_processor import ContourProcessor, RhythmProcessor
+from processors.musicxml_processor import MusicXMLProcessor
+
+# intervals larger than an octave are counted in the outermost bins
+MAX_INTERVAL = 12
+# log2 of the quarter length of the duration bins, from a 32nd note to a breve
+DURATION_BINS = np.arange(-3, 4)
+MUSICXML_DIMS = (2 * MAX_INTERVAL + 1) + 12 + len(DURATION_BINS)
+
+# mean and standard deviation of the chroma and 4 loudness statistics
+AUDIO_DIMS = 12 + 12 + 4
+# loudness below this is treated as silence
+MIN_LOUDNESS_DB = -60.0
+
+
+def dense_vector_mapping(dims: int) -> dict:
+    return {
+        "properties": {
+            "vector": {
+                "type": "dense_vector",
+                "dims": dims,
+                "index": True,
+                "similarity": "cosine",
+                "index_options": {"type": "hnsw", "m": 16, "ef_construction": 100},
+            }
+        }
+    }
+
+
+def normalize_histogram(histogram) -> np.ndarray:
+    """Scales the histogram so it sums to 1, so the blocks of the vector have the same weight."""
+    histogram = np.asarray(histogram, dtype=np.float64)
+    total = histogram.sum()
+    return histogram / total if total > 0 else histogram
+
+
+def unit_vector(vector: np.ndarray):
+    """Returns the vector with unit length as a list or None if it is all zeros, since cosine can't compare those."""
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return None
+    return np.round(vector / norm, 6).tolist()
+
+
+class MusicXMLEmbeddingProcessor(MusicXMLProcessor):
+    """
+    Combines the interval histogram, the pitch-class profile and the rhythm-duration histogram of the song into
+    a single vector.
+    """
+
+    song: music21.stream.Stream
+
+    def __init__(self, song: music21.stream.Stream, feature_name="embedding"):
+        super().__init__(song, feature_name)
+        self.c_processor = ContourProcessor(song)
+        self.r_processor = RhythmProcessor(song)
+        self.mapping = dense_vector_mapping(MUSICXML_DIMS)
+
+    def process(self):
+        contour = self.c_processor.process()["melodic_contour_string_relative"]
+        intervals = np.clip(
+            [int(x) for x in contour.split()], -MAX_INTERVAL, MAX_INTERVAL
+        )
+        interval_histogram = np.bincount(
+            intervals.astype(np.int64) + MAX_INTERVAL, minlength=2 * MAX_INTERVAL + 1
+        )
+
+        pitch_class_profile = song_pitch_class_histogram(self.song)
+
+        durations = self.r_processor.process()["rhythm_string_no_rests"].split()
+        quarter_lengths = [
+            int(x.split("/")[0]) / int(x.split("/")[1]) for x in durations
+        ]
+        duration_histogram = np.zeros(len(DURATION_BINS))
+        for quarter_length in quarter_lengths:
+            if quarter_length <= 0:
+                continue  # grace notes
+            exponent = np.clip(
+                np.round(np.log2(quarter_length)), DURATION_BINS[0], DURATION_BINS[-1]
+            )
+            duration_histogram[int(exponent - DURATION_BINS[0])] += 1
+
+        vector = np.concatenate(
+            [
+                normalize_histogram(interval_histogram),
+                normalize_histogram(pitch_class_profile),
+                normalize_histogram(duration_histogram),
+            ]
+        )
+        return {"vector": unit_vector(vector)}
+
+
+class AudioEmbeddingProcessor(AudioProcessor):
+    """Combines the mean and deviation of the chroma with the loudness statistics of the song into a single vector."""
+
+    def __init__(self, song: any, profile: str = None):
+        super().__init__(
+            song, "chroma_loudness", "embedding", profile=profile, profiled=True
+        )
+        self.mapping = dense_vector_mapping(AUDIO_DIMS)
+
+    def chroma(self):
+        import essentia.standard as es
+
+        sample_rate = self.settings["chroma_sample_rate"]
+        audio = pcm_cache.load_mono(self.song, sample_rate)
+        window = es.Windowing(type="blackmanharris62")
+        spectrum = es.Spectrum()
+        spectral_peaks = es.SpectralPeaks(
+            orderBy="magnitude",
+            magnitudeThreshold=0.00001,
+            minFrequency=20,
+            maxFrequency=3500,
+            maxPeaks=60,
+            sampleRate=sample_rate,
+        )
+        hpcp = es.HPCP(size=12, referenceFrequency=440, sampleRate=sample_rate)
+
+        frames = []
+        for frame in es.FrameGenerator(audio, frameSize=4096, hopSize=2048):
+            frequencies, magnitudes = spectral_peaks(spectrum(window(frame)))
+            frames.append(hpcp(frequencies, magnitudes))
+        if len(frames) == 0:
+            return np.zeros((1, 12))
+        # essentia starts the HPCP at A, rotate it so the first bin is C like the MusicXML pitch-class profile
+        return np.roll(np.asarray(frames), -3, axis=1)
+
+    def process(self):
+        chroma = self.chroma()
+
+        rms_values, _ = AudioRMSProcessor(self.song).rms(self.song)
+        rms_values = np.asarray(rms_values, dtype=np.float64)
+        if len(rms_values) == 0:
+            rms_values = np.zeros(1)
+        loudness_db = 20 * np.log10(
+            np.maximum(rms_values, 10 ** (MIN_LOUDNESS_DB / 20))
+        )
+        # scale the loudness to [0, 1] so it is comparable with the chroma
+        loudness = (loudness_db - MIN_LOUDNESS_DB) / -MIN_LOUDNESS_DB
+        loudness_statistics = [
+            loudness.mean(),
+            loudness.std(),
+            np.percentile(loudness, 10),
+            np.percentile(loudness, 90),
+        ]
+
+        vector = np.concatenate(
+            [chroma.mean(axis=0), chroma.std(axis=0), loudness_statistics]
+        )
+        return {"vector": unit_vector(vector)}
@@ -1,5 +1,6 @@
 import music21
 from processors.base_processor import BaseProcessor
+from processors.musicxml_reader import ScoreEvents
 
 
 class MusicXMLProcessor(BaseProcessor):
@@ -25,6 +26,18 @@ class MusicXMLProcessor(BaseProcessor):
         """The main function of the processor. It should spit out the results in dictionary format or a single value."""
         raise NotImplementedError
 
+    def process_events(self, events: ScoreEvents):
+        """
+        Same as process, but computed from the note events of the streaming reader instead of the music21 stream.
+        Only processors that need nothing more than the notes, measures, time signatures and tempos implement it.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def supports_events(cls) -> bool:
+        """Whether the processor can run on the note events without parsing the file with music21."""
+        return cls.process_events is not MusicXMLProcessor.process_events
+
     def get_feature_name(self):
         """Returns the name of the processor."""
         return self.feature_name
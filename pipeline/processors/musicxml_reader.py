@@ -0,0 +1,667 @@
+"""
+Streaming MusicXML reader for the processors that only need the notes, measures, time signatures and tempos of a
+score. The file is read measure by measure with iterparse and every measure is dropped once it's read, instead of
+building the music21 object tree. Offsets, durations and the order of the notes follow music21's MusicXML import,
+so the processors return the same results either way. Constructs the reader doesn't model raise
+UnsupportedMusicXML, and the caller parses the file with music21 instead.
+"""
+
+import bisect
+import copy
+from fractions import Fraction
+from functools import lru_cache
+
+from music21.common import getNumFromStr, nearestMultiple, numToIntOrFloat, opFrac
+from music21.defaults import divisionsPerQuarter
+
+try:
+    from lxml.etree import iterparse
+
+    ITERPARSE_OPTIONS = {"resolve_entities": False, "huge_tree": True}
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+    ITERPARSE_OPTIONS = {}
+
+STEP_PITCH_CLASSES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+# alter of an <accidental> without an <alter>
+ACCIDENTAL_ALTERS = {
+    "natural": 0,
+    "sharp": 1,
+    "flat": -1,
+    "double-sharp": 2,
+    "sharp-sharp": 2,
+    "flat-flat": -2,
+    "double-flat": -2,
+    "natural-sharp": 1,
+    "natural-flat": -1,
+}
+# directions that music21 inserts into the measure, spanners like wedges are kept in the part
+DIRECTION_ELEMENTS = {"dynamics", "coda", "segno", "metronome", "rehearsal", "words"}
+ATTRIBUTE_ELEMENTS = {"clef", "key", "time"}
+DEFAULT_BAR_LENGTH = 4.0
+
+
+class UnsupportedMusicXML(ValueError):
+    """The file uses a construct the streaming reader doesn't model, it has to be parsed with music21."""
+
+
+class NoteEvent:
+    """
+    A note, chord, rest or unpitched note of a part. pitches are the pitch space values of the notes, beat is
+    music21's beat, None where music21's is NaN.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        measure_number: int,
+        measure_offset,
+        quarter_length,
+        pitches: list[float] = None,
+        grace: bool = False,
+    ):
+        self.kind = kind
+        self.measure_number = measure_number
+        self.measure_offset = measure_offset
+        self.quarter_length = quarter_length
+        self.pitches = pitches or []
+        self.grace = grace
+        # staff in the part, 0 for notes on every staff
+        self.staff = 0
+        self.measure_index = None
+        self.padding = 0.0
+        self.offset = None
+        # offset of the next measure, None in the last measure
+        self.measure_end = None
+        self.in_voice = False
+        self.beat = None
+        # position in music21's flattened part
+        self.sort_key = None
+
+    @property
+    def is_note(self) -> bool:
+        return self.kind == "note"
+
+    @property
+    def is_chord(self) -> bool:
+        return self.kind == "chord"
+
+    @property
+    def is_rest(self) -> bool:
+        return self.kind == "rest"
+
+
+class PartEvents:
+    """The notes of a part in the order of music21's flattened part, with its time signatures and tempos."""
+
+    def __init__(self):
+        self.notes: list[NoteEvent] = []
+        # ratio strings of the time signatures at the start of measures
+        self.time_signatures: list[str] = []
+        # numbers of the metronome marks in the order music21 finds them, None for marks without one
+        self.tempos: list = []
+        self.highest_time = 0.0
+        self.max_measure_number = 0
+
+
+class ScoreEvents:
+    def __init__(self, parts: list[PartEvents]):
+        self.parts = parts
+
+    @property
+    def highest_time(self):
+        return opFrac(max((part.highest_time for part in self.parts), default=0.0))
+
+    @property
+    def max_measure_number(self) -> int:
+        return max((part.max_measure_number for part in self.parts), default=0)
+
+
+def read_musicxml(path: str) -> ScoreEvents:
+    """Reads the note events of a partwise MusicXML file."""
+    parts = []
+    part = None
+    root = None
+    # music21 applies its Finale workarounds if the first software is Finale
+    finale = None
+    for event, element in iterparse(path, events=("start", "end"), **ITERPARSE_OPTIONS):
+        tag = element.tag
+        if event == "start":
+            if root is None:
+                root = tag
+                if root != "score-partwise":
+                    raise UnsupportedMusicXML(f"Unsupported root element: {root}")
+            elif tag == "part":
+                part = _PartReader(finale=bool(finale))
+        elif tag == "measure" and part is not None:
+            part.read_measure(element)
+            _release(element)
+        elif tag == "part" and part is not None:
+            parts.extend(part.finish())
+            part = None
+            _release(element)
+        elif tag == "software" and finale is None and _text(element):
+            finale = "Finale" in _text(element)
+
+    if not parts:
+        raise UnsupportedMusicXML("The score has no parts")
+    return ScoreEvents(parts)
+
+
+@lru_cache(maxsize=None)
+def _time_signature(ratio: str):
+    from music21.meter import TimeSignature
+
+    return TimeSignature(ratio)
+
+
+@lru_cache(maxsize=4096)
+def _beat(ratio: str, position):
+    """music21's beat of a position in a bar of the time signature."""
+    return _time_signature(ratio).getBeatProportion(position)
+
+
+def _release(element):
+    """Frees an element that was read, including the references lxml keeps to its previous siblings."""
+    element.clear()
+    if hasattr(element, "getprevious"):
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def _text(element) -> str:
+    if element is None or element.text is None:
+        return ""
+    return element.text.strip()
+
+
+def _quarter_length(element, divisions):
+    text = _text(element.find("duration"))
+    if not text:
+        return 0.0
+    return opFrac(float(text) / divisions)
+
+
+def _pitch_space(note) -> float:
+    mx_pitch = note.find("pitch")
+    if mx_pitch is None:
+        raise UnsupportedMusicXML("Note without a pitch")
+    step = _text(mx_pitch.find("step")) or "C"
+    octave = _text(mx_pitch.find("octave"))
+    alter_text = _text(mx_pitch.find("alter"))
+    accidental = _text(note.find("accidental"))
+    if alter_text:
+        alter = float(alter_text)
+    elif accidental:
+        if accidental not in ACCIDENTAL_ALTERS:
+            raise UnsupportedMusicXML(f"Unsupported accidental: {accidental}")
+        alter = ACCIDENTAL_ALTERS[accidental]
+    else:
+        alter = 0
+    if alter != int(alter):
+        raise UnsupportedMusicXML("Microtonal pitches are not supported")
+    ps = 12 * (int(octave or 4) + 1) + STEP_PITCH_CLASSES[step.upper()] + int(alter)
+    if not 0 <= ps <= 127:
+        raise UnsupportedMusicXML("Pitch out of the MIDI range")
+    return ps
+
+
+class _PartReader:
+    """
+    Keeps the state music21's PartParser carries from one measure to the next. Parts with more than one staff are
+    split into a part for every staff, like music21's PartStaffs.
+    """
+
+    def __init__(self, finale: bool):
+        self.finale = finale
+        self.divisions = divisionsPerQuarter
+        # bar length of the last time signature, music21 assumes 4/4 without one
+        self.bar_length = None
+        self.measure_offset = 0.0
+        self.last_measure_was_short = False
+        self.measure_index = 0
+        self.notes: list[NoteEvent] = []
+        # (offset, staff, bar length, ratio string) of the time signatures
+        self.time_signatures = []
+        # (measure index, offset, sequence, staff, number) of the metronome marks
+        self.tempos = []
+        self.highest_time = 0.0
+        self.max_measure_number = 0
+        self.staves = 1
+        self.staff_keys = set()
+
+    def read_measure(self, measure):
+        number, suffix = getNumFromStr(measure.get("number") or "")
+        if suffix == "X":
+            raise UnsupportedMusicXML("Finale's unnumbered measures are not supported")
+        number = int(number) if number else 0
+        reader = _MeasureReader(self, measure, number)
+        reader.read()
+
+        # setLastMeasureInfo
+        if reader.time_signature is not None:
+            staff, bar_length, ratio = reader.time_signature
+            self.bar_length = bar_length
+            self.time_signatures.append((self.measure_offset, staff, bar_length, ratio))
+        elif self.bar_length is None:
+            self.bar_length = DEFAULT_BAR_LENGTH
+
+        if reader.full_measure_rest:
+            reader.fill_rest(self.bar_length)
+
+        # adjustTimeAttributesFromMeasure
+        highest_time = reader.highest_time()
+        padding = 0.0
+        if highest_time == self.bar_length:
+            shift = highest_time
+        elif highest_time > self.bar_length:
+            diff = highest_time - self.bar_length
+            if (
+                diff > 0.5
+                or nearestMultiple(diff, 0.0625)[1] < 1e-6
+                or nearestMultiple(diff, 1 / 12)[1] < 1e-6
+            ):
+                shift = highest_time
+            else:
+                shift = self.bar_length
+        elif highest_time == 0.0 and not reader.notes:
+            reader.add(NoteEvent("rest", number, 0.0, self.bar_length), 0, 0)
+            highest_time = self.bar_length
+            shift = self.bar_length
+            self.last_measure_was_short = False
+        else:
+            shift = highest_time
+            short = highest_time < self.bar_length
+            if self.measure_offset == 0.0:
+                if short:
+                    padding = opFrac(self.bar_length - highest_time)
+            elif self.last_measure_was_short:
+                if short:
+                    padding = opFrac(self.bar_length - highest_time)
+                    self.last_measure_was_short = False
+            else:
+                self.last_measure_was_short = short
+
+        for index, event in enumerate(reader.notes):
+            event.offset = opFrac(self.measure_offset + event.measure_offset)
+            event.padding = padding
+            event.sort_key = (
+                event.offset,
+                not event.grace,
+                self.measure_index,
+                reader.voice_ranks[index],
+                index,
+            )
+        self.notes.extend(reader.notes)
+        for offset, sequence, staff, tempo_number in reader.tempos:
+            self.tempos.append(
+                (self.measure_index, offset, sequence, staff, tempo_number)
+            )
+        self.highest_time = max(
+            self.highest_time, opFrac(self.measure_offset + highest_time)
+        )
+        self.max_measure_number = max(self.max_measure_number, number)
+
+        self.measure_offset = opFrac(self.measure_offset + shift)
+        self.measure_index += 1
+        for event in reader.notes:
+            event.measure_end = self.measure_offset
+
+    def finish(self) -> list[PartEvents]:
+        if self.staves > 1:
+            return [self.get_staff(staff) for staff in sorted(self.staff_keys)]
+        return [self.get_staff(None)]
+
+    def get_staff(self, staff: int) -> PartEvents:
+        """The events of a staff, elements without a staff are on every staff. None takes the whole part."""
+
+        def on_staff(key: int) -> bool:
+            return staff is None or key in (0, staff)
+
+        events = PartEvents()
+        events.highest_time = self.highest_time
+        events.max_measure_number = self.max_measure_number
+        time_signatures = [ts for ts in self.time_signatures if on_staff(ts[1])]
+        events.time_signatures = [ratio for _, _, _, ratio in time_signatures]
+        events.tempos = [
+            tempo[-1] for tempo in sorted(self.tempos) if on_staff(tempo[3])
+        ]
+
+        time_signature_offsets = [ts[0] for ts in time_signatures]
+        last_measure = self.measure_index - 1
+        for event in self.notes:
+            if not on_staff(event.staff):
+                continue
+            if staff is not None and event.staff == 0:
+                event = copy.copy(event)
+            # the time signature in effect at the offset of the note in the flattened part
+            index = bisect.bisect_right(time_signature_offsets, event.offset) - 1
+            if index >= 0:
+                _, _, bar_length, ratio = time_signatures[index]
+                # music21 takes the offset in the flattened part when the measure found at the offset of the note
+                # doesn't contain it directly: notes in voices, and notes at the end of their measure
+                if event.in_voice or (
+                    event.measure_index < last_measure
+                    and event.offset >= event.measure_end
+                ):
+                    position = event.offset
+                else:
+                    position = opFrac(event.measure_offset + event.padding)
+                if position >= bar_length:
+                    position = opFrac(position % bar_length)
+                event.beat = _beat(ratio, position)
+            events.notes.append(event)
+        events.notes.sort(key=lambda event: event.sort_key)
+        return events
+
+
+class _MeasureReader:
+    """Reads the notes of a measure like music21's MeasureParser."""
+
+    def __init__(self, part: _PartReader, measure, number: int):
+        self.part = part
+        self.measure = measure
+        self.number = number
+        self.offset = 0.0
+        self.notes: list[NoteEvent] = []
+        self.voice_ranks: list[int] = []
+        # (offset, sequence, staff, number) of the metronome marks
+        self.tempos = []
+        # offsets of the other elements music21 inserts, they count toward the length of the measure
+        self.element_offsets = []
+        self.time_signature = None
+        self.rest_count = 0
+        self.note_count = 0
+        self.full_measure_rest = False
+        # (event, full measure, type, dots, tuplets) of the rests
+        self.rests = []
+
+        voices = set()
+        for tag in ("note", "forward"):
+            for element in measure.findall(tag):
+                voice = _text(element.find("voice"))
+                if voice:
+                    voices.add(voice)
+        self.use_voices = len(voices) > 1
+        self.voices = {voice: rank for rank, voice in enumerate(sorted(voices))}
+        self.last_voice = None
+
+    def read(self):
+        for mx_print in self.measure.findall("print"):
+            for layout in mx_print.findall("staff-layout"):
+                self.add_staff(layout.get("number"), None)
+        elements = list(self.measure)
+        chord = []
+        for index, element in enumerate(elements):
+            tag = element.tag
+            if tag == "note":
+                next_element = (
+                    elements[index + 1] if index + 1 < len(elements) else None
+                )
+                next_is_chord = (
+                    next_element is not None
+                    and next_element.tag == "note"
+                    and next_element.find("chord") is not None
+                )
+                self.read_note(element, chord, next_is_chord)
+            elif tag == "backup":
+                text = _text(element.find("duration"))
+                if text:
+                    offset = opFrac(self.offset - float(text) / self.part.divisions)
+                    self.offset = max(offset, 0.0)
+            elif tag == "forward":
+                text = _text(element.find("duration"))
+                if text:
+                    if self.part.finale:
+                        raise UnsupportedMusicXML(
+                            "Forwards in Finale files are not supported"
+                        )
+                    self.offset = opFrac(
+                        self.offset + float(text) / self.part.divisions
+                    )
+            elif tag == "direction":
+                self.read_direction(element)
+            elif tag == "attributes":
+                self.read_attributes(element)
+            elif tag == "sound":
+                self.read_sound(
+                    element, self.offset + self.direction_offset(element), 0
+                )
+            elif tag == "harmony":
+                raise UnsupportedMusicXML("Chord symbols are not supported")
+
+        self.full_measure_rest = self.full_measure_rest or (
+            self.rest_count == 1 and self.note_count == 0
+        )
+
+    def add_staff(self, number: str, default: int) -> int:
+        """Returns the staff of an element and adds it to the staves of the part, 0 for elements on every staff."""
+        try:
+            staff = int(number) if number is not None else default
+        except ValueError:
+            staff = default
+        if staff is None:
+            return 0
+        if staff != 0:
+            self.part.staff_keys.add(staff)
+        return staff
+
+    def element_staff(self, element) -> int:
+        return self.add_staff(_text(element.find("staff")) or None, 0)
+
+    def read_note(self, note, chord: list, next_is_chord: bool):
+        is_rest = note.find("rest") is not None
+        is_chord = note.find("chord") is not None or next_is_chord
+        if next_is_chord:
+            voice = _text(note.find("voice"))
+            if voice:
+                self.last_voice = voice
+
+        increment = 0.0
+        if is_chord:
+            if is_rest:
+                raise UnsupportedMusicXML("Rests in chords are not supported")
+            chord.append(note)
+        elif is_rest:
+            self.rest_count += 1
+            event = NoteEvent(
+                "rest",
+                self.number,
+                self.offset,
+                _quarter_length(note, self.part.divisions),
+            )
+            self.read_rest(note, event)
+            self.insert(note, event, self.element_staff(note))
+            increment = event.quarter_length
+        else:
+            self.note_count += 1
+            event = self.simple_note(note)
+            self.insert(note, event, self.element_staff(note))
+            increment = event.quarter_length
+
+        if chord and not next_is_chord:
+            notes = [self.simple_note(member) for member in chord]
+            if any(n.quarter_length != notes[0].quarter_length for n in notes) or any(
+                n.grace != notes[0].grace for n in notes
+            ):
+                raise UnsupportedMusicXML(
+                    "Chords with notes of different lengths are not supported"
+                )
+            kind = "chord"
+            if any(n.kind == "unpitched" for n in notes):
+                kind = "percussion_chord"
+            event = NoteEvent(
+                kind,
+                self.number,
+                self.offset,
+                notes[0].quarter_length,
+                sorted(p for n in notes for p in n.pitches),
+                notes[0].grace,
+            )
+            voiced = next((m for m in chord if m.find("voice") is not None), note)
+            self.insert(voiced, event, self.element_staff(chord[0]))
+            increment = event.quarter_length
+            chord.clear()
+
+        self.offset = opFrac(self.offset + increment)
+
+    def simple_note(self, note) -> NoteEvent:
+        grace = note.find("grace") is not None
+        quarter_length = 0.0 if grace else _quarter_length(note, self.part.divisions)
+        if note.find("unpitched") is not None:
+            return NoteEvent(
+                "unpitched", self.number, self.offset, quarter_length, grace=grace
+            )
+        return NoteEvent(
+            "note",
+            self.number,
+            self.offset,
+            quarter_length,
+            [_pitch_space(note)],
+            grace,
+        )
+
+    def read_rest(self, note, event: NoteEvent):
+        rest_type = _text(note.find("type"))
+        full_measure = False
+        if note.find("rest").get("measure") == "yes" and rest_type in (
+            "",
+            "whole",
+            "breve",
+        ):
+            self.full_measure_rest = True
+            full_measure = True
+        self.rests.append(
+            (
+                event,
+                full_measure,
+                rest_type,
+                len(note.findall("dot")),
+                note.find("time-modification") is not None,
+            )
+        )
+
+    def insert(self, note, event: NoteEvent, staff: int):
+        rank = 0
+        if self.use_voices:
+            voice = _text(note.find("voice"))
+            if voice:
+                self.last_voice = voice
+            else:
+                voice = self.last_voice or "1"
+            if voice not in self.voices:
+                raise UnsupportedMusicXML(f"Unknown voice {voice}")
+            rank = self.voices[voice]
+            event.in_voice = True
+        self.add(event, rank, staff)
+
+    def add(self, event: NoteEvent, voice_rank: int, staff: int):
+        event.staff = staff
+        event.measure_index = self.part.measure_index
+        self.notes.append(event)
+        self.voice_ranks.append(voice_rank)
+
+    def direction_offset(self, element):
+        text = _text(element.find("offset"))
+        return float(text) / self.part.divisions if text else 0.0
+
+    def read_direction(self, direction):
+        offset = self.offset + self.direction_offset(direction)
+        staff = self.element_staff(direction)
+        metronome = False
+        for direction_type in direction.findall("direction-type"):
+            for element in direction_type:
+                if element.tag in DIRECTION_ELEMENTS:
+                    self.element_offsets.append(offset)
+                if element.tag != "metronome":
+                    continue
+                metronome = True
+                if len(element.findall("beat-unit")) > 1:
+                    # a metric modulation isn't a metronome mark
+                    continue
+                tempo_number = None
+                per_minute = _text(element.find("per-minute"))
+                if per_minute:
+                    try:
+                        tempo_number = numToIntOrFloat(float(per_minute))
+                    except ValueError:
+                        pass
+                self.tempos.append((offset, len(self.tempos), staff, tempo_number))
+        if not metronome:
+            for sound in direction.findall("sound"):
+                if "tempo" in sound.attrib:
+                    self.read_sound(sound, offset, staff)
+                    break
+
+    def read_sound(self, sound, offset, staff: int):
+        if "tempo" not in sound.attrib:
+            return
+        if numToIntOrFloat(float(sound.get("tempo", 0))) == 0:
+            return
+        # music21 only keeps the sounding tempo of <sound>, the mark has no number
+        self.tempos.append((offset, len(self.tempos), staff, None))
+        self.element_offsets.append(offset)
+
+    def read_attributes(self, attributes):
+        for element in attributes:
+            tag = element.tag
+            if tag == "divisions":
+                self.part.divisions = opFrac(float(element.text))
+            elif tag == "staves":
+                self.part.staves = max(self.part.staves, int(element.text))
+            elif tag == "time":
+                self.read_time(element)
+            elif tag in ("clef", "staff-details"):
+                self.add_staff(element.get("number"), 1)
+            elif tag == "key":
+                self.add_staff(element.get("number"), 0)
+            if tag in ATTRIBUTE_ELEMENTS:
+                self.element_offsets.append(self.offset)
+
+    def read_time(self, time):
+        beats = time.findall("beats")
+        beat_types = time.findall("beat-type")
+        if len(beats) != 1 or len(beat_types) != 1:
+            raise UnsupportedMusicXML("Composite time signatures are not supported")
+        if self.offset != 0 or self.time_signature is not None:
+            raise UnsupportedMusicXML(
+                "Time signature changes inside a measure are not supported"
+            )
+        try:
+            numerator = int(_text(beats[0]))
+            denominator = int(_text(beat_types[0]))
+        except ValueError:
+            raise UnsupportedMusicXML("Composite time signatures are not supported")
+        if numerator <= 0 or denominator <= 0:
+            raise UnsupportedMusicXML("Invalid time signature")
+        self.time_signature = (
+            self.add_staff(time.get("number"), 0),
+            opFrac(Fraction(4 * numerator, denominator)),
+            f"{numerator}/{denominator}",
+        )
+
+    def fill_rest(self, bar_length):
+        """Stretches the full measure rest over the bar like music21."""
+        indices = {id(event): index for index, event in enumerate(self.notes)}
+        event, full_measure, rest_type, dots, tuplets = min(
+            self.rests,
+            key=lambda rest: (
+                self.voice_ranks[indices[id(rest[0])]],
+                rest[0].measure_offset,
+                indices[id(rest[0])],
+            ),
+        )
+        if rest_type:
+            whole = rest_type in ("whole", "breve") and dots == 0 and not tuplets
+        else:
+            whole = event.quarter_length in (4.0, 8.0)
+        if full_measure or (event.quarter_length != bar_length and whole):
+            event.quarter_length = bar_length
+
+    def highest_time(self):
+        ends = [
+            opFrac(event.measure_offset + event.quarter_length) for event in self.notes
+        ]
+        offsets = [opFrac(offset) for offset in self.element_offsets]
+        return max(ends + offsets, default=0.0)
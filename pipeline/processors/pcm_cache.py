@@ -0,0 +1,132 @@
+"""
+Opt-in cache of decoded audio. The mono PCM of a file at a sample rate is stored as a .npy file keyed by the file
+hash and the decoder, and read back memory-mapped, so reruns skip decoding and the workers share the pages of the same audio.
+The least recently used arrays are removed when the cache grows over its size limit.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+import metrics
+from helpers import hash_file
+
+# default size limit of the cache directory
+CACHE_MAX_GB = 20
+
+_cache_dir = None
+_max_bytes = None
+# file hashes by (path, size, mtime), so the processors of a file hash it only once
+_hashes = {}
+
+
+def configure(cache_dir: str = None, max_gb: float = CACHE_MAX_GB):
+    """Enables the cache in cache_dir, or disables it if cache_dir is None. Forked workers inherit the setting."""
+    global _cache_dir, _max_bytes
+    _cache_dir = cache_dir
+    _max_bytes = int(max_gb * 1024**3)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+
+def is_enabled() -> bool:
+    return _cache_dir is not None
+
+
+def get_file_hash(path: str) -> str:
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _hashes:
+        _hashes[key] = hash_file(path)
+    return _hashes[key]
+
+
+def get_cache_file(path: str, sample_rate: int, decoder: str = "essentia") -> str:
+    return os.path.join(
+        _cache_dir, f"{get_file_hash(path)}-{decoder}-{sample_rate}.npy"
+    )
+
+
+def decode(path: str, sample_rate: int) -> np.ndarray:
+    """Decodes the file to mono float32 PCM at sample_rate, like essentia's MonoLoader."""
+    import essentia.standard as es
+
+    return es.MonoLoader(filename=path, sampleRate=sample_rate)()
+
+
+def decode_torchaudio(path: str, sample_rate: int) -> np.ndarray:
+    """
+    Decodes the file to mono float32 PCM by averaging the channels of torchaudio, which PESTO was used with. The
+    audio is not resampled, so sample_rate must be the sample rate of the file.
+    """
+    import torchaudio
+
+    audio, file_sample_rate = torchaudio.load(path)
+    if file_sample_rate != sample_rate:
+        raise ValueError(
+            f"{path} has a sample rate of {file_sample_rate}, not {sample_rate}"
+        )
+    return audio.mean(dim=0).numpy()
+
+
+def load_mono(path: str, sample_rate: int, decoder: str = "essentia") -> np.ndarray:
+    """
+    Returns the mono PCM of the file at sample_rate, decoded by essentia or torchaudio. Decoders round differently,
+    so each one is cached separately. With the cache enabled the array is read-only and memory-mapped from the cache,
+    decoding only when it's not cached yet.
+    """
+    decode_file = decode if decoder == "essentia" else decode_torchaudio
+    if _cache_dir is None:
+        return decode_file(path, sample_rate)
+
+    cache_file = get_cache_file(path, sample_rate, decoder)
+    try:
+        audio = np.load(cache_file, mmap_mode="r")
+        # the modification time orders the arrays for eviction
+        os.utime(cache_file)
+        metrics.pcm_cache_requests.inc(result="hit")
+        return audio
+    except (FileNotFoundError, ValueError):
+        pass
+
+    metrics.pcm_cache_requests.inc(result="miss")
+    audio = np.ascontiguousarray(decode_file(path, sample_rate), dtype=np.float32)
+    # written under a temporary name, so other workers never read a partial array
+    fd, tmp_file = tempfile.mkstemp(dir=_cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, audio)
+        os.replace(tmp_file, cache_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+    evict(keep=cache_file)
+    return np.load(cache_file, mmap_mode="r")
+
+
+def evict(keep: str = None):
+    """Removes the least recently used arrays until the cache fits its size limit, except keep."""
+    entries = []
+    for name in os.listdir(_cache_dir):
+        if not name.endswith(".npy"):
+            continue
+        try:
+            stat = os.stat(os.path.join(_cache_dir, name))
+        except FileNotFoundError:
+            # removed by another worker
+            continue
+        entries.append((stat.st_mtime, stat.st_size, os.path.join(_cache_dir, name)))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= _max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            # workers that mapped the array keep reading it until they are done
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,25 @@
+"""
+Hashed n-gram shingles of token sequences (intervals, durations, ...). Indexed as keywords they turn substring
+lookups into term lookups on the inverted index.
+
+The web app computes the same hashes for the queries, so SHINGLE_SIZES and shingle_hash must stay in sync with
+SearchService.ts.
+"""
+
+import hashlib
+
+SHINGLE_SIZES = range(2, 7)
+
+
+def shingle_hash(tokens) -> str:
+    """Hashes a single n-gram of tokens into a short hex string."""
+    return hashlib.sha1(" ".join(tokens).encode("utf-8")).hexdigest()[:16]
+
+
+def hashed_shingles(tokens: list[str], sizes=SHINGLE_SIZES) -> list[str]:
+    """Returns the sorted unique hashes of all the n-grams of the tokens with the given sizes."""
+    shingles = set()
+    for size in sizes:
+        for i in range(len(tokens) - size + 1):
+            shingles.add(shingle_hash(tokens[i : i + size]))
+    return sorted(shingles)
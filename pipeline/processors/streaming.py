@@ -0,0 +1,283 @@
+"""
+Streaming analysis of long recordings. The audio is decoded in fixed-size windows with some context on both sides,
+the windows are analyzed in parallel processes and their results are stitched into the same structures the audio
+processors return for whole files. Only a few windows are decoded at a time, so the memory doesn't depend on the
+duration of the recording.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import soundfile
+
+from isolation import get_worker_context
+
+# recordings longer than this are analyzed in windows, shorter ones at once
+STREAMING_MIN_SECONDS = 600
+# length of the part of every window that ends up in the results
+WINDOW_SECONDS = 60
+# number of processes analyzing the windows of all recordings processed at the same time
+STREAMING_WORKERS = os.cpu_count() or 1
+# essentia's MonoLoader resamples to this rate by default
+ESSENTIA_SAMPLE_RATE = 44100
+# seconds of audio before and after every window, so frames and beats at the edges are analyzed like in whole files
+RMS_CONTEXT_SECONDS = 0.1
+PITCH_CONTEXT_SECONDS = 1
+BEATS_CONTEXT_SECONDS = 10
+
+# processes per recording, see configure
+_workers = STREAMING_WORKERS
+
+
+class AudioWindow:
+    """
+    A mono window of a recording. The audio starts `context` samples before the start of the window, which are
+    zeros at the start of the recording, and may continue after its end.
+    """
+
+    def __init__(
+        self, audio: np.ndarray, sample_rate: int, start: int, length: int, context: int
+    ):
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.start = start
+        self.length = length
+        self.context = context
+
+    @property
+    def start_seconds(self) -> float:
+        return self.start / self.sample_rate
+
+    @property
+    def end_seconds(self) -> float:
+        return (self.start + self.length) / self.sample_rate
+
+    @property
+    def is_last(self) -> bool:
+        """Only the last window has no audio after its end."""
+        return len(self.audio) == self.context + self.length
+
+
+def get_duration(path: str) -> float:
+    info = soundfile.info(path)
+    return info.frames / info.samplerate
+
+
+def configure(file_workers: int):
+    """
+    Shares STREAMING_WORKERS between the windows of file_workers recordings processed at the same time, instead of
+    every recording starting a process per core. Forked workers inherit the setting.
+    """
+    global _workers
+    _workers = max(1, STREAMING_WORKERS // file_workers)
+
+
+def should_stream(path: str) -> bool:
+    return get_duration(path) > STREAMING_MIN_SECONDS
+
+
+def iter_windows(
+    path: str, window_seconds: float = WINDOW_SECONDS, context_seconds: float = 0
+):
+    """
+    Decodes the recording block by block and yields its AudioWindows. At most three windows of audio are held in
+    memory.
+    """
+    sample_rate = soundfile.info(path).samplerate
+    length = max(1, int(window_seconds * sample_rate))
+    context = int(context_seconds * sample_rate)
+    if context > length:
+        raise ValueError("Context must not be longer than the window")
+
+    previous = np.zeros(context, dtype=np.float32)
+    current = None
+    start = 0
+    for block in soundfile.blocks(
+        path, blocksize=length, dtype="float32", always_2d=True
+    ):
+        block = block.mean(axis=1)
+        if current is not None:
+            yield AudioWindow(
+                np.concatenate([previous, current, block[:context]]),
+                sample_rate,
+                start,
+                len(current),
+                context,
+            )
+            tail = np.concatenate([previous, current])
+            previous = tail[len(tail) - context :]
+            start += len(current)
+        current = block
+    if current is not None:
+        yield AudioWindow(
+            np.concatenate([previous, current]),
+            sample_rate,
+            start,
+            len(current),
+            context,
+        )
+
+
+def map_windows(
+    func,
+    path: str,
+    window_seconds: float = WINDOW_SECONDS,
+    context_seconds: float = 0,
+    workers: int = None,
+) -> list:
+    """
+    Calls func(window) for every window of the recording in parallel processes and returns the results in order.
+    func must be picklable, e.g. a module-level function or a functools.partial of one. Without workers, the
+    configured number of processes is used.
+    """
+    windows = iter_windows(path, window_seconds, context_seconds)
+    if workers is None:
+        workers = _workers
+    if workers <= 1:
+        return [func(window) for window in windows]
+
+    results = []
+    pending = deque()
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_worker_context()
+    ) as executor:
+        for window in windows:
+            pending.append(executor.submit(func, window))
+            # don't decode the whole recording ahead of the workers
+            if len(pending) >= 2 * workers:
+                results.append(pending.popleft().result())
+        results.extend(future.result() for future in pending)
+    return results
+
+
+def to_essentia(window: AudioWindow, sample_rate: int = ESSENTIA_SAMPLE_RATE):
+    """Returns the window audio resampled for essentia, like MonoLoader does, and the new context in samples."""
+    import essentia.standard as es
+
+    audio = np.ascontiguousarray(window.audio, dtype=np.float32)
+    if window.sample_rate == sample_rate:
+        return audio, window.context
+    resample = es.Resample(
+        inputSampleRate=window.sample_rate, outputSampleRate=sample_rate, quality=1
+    )
+    return resample(audio), int(window.context * sample_rate / window.sample_rate)
+
+
+def rms_window(window: AudioWindow, frame_size: int, hop_size: int) -> list[float]:
+    """
+    RMS of the frames centered on multiples of hop_size inside the window. Frames are zero-padded at the edges of
+    the recording like essentia's FrameGenerator, the context must be at least half a frame.
+    """
+    # like in FrameGenerator, odd frames have one more sample before their center
+    half = (frame_size + 1) // 2
+    first = -(-window.start // hop_size)
+    end = window.start + window.length
+    if window.is_last:
+        # FrameGenerator keeps going while the frames start before the end of the recording
+        end += half
+    centers = np.arange(first * hop_size, end, hop_size)
+    # start of every frame in the window audio
+    starts = centers - window.start + window.context - half
+    padded = np.concatenate(
+        [window.audio.astype(np.float64), np.zeros(frame_size, dtype=np.float64)]
+    )
+    squares = np.concatenate([[0.0], np.cumsum(padded**2)])
+    energy = squares[starts + frame_size] - squares[starts]
+    return np.sqrt(np.maximum(energy, 0) / frame_size).astype(np.float32).tolist()
+
+
+def pitch_window(
+    window: AudioWindow, step_size: float
+) -> tuple[list[float], list[float]]:
+    """PESTO pitch predictions and their confidence every step_size milliseconds inside the window."""
+    import torch
+    from pesto import predict
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    x = torch.from_numpy(np.ascontiguousarray(window.audio)).to(device)
+    _, predictions, confidence, _ = predict(x, window.sample_rate, step_size)
+    step_samples = window.sample_rate * step_size / 1000
+    # predictions are every step from the start of the window audio, the window starts on a step
+    first = round(window.context / step_samples)
+    count = int(np.ceil(window.length / step_samples))
+    return (
+        predictions[first : first + count].tolist(),
+        confidence[first : first + count].tolist(),
+    )
+
+
+def hpcp_window(
+    window: AudioWindow, sample_rate: int = ESSENTIA_SAMPLE_RATE
+) -> tuple[np.ndarray, int]:
+    """Sum and number of the HPCP frames inside the window, computed like essentia's KeyExtractor does."""
+    import essentia.standard as es
+
+    audio, context = to_essentia(window, sample_rate)
+    length = int(window.length * sample_rate / window.sample_rate)
+    audio = audio[context : context + length]
+
+    windowing = es.Windowing(type="hann")
+    spectrum = es.Spectrum()
+    spectral_peaks = es.SpectralPeaks(
+        orderBy="magnitude",
+        magnitudeThreshold=0.0001,
+        minFrequency=25,
+        maxFrequency=3500,
+        maxPeaks=60,
+        sampleRate=sample_rate,
+    )
+    whitening = es.SpectralWhitening(maxFrequency=3500, sampleRate=sample_rate)
+    hpcp = es.HPCP(
+        size=12,
+        referenceFrequency=440,
+        harmonics=4,
+        bandPreset=True,
+        minFrequency=25,
+        maxFrequency=3500,
+        weightType="cosine",
+        normalized="unitMax",
+        sampleRate=sample_rate,
+    )
+
+    total = np.zeros(12)
+    count = 0
+    for frame in es.FrameGenerator(audio, frameSize=4096, hopSize=4096):
+        frame_spectrum = spectrum(windowing(frame))
+        frequencies, magnitudes = spectral_peaks(frame_spectrum)
+        magnitudes = whitening(frame_spectrum, frequencies, magnitudes)
+        total += hpcp(frequencies, magnitudes)
+        count += 1
+    return total, count
+
+
+def key_from_hpcp(windows: list[tuple[np.ndarray, int]]) -> tuple[str, str, float]:
+    """Estimates the key from the mean HPCP of all the windows."""
+    import essentia.standard as es
+
+    total = sum(x[0] for x in windows)
+    count = sum(x[1] for x in windows)
+    mean = np.asarray(total / max(count, 1), dtype=np.float32)
+    key, scale, strength, _ = es.Key(profileType="bgate", pcpSize=12)(mean)
+    return key, scale, float(strength)
+
+
+def beats_window(window: AudioWindow, method: str = "multifeature") -> list[float]:
+    """Beat positions in seconds inside the window, tracked with the context on both sides."""
+    import essentia.standard as es
+
+    audio, context = to_essentia(window)
+    _, ticks, _, _, _ = es.RhythmExtractor2013(method=method)(audio)
+    offset = window.start_seconds - context / ESSENTIA_SAMPLE_RATE
+    ticks = np.asarray(ticks) + offset
+    return ticks[
+        (ticks >= window.start_seconds) & (ticks < window.end_seconds)
+    ].tolist()
+
+
+def bpm_from_ticks(ticks: list[float]) -> float:
+    """Tempo from the median interval between the beats."""
+    if len(ticks) < 2:
+        return 0.0
+    return float(60 / np.median(np.diff(ticks)))
@@ -7,6 +7,8 @@ from processors.contour_processor import (
     NGramRhythmProcessor,
     NGramPitchProcessor,
 )
+from processors.educational_processor import EducationalProcessor
+from processors.embedding_processor import MusicXMLEmbeddingProcessor
 
 
 def song():
@@ -41,3 +43,17 @@ class TestAdvancedProcessors:
         pitch_ngram_processor = NGramPitchProcessor(song())
         result = pitch_ngram_processor.process()
         assert result == snapshot
+
+    def test_educational_processor(self, snapshot):
+        educational_processor = EducationalProcessor(song())
+        result = educational_processor.process()
+        assert result == snapshot
+
+    def test_musicxml_embedding_processor(self, snapshot):
+        embedding_processor = MusicXMLEmbeddingProcessor(song())
+        result = embedding_processor.process()
+        assert (
+            len(result["vector"])
+            == embedding_processor.mapping["properties"]["vector"]["dims"]
+        )
+        assert result == snapshot
@@ -0,0 +1,63 @@
+from aggregates import CorpusAggregate
+
+
+def document(file_hash, key, ambitus, rhythm):
+    return {
+        "file_hash_sha256": file_hash,
+        "corpus_id": "corpus",
+        "metadata": {"composer": "Bach"},
+        "time_signature": ["4/4"],
+        "key": {"most_certain_key": key},
+        "ambitus": {"ambitus_semitones": ambitus},
+        "ngram_rhythm": {"frequency_histogram": rhythm},
+        "ngram_pitch": {"frequency_histogram": {}},
+    }
+
+
+class TestAggregates:
+    def test_incremental_aggregate(self, tmp_path):
+        state_file = str(tmp_path / "state.json")
+        aggregate = CorpusAggregate.load(state_file, "corpus")
+        assert aggregate.add(document("a", "C", 12, {"1/1 1/1 1/1": 2}))
+        aggregate.save(state_file)
+
+        aggregate = CorpusAggregate.load(state_file, "corpus")
+        # already counted in the previous run
+        assert not aggregate.add(document("a", "C", 12, {"1/1 1/1 1/1": 2}))
+        assert aggregate.add(
+            document("b", "g", 7, {"1/1 1/1 1/1": 3, "1/2 1/2 1/1": 2})
+        )
+
+        result = aggregate.to_document(top_ngrams=1)
+        assert result["song_count"] == 2
+        assert result["composers_count"] == 1
+        assert result["time_signatures"] == {"4/4": 2}
+        assert result["keys"] == {"C": 1, "g": 1}
+        assert result["ambitus"]["min"] == 7
+        assert result["ambitus"]["max"] == 12
+        assert result["ambitus"]["avg"] == 9.5
+        assert result["ngram_rhythm"] == {"1/1 1/1 1/1": 5}
+
+    def test_remove_song(self, tmp_path):
+        state_file = str(tmp_path / "state.json")
+        aggregate = CorpusAggregate.load(state_file, "corpus")
+        aggregate.add(document("a", "C", 12, {"1/1 1/1 1/1": 2}))
+        aggregate.add(document("b", "g", 7, {"1/1 1/1 1/1": 3, "1/2 1/2 1/1": 2}))
+        aggregate.save(state_file)
+
+        aggregate = CorpusAggregate.load(state_file, "corpus")
+        assert aggregate.remove("b")
+        assert not aggregate.remove("b")
+
+        result = aggregate.to_document()
+        assert result["song_count"] == 1
+        assert result["time_signatures"] == {"4/4": 1}
+        assert result["keys"] == {"C": 1}
+        assert result["ambitus"]["histogram"] == {"12": 1}
+        assert result["ngram_rhythm"] == {"1/1 1/1 1/1": 2}
+
+        aggregate.remove("a")
+        result = aggregate.to_document()
+        assert result["song_count"] == 0
+        assert result["composers_count"] == 0
+        assert result["ngram_rhythm"] == {}
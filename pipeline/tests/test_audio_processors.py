@@ -1,12 +1,26 @@
 import os
 
+import pytest
+
+from config import get_audio_processors
 from processors.audio_processors import (
     AudioFileInfoProcessor,
     AudioBPMProcessor,
     AudioPitchContourProcessor,
     AudioChordProcessor,
     AudioRMSProcessor,
+    RAW_ARRAY_MAPPING,
+    chord_summary,
+    downsample_pyramid,
+    get_key,
+    loudness_summary,
+    pitch_summary,
 )
+from processors.chord_progressions import roman_numerals
+from processors.shingles import hashed_shingles
+
+
+CHORD_FIELDS = ["chord_name", "chord_start", "chord_end"]
 
 
 def song():
@@ -31,9 +45,88 @@ class TestAudioProcessors:
 
     def test_audio_chord_processor(self, snapshot):
         audio_chord_processor = AudioChordProcessor(song())
-        assert audio_chord_processor.process() == snapshot
+        result = audio_chord_processor.process()
+        chords = {field: result[field] for field in CHORD_FIELDS}
+        # the snapshot holds the chords recognized by autochord, the fields derived from them are checked here
+        assert chords == snapshot
+        summary = chord_summary(*chords.values())
+        assert {field: result[field] for field in summary} == summary
+        key, scale, _ = get_key(
+            song(), audio_chord_processor.settings["key_sample_rate"]
+        )
+        assert result["chord_roman"] == roman_numerals(result["chord_name"], key, scale)
+        assert result["chord_progression_shingles"] == hashed_shingles(
+            result["chord_roman"]
+        )
 
     def test_audio_rms_processor(self, snapshot):
         audio_chord_processor = AudioRMSProcessor(song())
         print(audio_chord_processor.process())
         assert audio_chord_processor.process() == snapshot
+
+    def test_downsample_pyramid(self):
+        pyramid = downsample_pyramid(list(range(40)), bucket_sizes=[16, 64])
+        assert pyramid["16"] == {
+            "min": [0.0, 16.0, 32.0],
+            "max": [15.0, 31.0, 39.0],
+            "mean": [7.5, 23.5, 35.5],
+        }
+        assert pyramid["64"] == {"min": [0.0], "max": [39.0], "mean": [19.5]}
+
+    def test_pitch_summary(self):
+        # an octave from 220 to 440 Hz, unvoiced frames have a low confidence
+        pitch = [220.0] * 10 + [330.0] * 10 + [440.0] * 10 + [1000.0] * 10
+        confidence = [0.9] * 30 + [0.1] * 10
+        summary = pitch_summary(pitch, confidence)
+        assert summary["voiced_percent"] == 75.0
+        assert summary["voice_pitch_median_hz"] == 330.0
+        assert summary["voice_pitch_low_hz"] == 220.0
+        assert summary["voice_pitch_high_hz"] == 440.0
+        assert summary["voice_pitch_range_semitones"] == 12.0
+        assert pitch_summary([100.0], [0.0])["voice_pitch_median_hz"] is None
+        assert pitch_summary([], [])["voiced_percent"] is None
+
+    def test_loudness_summary(self):
+        # silence is left out
+        summary = loudness_summary([0.0] * 10 + [0.1] * 10 + [0.01] * 10)
+        assert summary["loudness_mean_db"] == -30.0
+        assert summary["loudness_range_db"] == 20.0
+        assert loudness_summary([0.0, 0.0])["loudness_mean_db"] is None
+
+    def test_chord_summary(self):
+        summary = chord_summary(
+            ["N", "C:maj", "C:maj", "G:maj", "N", "A:min"],
+            [0.0, 1.0, 16.0, 31.0, 46.0, 50.0],
+            [1.0, 16.0, 31.0, 46.0, 50.0, 65.0],
+        )
+        # two changes in a minute of chords
+        assert summary == {"chord_changes_per_minute": 2.0, "distinct_chords": 3}
+        assert chord_summary(["N"], [0.0], [1.0])["distinct_chords"] == 0
+
+    def test_raw_arrays_are_not_indexed(self):
+        mapping = AudioRMSProcessor(None).mapping["properties"]
+        assert mapping["loudness_total"] == RAW_ARRAY_MAPPING
+        assert mapping["loudness_range_db"] == {"type": "float"}
+        mapping = AudioPitchContourProcessor(None).mapping["properties"]
+        assert mapping["pitch_contour_hz_voice"] == RAW_ARRAY_MAPPING
+
+    def test_profile_algorithm_names(self):
+        assert AudioBPMProcessor(None).get_algorithm_name() == "essentia_multifeature"
+        assert (
+            AudioBPMProcessor(None, profile="fast").get_algorithm_name()
+            == "essentia_degara_fast"
+        )
+        assert (
+            AudioPitchContourProcessor(None, profile="fast").get_algorithm_name()
+            == "pesto_fast"
+        )
+        # processors that don't depend on the profile keep their name
+        assert AudioRMSProcessor(None, profile="fast").get_algorithm_name() == "rms"
+
+    def test_fast_profile_skips_chords(self):
+        assert AudioChordProcessor in get_audio_processors()
+        assert AudioChordProcessor not in get_audio_processors("fast")
+
+    def test_unknown_profile(self):
+        with pytest.raises(ValueError):
+            AudioBPMProcessor(None, profile="turbo")
@@ -0,0 +1,30 @@
+import pytest
+
+from processors.chord_progressions import pitch_class, roman_numeral, roman_numerals
+from processors.shingles import hashed_shingles, shingle_hash
+
+
+class TestChordProgressions:
+    def test_pitch_class(self):
+        assert pitch_class("C") == 0
+        assert pitch_class("F#") == pitch_class("Gb") == 6
+        assert pitch_class("Cb") == 11
+        with pytest.raises(ValueError):
+            pitch_class("H")
+
+    def test_roman_numeral(self):
+        assert roman_numeral("D:min", "C", "major") == "ii"
+        assert roman_numeral("Bb:maj", "C", "major") == "bVII"
+        # relative to the natural minor scale
+        assert roman_numeral("F:maj", "A", "minor") == "VI"
+        assert roman_numeral("E:maj", "A", "minor") == "V"
+        assert roman_numeral("N", "C", "major") is None
+
+    def test_progression_is_transposition_invariant(self):
+        in_c = ["N", "D:min", "D:min", "G:maj", "C:maj", "N", "C:maj"]
+        in_eb = ["F:min", "Bb:maj", "Bb:maj", "D#:maj"]
+        assert roman_numerals(in_c, "C", "major") == ["ii", "V", "I"]
+        assert roman_numerals(in_eb, "Eb", "major") == ["ii", "V", "I"]
+        assert shingle_hash(["ii", "V", "I"]) in hashed_shingles(
+            roman_numerals(in_eb, "Eb", "major")
+        )
@@ -0,0 +1,68 @@
+import pytest
+
+from concurrency import AdaptiveController, run_adaptive
+
+GB = 1024**3
+
+
+def stats(memory=0.5, load=0.5, worker_rss=GB, memory_free=8 * GB):
+    return {
+        "memory": memory,
+        "memory_free": memory_free,
+        "load": load,
+        "worker_rss": worker_rss,
+        "total_rss": worker_rss,
+    }
+
+
+class TestAdaptiveController:
+    def test_adds_workers_with_headroom(self):
+        controller = AdaptiveController(1, 3)
+        for _ in range(5):
+            controller.decide(controller.target, stats())
+        assert controller.target == 3
+
+    def test_doesnt_add_unused_workers(self):
+        controller = AdaptiveController(1, 3)
+        controller.decide(0, stats())
+        assert controller.target == 1
+
+    def test_needs_room_for_the_largest_worker(self):
+        controller = AdaptiveController(1, 3)
+        controller.decide(1, stats(worker_rss=4 * GB, memory_free=2 * GB))
+        assert controller.target == 1
+
+    def test_removes_workers_under_high_load(self):
+        controller = AdaptiveController(1, 4)
+        controller.target = 3
+        controller.decide(3, stats(load=2))
+        assert controller.target == 2
+
+    def test_pauses_under_memory_pressure(self):
+        controller = AdaptiveController(2, 4)
+        controller.target = 3
+        controller.decide(3, stats(memory=0.95))
+        assert controller.paused
+        assert controller.target == 2
+        # the floor is kept, but no new files are started
+        controller.decide(2, stats(memory=0.95))
+        assert controller.target == 2
+        controller._last_decision = float("inf")
+        assert not controller.can_start(1)
+        # unless nothing is running
+        assert controller.can_start(0)
+
+        controller.decide(1, stats(memory=0.6))
+        assert not controller.paused
+
+    def test_invalid_bounds(self):
+        with pytest.raises(ValueError):
+            AdaptiveController(3, 2)
+
+    def test_run_adaptive(self):
+        controller = AdaptiveController(1, 2, interval=0.01)
+        results = {
+            task: future.result()
+            for task, future in run_adaptive(lambda x: x * 2, range(1, 6), controller)
+        }
+        assert results == {1: 2, 2: 4, 3: 6, 4: 8, 5: 10}
@@ -0,0 +1,52 @@
+import pytest
+
+from helpers import get_blob_file, merge, open_ndjson, read_results, split_document
+
+
+class TestHelpers:
+    def test_split_document(self):
+        document = {
+            "file_hash_sha256": "abc",
+            "corpus_id": "corpus",
+            "original_file": "<score-partwise/>",
+            "loudness": {
+                "rms": {"loudness_total": [0.1, 0.2], "timestep_seconds": 0.5}
+            },
+        }
+        search, blob = split_document(
+            document, ["original_file", "loudness.rms.loudness_total", "missing.field"]
+        )
+        assert search == {
+            "file_hash_sha256": "abc",
+            "corpus_id": "corpus",
+            "loudness": {"rms": {"timestep_seconds": 0.5}},
+        }
+        assert blob == {
+            "file_hash_sha256": "abc",
+            "corpus_id": "corpus",
+            "original_file": "<score-partwise/>",
+            "loudness": {"rms": {"loudness_total": [0.1, 0.2]}},
+        }
+        # merging the blob back restores the document
+        assert merge(blob, search)["loudness"]["rms"]["loudness_total"] == [0.1, 0.2]
+
+    def test_split_document_without_blob_fields(self):
+        document = {"file_hash_sha256": "abc", "key": {"most_certain_key": "C"}}
+        assert split_document(document, ["original_file"]) == (document, None)
+
+    def test_get_blob_file(self):
+        assert get_blob_file("out/results.json") == "out/results.blobs.json"
+
+    def test_get_blob_file_compressed(self):
+        assert get_blob_file("results.json.zst") == "results.blobs.json.zst"
+
+    @pytest.mark.parametrize("extension", [".json", ".json.gz", ".json.zst"])
+    def test_compressed_ndjson(self, tmp_path, extension):
+        if extension.endswith(".zst"):
+            pytest.importorskip("zstandard")
+        path = str(tmp_path / ("results" + extension))
+        # appending to an existing file must keep it readable
+        for i in range(2):
+            with open_ndjson(path, "a") as f:
+                f.write('{"file_hash_sha256": "%d"}\n' % i)
+        assert [x["file_hash_sha256"] for x in read_results([path])] == ["0", "1"]
@@ -0,0 +1,154 @@
+import fnmatch
+
+import pytest
+
+import index_versions
+
+MAPPING = {"properties": {"title": {"type": "text"}}}
+
+
+class FakeIndices:
+    """The indices API of an ElasticSearch client, for the calls index_versions makes."""
+
+    def __init__(self):
+        # index -> settings, mappings and aliases
+        self.indices = {}
+
+    def create(self, index, settings=None, mappings=None):
+        self.indices[index] = {
+            "settings": dict(settings or {}),
+            "mappings": mappings or {},
+            "aliases": set(),
+        }
+
+    def exists(self, index):
+        return index in self.indices or any(
+            index in value["aliases"] for value in self.indices.values()
+        )
+
+    def get_alias(self, index, expand_wildcards=None):
+        return {
+            name: {"aliases": {alias: {} for alias in value["aliases"]}}
+            for name, value in self.indices.items()
+            if fnmatch.fnmatch(name, index)
+        }
+
+    def get_mapping(self, index):
+        return {
+            name: {"mappings": value["mappings"]}
+            for name, value in self.indices.items()
+            if name == index or index in value["aliases"]
+        }
+
+    def get_settings(self, index, name):
+        replicas = self.indices[index]["settings"].get("number_of_replicas", 1)
+        return {index: {"settings": {"index": {"number_of_replicas": replicas}}}}
+
+    def put_settings(self, index, settings):
+        self.indices[index]["settings"].update(settings)
+
+    def refresh(self, index):
+        pass
+
+    def clone(self, index, target):
+        self.create(
+            target, self.indices[index]["settings"], self.indices[index]["mappings"]
+        )
+
+    def update_aliases(self, actions):
+        for action in actions:
+            if "add" in action:
+                self.indices[action["add"]["index"]]["aliases"].add(
+                    action["add"]["alias"]
+                )
+            elif "remove" in action:
+                self.indices[action["remove"]["index"]]["aliases"].remove(
+                    action["remove"]["alias"]
+                )
+            else:
+                del self.indices[action["remove_index"]["index"]]
+
+    def delete(self, index):
+        for name in index.split(","):
+            self.indices.pop(name, None)
+
+
+class FakeClient:
+    def __init__(self):
+        self.indices = FakeIndices()
+        self.reindexed = []
+
+    def options(self, **kwargs):
+        return self
+
+    def reindex(self, source, dest, **kwargs):
+        self.reindexed.append((source["index"], dest["index"]))
+        return {"total": 2, "failures": []}
+
+    def live(self, alias):
+        return index_versions.get_live_indices(self, alias)
+
+
+class TestIndexVersions:
+    def test_get_version(self):
+        assert index_versions.get_version("songs", "songs-v8") == 8
+        assert index_versions.get_version("songs", "songs-blobs") is None
+        assert index_versions.get_version("songs", "audio-v8") is None
+
+    def test_new_version_is_published_once_loaded(self):
+        client = FakeClient()
+        with index_versions.NewVersion(client, "songs", MAPPING) as index:
+            assert index == "songs-v1"
+            assert client.indices.indices[index]["settings"]["refresh_interval"] == "-1"
+            assert client.live("songs") == []
+        assert client.live("songs") == ["songs-v1"]
+        assert (
+            client.indices.indices["songs-v1"]["settings"]["refresh_interval"] is None
+        )
+
+        with index_versions.NewVersion(client, "songs", MAPPING) as index:
+            assert index == "songs-v2"
+            # searches still use the previous version
+            assert client.live("songs") == ["songs-v1"]
+        assert client.live("songs") == ["songs-v2"]
+        assert "songs-v1" in client.indices.indices
+
+    def test_failed_version_is_deleted(self):
+        client = FakeClient()
+        with index_versions.NewVersion(client, "songs", MAPPING):
+            pass
+        with pytest.raises(RuntimeError):
+            with index_versions.NewVersion(client, "songs", MAPPING):
+                raise RuntimeError("upload failed")
+        assert list(client.indices.indices) == ["songs-v1"]
+        assert client.live("songs") == ["songs-v1"]
+
+    def test_index_from_before_versioning_is_kept(self):
+        client = FakeClient()
+        client.indices.create("songs", mappings=MAPPING)
+        with index_versions.NewVersion(client, "songs", MAPPING, reindex=True):
+            pass
+        assert client.reindexed == [("songs", "songs-v1")]
+        assert sorted(client.indices.indices) == ["songs-v0", "songs-v1"]
+        assert client.live("songs") == ["songs-v1"]
+
+    def test_old_versions_are_deleted(self):
+        client = FakeClient()
+        for _ in range(4):
+            with index_versions.NewVersion(client, "songs", MAPPING, keep_versions=2):
+                pass
+        assert sorted(client.indices.indices) == ["songs-v3", "songs-v4"]
+
+    def test_rollback(self):
+        client = FakeClient()
+        for _ in range(3):
+            with index_versions.NewVersion(client, "songs", MAPPING):
+                pass
+        assert index_versions.rollback(client, "songs") == "songs-v2"
+        assert client.live("songs") == ["songs-v2"]
+        assert index_versions.rollback(client, "songs", 3) == "songs-v3"
+        assert client.live("songs") == ["songs-v3"]
+        with pytest.raises(ValueError):
+            index_versions.rollback(client, "songs", 7)
+        with pytest.raises(ValueError):
+            index_versions.rollback(client, "audio")
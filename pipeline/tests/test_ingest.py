@@ -0,0 +1,80 @@
+import json
+import os
+import time
+
+import pytest
+
+# the client of upload is created on import, it never connects in these tests
+os.environ.setdefault("ELASTIC_HOST", "http://localhost:9200")
+os.environ.setdefault("ELASTIC_USER", "elastic")
+os.environ.setdefault("ELASTIC_PASSWORD", "elastic")
+
+import ingest  # noqa: E402
+
+QUEUE_SIZE = 2
+
+
+class FakePipeline:
+    """Processes the files instantly and indexes the documents slowly, so the queue between them fills up."""
+
+    def __init__(self, count, fail_after=None):
+        self.count = count
+        self.fail_after = fail_after
+        self.processed = 0
+        self.indexed = []
+        # most documents processed but not taken by the indexer yet
+        self.max_waiting = 0
+
+    def process_files_isolated(self, in_files, *args):
+        for in_file in in_files:
+            # the documents processed before this one were put in the queue
+            self.max_waiting = max(self.max_waiting, self.processed - len(self.indexed))
+            self.processed += 1
+            document = {"file_hash_sha256": os.path.basename(in_file)}
+            yield in_file, json.dumps(document), None
+
+    def bulk_index(self, documents, *args):
+        for document in documents:
+            if len(self.indexed) == self.fail_after:
+                raise ConnectionError("ElasticSearch is gone")
+            self.indexed.append(document["file_hash_sha256"])
+            time.sleep(0.01)
+
+
+@pytest.fixture
+def run_ingest(monkeypatch, tmp_path):
+    def run(pipeline):
+        monkeypatch.setattr(
+            ingest, "process_files_isolated", pipeline.process_files_isolated
+        )
+        monkeypatch.setattr(ingest.upload, "bulk_index", pipeline.bulk_index)
+        ingest._ingest(
+            [f"song{i}.musicxml" for i in range(pipeline.count)],
+            "songs",
+            "corpus",
+            False,
+            None,
+            None,
+            10,
+            QUEUE_SIZE,
+            None,
+            dead_letter_file=str(tmp_path / "songs.dead_letter.jsonl"),
+        )
+
+    return run
+
+
+class TestIngest:
+    def test_all_documents_are_indexed(self, run_ingest):
+        pipeline = FakePipeline(20)
+        run_ingest(pipeline)
+        assert pipeline.indexed == [f"song{i}.musicxml" for i in range(20)]
+        assert pipeline.max_waiting <= QUEUE_SIZE
+
+    def test_indexer_error_stops_the_run(self, run_ingest):
+        pipeline = FakePipeline(20, fail_after=3)
+        with pytest.raises(ConnectionError):
+            run_ingest(pipeline)
+        assert len(pipeline.indexed) == 3
+        # processing stops once the queue is full
+        assert pipeline.processed <= 3 + QUEUE_SIZE + 2
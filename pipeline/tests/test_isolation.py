@@ -0,0 +1,130 @@
+import os
+import time
+
+import pytest
+
+import isolation
+import metrics
+
+
+def process_ok(value):
+    isolation.set_stage("processing")
+    metrics.bytes_read.inc(10)
+    return value * 2
+
+
+def process_slow():
+    isolation.set_stage("sleeping")
+    time.sleep(5)
+
+
+def process_error():
+    isolation.set_stage("parsing")
+    raise ValueError("broken file")
+
+
+def process_crash():
+    os._exit(3)
+
+
+def sleep():
+    time.sleep(30)
+
+
+def process_with_child(pid_file):
+    child = isolation.get_worker_context().Process(target=sleep)
+    child.start()
+    with open(pid_file, "w", encoding="utf-8") as f:
+        f.write(str(child.pid))
+    process_slow()
+
+
+def is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
+            # killed processes stay zombies until they are reaped
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+class TestIsolation:
+    def test_returns_result_and_merges_metrics(self):
+        before = metrics.bytes_read.snapshot().get((), 0)
+        assert isolation.run_isolated(process_ok, (21,)) == 42
+        assert metrics.bytes_read.snapshot()[()] == before + 10
+
+    def test_timeout(self):
+        with pytest.raises(isolation.FileFailure) as failure:
+            isolation.run_isolated(process_slow, (), timeout=0.5)
+        assert failure.value.error_type == "timeout"
+        assert failure.value.stage == "sleeping"
+
+    @pytest.mark.skipif(not os.path.exists("/proc"), reason="needs /proc")
+    def test_timeout_kills_started_processes(self, tmp_path):
+        pid_file = str(tmp_path / "child.pid")
+        with pytest.raises(isolation.FileFailure):
+            isolation.run_isolated(process_with_child, (pid_file,), timeout=0.5)
+        with open(pid_file, "r", encoding="utf-8") as f:
+            pid = int(f.read())
+        # the kill signal may still be on its way
+        for _ in range(50):
+            if not is_running(pid):
+                break
+            time.sleep(0.1)
+        assert not is_running(pid)
+
+    @pytest.mark.skipif(not os.path.exists("/proc"), reason="needs /proc")
+    def test_tree_rss_includes_children(self, monkeypatch):
+        child = isolation.get_worker_context().Process(target=sleep)
+        child.start()
+        # every process counts as one byte, the real resident memory changes while it's read
+        monkeypatch.setattr(isolation, "get_rss", lambda pid: 1)
+        try:
+            assert child.pid in isolation.get_child_pids(os.getpid())
+            assert isolation.get_tree_rss(child.pid) == 1
+            assert isolation.get_tree_rss(os.getpid()) >= 2
+        finally:
+            child.kill()
+            child.join()
+
+    def test_error(self):
+        with pytest.raises(isolation.FileFailure) as failure:
+            isolation.run_isolated(process_error, ())
+        assert failure.value.error_type == "error"
+        assert failure.value.stage == "parsing"
+        assert failure.value.error == "ValueError: broken file"
+        assert "process_error" in failure.value.error_traceback
+
+    def test_crash(self):
+        with pytest.raises(isolation.FileFailure) as failure:
+            isolation.run_isolated(process_crash, ())
+        assert failure.value.error_type == "crash"
+
+    def test_dead_letter(self, tmp_path):
+        path = str(tmp_path / "results.dead_letter.jsonl")
+        failure = isolation.FileFailure("timeout", "Timed out", "music21_parse", 1.5)
+        with isolation.DeadLetterWriter(path, {"corpus_id": "c"}) as dead_letters:
+            dead_letters.write("song.musicxml", failure)
+
+        [record] = isolation.read_dead_letter(path)
+        assert record["file"] == os.path.abspath("song.musicxml")
+        assert record["stage"] == "music21_parse"
+        assert record["error_type"] == "timeout"
+        assert record["options"] == {"corpus_id": "c"}
+        assert isolation.get_dead_letter_file("out/results.json.zst") == (
+            "out/results.dead_letter.jsonl"
+        )
+
+    def test_dead_letter_append(self, tmp_path):
+        path = str(tmp_path / "results.dead_letter.jsonl")
+        failure = isolation.FileFailure("timeout", "Timed out", "music21_parse", 1.5)
+        for in_file in ["first.musicxml", "second.musicxml"]:
+            with isolation.DeadLetterWriter(path, append=True) as dead_letters:
+                dead_letters.write(in_file, failure)
+
+        records = isolation.read_dead_letter(path)
+        assert [os.path.basename(record["file"]) for record in records] == [
+            "first.musicxml",
+            "second.musicxml",
+        ]
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from melodic_index import MelodicIndex, build_suffix_array
+
+
+def document(name, pitches, durations, measure_starts, measure_numbers):
+    intervals = [b - a for a, b in zip(pitches, pitches[1:])]
+    return {
+        "filename": name,
+        "corpus_id": "corpus",
+        "file_hash_sha256": name,
+        "contour": {
+            "melodic_contour_string_absolute": " ".join(str(x) for x in pitches),
+            "melodic_contour_string_relative": " ".join(str(x) for x in intervals),
+            "measure_starts": measure_starts,
+            "measure_numbers": measure_numbers,
+        },
+        "rhythm": {
+            "rhythm_string": " ".join(durations),
+            "measure_starts": measure_starts,
+            "measure_numbers": measure_numbers,
+        },
+    }
+
+
+def index(tmp_path):
+    documents = [
+        document("a", [60, 62, 64, 60, 62, 64], ["1/1"] * 6, [0, 3], [1, 2]),
+        # starts with a pickup measure 0
+        document("b", [67, 69, 71, 67], ["1/2", "1/2", "1/1", "1/1"], [0, 2], [0, 1]),
+    ]
+    MelodicIndex.build(documents, str(tmp_path))
+    return MelodicIndex(str(tmp_path))
+
+
+class TestMelodicIndex:
+    def test_suffix_array(self):
+        tokens = np.array([2, 1, 2, 1, 2, 0])
+        suffixes = [tuple(tokens[i:]) for i in range(len(tokens))]
+        assert build_suffix_array(tokens).tolist() == sorted(
+            range(len(tokens)), key=lambda i: suffixes[i]
+        )
+
+    def test_exact_search(self, tmp_path):
+        result = index(tmp_path).search("62 64", "exact")
+        assert result["count"] == 2
+        assert [
+            (x["filename"], x["note_index"], x["measure"]) for x in result["matches"]
+        ] == [
+            ("a", 1, 1),
+            ("a", 4, 2),
+        ]
+
+    def test_transposed_search(self, tmp_path):
+        result = index(tmp_path).search("50 52 54", "transposed")
+        assert [(x["filename"], x["note_index"]) for x in result["matches"]] == [
+            ("a", 0),
+            ("a", 3),
+            ("b", 0),
+        ]
+
+    def test_interval_search(self, tmp_path):
+        # the interval from the third note of a leads to the first note of its second measure
+        result = index(tmp_path).search("-4", "intervals")
+        assert [
+            (x["filename"], x["note_index"], x["measure"]) for x in result["matches"]
+        ] == [("a", 3, 2), ("b", 3, 1)]
+
+    def test_invalid_query(self, tmp_path):
+        with pytest.raises(ValueError):
+            index(tmp_path).search("60 C4", "exact")
+
+    def test_search_does_not_span_documents(self, tmp_path):
+        assert index(tmp_path).search("64 67", "exact")["count"] == 0
+
+    def test_rhythm_search(self, tmp_path):
+        result = index(tmp_path).search("1/2 1/1", "rhythm")
+        assert [(x["filename"], x["measure"]) for x in result["matches"]] == [("b", 0)]
+        assert index(tmp_path).search("3/2", "rhythm")["count"] == 0
@@ -0,0 +1,54 @@
+from metrics import MetricsRegistry
+
+
+class TestMetrics:
+    def test_render_openmetrics(self):
+        registry = MetricsRegistry()
+        files = registry.counter("files", "Processed files.", ["file_type"])
+        latency = registry.histogram("latency_seconds", "Latency.", buckets=(1, 5))
+        files.inc(file_type="audio")
+        files.inc(2, file_type="audio")
+        latency.observe(0.5)
+        latency.observe(3)
+
+        assert registry.render() == (
+            "# TYPE files counter\n"
+            "# HELP files Processed files.\n"
+            'files_total{file_type="audio"} 3\n'
+            "# TYPE latency_seconds histogram\n"
+            "# HELP latency_seconds Latency.\n"
+            'latency_seconds_bucket{le="1"} 1\n'
+            'latency_seconds_bucket{le="5"} 2\n'
+            'latency_seconds_bucket{le="+Inf"} 2\n'
+            "latency_seconds_count 2\n"
+            "latency_seconds_sum 3.5\n"
+            "# EOF\n"
+        )
+
+    def test_merge_snapshot(self):
+        worker = MetricsRegistry()
+        files = worker.counter("files", "Processed files.", ["file_type"])
+        latency = worker.histogram("latency_seconds", "Latency.", buckets=(1, 5))
+        files.inc(file_type="audio")
+        latency.observe(3)
+
+        parent = MetricsRegistry()
+        parent.counter("files", "Processed files.", ["file_type"]).inc(
+            file_type="audio"
+        )
+        parent.histogram("latency_seconds", "Latency.", buckets=(1, 5)).observe(0.5)
+        parent.merge(worker.snapshot())
+
+        assert parent.render() == (
+            "# TYPE files counter\n"
+            "# HELP files Processed files.\n"
+            'files_total{file_type="audio"} 2\n'
+            "# TYPE latency_seconds histogram\n"
+            "# HELP latency_seconds Latency.\n"
+            'latency_seconds_bucket{le="1"} 1\n'
+            'latency_seconds_bucket{le="5"} 2\n'
+            'latency_seconds_bucket{le="+Inf"} 2\n'
+            "latency_seconds_count 2\n"
+            "latency_seconds_sum 3.5\n"
+            "# EOF\n"
+        )
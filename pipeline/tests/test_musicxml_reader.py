@@ -0,0 +1,96 @@
+import os
+
+import music21
+import pytest
+
+from processors.basic_processors import (
+    AmbitusProcessor,
+    DurationProcessor,
+    MetadataProcessor,
+    TempoProcessor,
+    TimeSignatureProcessor,
+)
+from processors.contour_processor import ContourProcessor, RhythmProcessor
+from processors.musicxml_reader import UnsupportedMusicXML, read_musicxml
+
+SONG = os.path.join(os.path.dirname(__file__), "test.musicxml")
+
+EVENT_PROCESSORS = [
+    TimeSignatureProcessor,
+    TempoProcessor,
+    AmbitusProcessor,
+    DurationProcessor,
+    ContourProcessor,
+    RhythmProcessor,
+]
+
+# two voices, a chord, a grace note and a pickup measure
+VOICES = """<?xml version="1.0" encoding="UTF-8"?>
+<score-partwise version="3.1">
+  <part-list><score-part id="P1"><part-name>Voice</part-name></score-part></part-list>
+  <part id="P1">
+    <measure number="0">
+      <attributes><divisions>2</divisions><time><beats>3</beats><beat-type>4</beat-type></time></attributes>
+      <direction><direction-type><metronome><beat-unit>quarter</beat-unit><per-minute>96</per-minute>
+      </metronome></direction-type></direction>
+      <note><pitch><step>G</step><octave>4</octave></pitch><duration>2</duration><type>quarter</type></note>
+    </measure>
+    <measure number="1">
+      <note><grace/><pitch><step>B</step><octave>4</octave></pitch><type>eighth</type><voice>1</voice></note>
+      <note><pitch><step>C</step><octave>5</octave></pitch><duration>4</duration><voice>1</voice></note>
+      <note><chord/><pitch><step>E</step><octave>5</octave></pitch><duration>4</duration><voice>1</voice></note>
+      <note><pitch><step>D</step><alter>1</alter><octave>5</octave></pitch><duration>2</duration><voice>1</voice></note>
+      <backup><duration>6</duration></backup>
+      <note><pitch><step>C</step><octave>3</octave></pitch><duration>3</duration><voice>2</voice></note>
+      <note><rest/><duration>3</duration><voice>2</voice></note>
+    </measure>
+    <measure number="2">
+      <note><rest measure="yes"/><duration>8</duration></note>
+    </measure>
+  </part>
+</score-partwise>
+"""
+
+
+def write(tmp_path, content: str) -> str:
+    path = os.path.join(tmp_path, "song.musicxml")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+class TestMusicXMLReader:
+    @pytest.mark.parametrize("processor", EVENT_PROCESSORS)
+    def test_same_results_as_music21(self, processor):
+        events = read_musicxml(SONG)
+        song = music21.converter.parse(SONG)
+        assert processor(None).process_events(events) == processor(song).process()
+
+    @pytest.mark.parametrize("processor", EVENT_PROCESSORS)
+    def test_voices_chords_and_pickup(self, processor, tmp_path):
+        path = write(tmp_path, VOICES)
+        events = read_musicxml(path)
+        song = music21.converter.parse(path)
+        assert processor(None).process_events(events) == processor(song).process()
+
+    def test_duration_types(self):
+        duration = DurationProcessor(None).process_events(read_musicxml(SONG))
+        assert duration == {"measures": 33, "beats": 49.5}
+        assert isinstance(duration["beats"], float)
+
+    def test_unsupported_constructs(self, tmp_path):
+        harmony = VOICES.replace(
+            '<measure number="2">',
+            '<measure number="2"><harmony><root><root-step>C</root-step></root>'
+            "<kind>major</kind></harmony>",
+        )
+        with pytest.raises(UnsupportedMusicXML):
+            read_musicxml(write(tmp_path, harmony))
+
+        timewise = VOICES.replace("score-partwise", "score-timewise")
+        with pytest.raises(UnsupportedMusicXML):
+            read_musicxml(write(tmp_path, timewise))
+
+    def test_event_processors(self):
+        assert all(processor.supports_events() for processor in EVENT_PROCESSORS)
+        assert not MetadataProcessor.supports_events()
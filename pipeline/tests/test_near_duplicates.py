@@ -0,0 +1,48 @@
+import numpy as np
+
+import near_duplicates
+from near_duplicates import MinHasher, find_clusters, song_shingles
+
+
+def document(intervals, durations):
+    return {
+        "contour": {"melodic_contour_string_relative": " ".join(intervals)},
+        "rhythm": {"rhythm_string": " ".join(durations)},
+    }
+
+
+class TestNearDuplicates:
+    def test_find_clusters(self):
+        rng = np.random.default_rng(0)
+        tune = [str(x) for x in rng.integers(-5, 6, 200)]
+        rhythm = [str(x) for x in rng.choice(["1/1", "1/2", "3/2"], 200)]
+        arrangement = tune[:190] + ["12"] + tune[191:]
+        other = [str(x) for x in rng.integers(-5, 6, 200)]
+        other_rhythm = [str(x) for x in rng.choice(["1/1", "1/2", "3/2"], 200)]
+
+        hasher = MinHasher(128)
+        signatures = np.stack(
+            [
+                hasher.signature(song_shingles(document(x, y), 4))
+                for x, y in [
+                    (tune, rhythm),
+                    (other, other_rhythm),
+                    (arrangement, rhythm),
+                ]
+            ]
+        )
+        assert find_clusters(signatures, bands=32, threshold=0.5) == [[0, 2]]
+
+    def test_find_clusters_in_large_buckets(self, monkeypatch):
+        monkeypatch.setattr(near_duplicates, "MAX_PAIRWISE_BUCKET", 2)
+        # all rows share only the first band, 1 and 3 are similar to each other but not to 0
+        signatures = np.array(
+            [
+                [0, 0, 0, 0, 1, 1, 1, 1],
+                [0, 0, 0, 0, 2, 2, 2, 2],
+                [0, 0, 0, 0, 1, 1, 1, 5],
+                [0, 0, 0, 0, 2, 2, 2, 3],
+            ],
+            dtype=np.uint32,
+        )
+        assert find_clusters(signatures, bands=2, threshold=0.8) == [[0, 2], [1, 3]]
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+
+from helpers import read_results
+from output import (
+    ResultsWriter,
+    ShardedResultsWriter,
+    get_manifest_file,
+    get_shard_files,
+    is_manifest,
+    read_manifest,
+    remove_results,
+    shard_for,
+    write_manifest,
+)
+
+
+def result(file_hash: str) -> str:
+    return json.dumps(
+        {"file_hash_sha256": file_hash, "original_file": "<score-partwise/>"}
+    )
+
+
+class TestOutput:
+    def test_shard_for_is_deterministic(self):
+        file_hash = "ab" * 32
+        assert shard_for(file_hash, 4) == shard_for(file_hash, 4)
+        assert shard_for(file_hash, 1) == 0
+        assert 0 <= shard_for(file_hash, 7) < 7
+
+    def test_get_shard_files(self):
+        assert get_shard_files("out/results.json.zst", 2) == [
+            "out/results-00000-of-00002.jsonl.zst",
+            "out/results-00001-of-00002.jsonl.zst",
+        ]
+        assert get_manifest_file("out/results.json.zst") == "out/results.manifest.json"
+        assert is_manifest("out/results.manifest.json")
+        assert not is_manifest("out/results.json")
+
+    def test_sharded_writer_and_manifest(self, tmp_path):
+        out_file = str(tmp_path / "results.json")
+        hashes = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(10)]
+        shard_files = get_shard_files(out_file, 3)
+        with ShardedResultsWriter(out_file, 3, split_blobs=True) as writer:
+            for file_hash in hashes:
+                writer.write(result(file_hash))
+        manifest_file = get_manifest_file(out_file)
+        write_manifest(manifest_file, shard_files, writer.records)
+
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        assert manifest["shard_count"] == 3
+        assert manifest["records"] == len(hashes)
+        assert all(shard["records"] > 0 for shard in manifest["shards"])
+        assert all("blobs" in shard for shard in manifest["shards"])
+
+        paths = read_manifest(manifest_file)
+        assert paths == [os.path.abspath(x) for x in shard_files]
+        for shard, path in enumerate(paths):
+            records = list(read_results([path]))
+            assert all(shard_for(x["file_hash_sha256"], 3) == shard for x in records)
+            assert all("original_file" not in x for x in records)
+        # the manifest expands to all the shards
+        assert sorted(
+            x["file_hash_sha256"] for x in read_results([manifest_file])
+        ) == sorted(hashes)
+
+    def test_remove_results(self, tmp_path):
+        out_file = str(tmp_path / "results.json.gz")
+        with ResultsWriter(out_file, split_blobs=True) as writer:
+            for file_hash in ["a", "b", "c"]:
+                writer.write(result(file_hash))
+        remove_results(out_file, {"b"})
+        assert [x["file_hash_sha256"] for x in read_results([out_file])] == ["a", "c"]
+        blob_file = str(tmp_path / "results.blobs.json.gz")
+        assert [x["file_hash_sha256"] for x in read_results([blob_file])] == ["a", "c"]
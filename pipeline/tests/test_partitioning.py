@@ -0,0 +1,84 @@
+import pytest
+
+import partitioning
+
+MAPPING = {
+    "properties": {
+        "corpus_id": {"type": "keyword"},
+        "title": {"type": "text"},
+    }
+}
+
+
+class TestPartitioning:
+    def test_routed_mapping(self):
+        mapping = partitioning.partition_mapping(
+            MAPPING, partitioning.PARTITIONING_ROUTING, 6, 2
+        )
+        assert mapping["_routing"] == {"required": True}
+        assert mapping["_meta"] == {"partitioning": "routing"}
+        assert mapping["settings"] == {
+            "number_of_shards": 6,
+            "routing_partition_size": 2,
+        }
+        assert partitioning.split_settings(mapping) == (
+            {key: value for key, value in mapping.items() if key != "settings"},
+            mapping["settings"],
+        )
+        # the mapping of the processors is left as it is
+        assert "_meta" not in MAPPING
+
+    def test_corpus_index_mapping(self):
+        mapping = partitioning.partition_mapping(
+            MAPPING, partitioning.PARTITIONING_INDEX
+        )
+        assert mapping["properties"]["corpus_id"] == {"type": "constant_keyword"}
+        assert "_routing" not in mapping
+        assert "settings" not in mapping
+        assert partitioning.get_partitioning(mapping) == "index"
+        assert partitioning.get_partitioning(MAPPING) == "none"
+
+    def test_unknown_partitioning(self):
+        with pytest.raises(ValueError):
+            partitioning.partition_mapping(MAPPING, "shards")
+
+    @pytest.mark.parametrize(
+        "index_partitioning, target",
+        [
+            ("none", ("songs", None)),
+            ("routing", ("songs", "AbC123")),
+            ("index", ("songs-corpus-abc123", None)),
+        ],
+    )
+    def test_get_target(self, index_partitioning, target):
+        assert partitioning.get_target("songs", "AbC123", index_partitioning) == target
+        assert partitioning.get_target("songs", None, index_partitioning) == (
+            "songs",
+            None,
+        )
+
+    def test_corpus_template(self):
+        templates = {}
+
+        class FakeIndices:
+            def put_index_template(self, name, index_patterns, template):
+                templates[name] = (index_patterns, template)
+
+        class FakeClient:
+            indices = FakeIndices()
+
+        mapping = partitioning.partition_mapping(
+            MAPPING, partitioning.PARTITIONING_INDEX
+        )
+        # merged with the mapping of an existing corpus index
+        mapping["properties"]["corpus_id"]["value"] = "abc"
+        partitioning.put_corpus_template(
+            FakeClient(), "songs", mapping, {"number_of_shards": 2}
+        )
+        patterns, template = templates["songs-corpus"]
+        assert patterns == ["songs-corpus-*"]
+        assert template["aliases"] == {"songs": {}}
+        assert template["settings"] == {"number_of_shards": 2}
+        assert template["mappings"]["properties"]["corpus_id"] == {
+            "type": "constant_keyword"
+        }
@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+
+from processors import pcm_cache
+
+SONG = os.path.join(os.path.dirname(__file__), "test.mp3")
+VOCALS = os.path.join(os.path.dirname(__file__), "test.vocals.mp3")
+
+
+@pytest.fixture
+def decoded(monkeypatch, tmp_path):
+    """Enables the cache in a temporary directory and counts the decodes instead of running essentia."""
+    calls = []
+
+    def decode(path, sample_rate):
+        calls.append((path, sample_rate))
+        return np.full(sample_rate, len(calls), dtype=np.float32)
+
+    monkeypatch.setattr(pcm_cache, "decode", decode)
+    pcm_cache.configure(str(tmp_path))
+    yield calls
+    pcm_cache.configure(None)
+
+
+class TestPCMCache:
+    def test_second_load_is_not_decoded(self, decoded):
+        first = pcm_cache.load_mono(SONG, 1000)
+        second = pcm_cache.load_mono(SONG, 1000)
+        assert decoded == [(SONG, 1000)]
+        assert isinstance(second, np.memmap)
+        np.testing.assert_array_equal(first, second)
+
+    def test_sample_rates_are_cached_separately(self, decoded):
+        pcm_cache.load_mono(SONG, 1000)
+        pcm_cache.load_mono(SONG, 2000)
+        assert len(decoded) == 2
+        assert len(pcm_cache.load_mono(SONG, 2000)) == 2000
+
+    def test_least_recently_used_is_evicted(self, decoded, tmp_path):
+        pcm_cache.load_mono(SONG, 1000)
+        size = os.path.getsize(pcm_cache.get_cache_file(SONG, 1000))
+        pcm_cache.configure(str(tmp_path), max_gb=1.5 * size / 1024**3)
+        pcm_cache.load_mono(VOCALS, 1000)
+        assert not os.path.exists(pcm_cache.get_cache_file(SONG, 1000))
+        assert os.path.exists(pcm_cache.get_cache_file(VOCALS, 1000))
+
+    def test_disabled_cache_decodes_every_time(self, decoded):
+        pcm_cache.configure(None)
+        pcm_cache.load_mono(SONG, 1000)
+        pcm_cache.load_mono(SONG, 1000)
+        assert len(decoded) == 2
+
+    def test_cached_torchaudio_decode_is_unchanged(self, tmp_path):
+        pytest.importorskip("torchaudio")
+        import soundfile
+
+        sample_rate = soundfile.SoundFile(VOCALS).samplerate
+        decoded = pcm_cache.load_mono(VOCALS, sample_rate, decoder="torchaudio")
+        pcm_cache.configure(str(tmp_path))
+        try:
+            pcm_cache.load_mono(VOCALS, sample_rate, decoder="torchaudio")
+            cached = pcm_cache.load_mono(VOCALS, sample_rate, decoder="torchaudio")
+            assert os.path.exists(
+                pcm_cache.get_cache_file(VOCALS, sample_rate, "torchaudio")
+            )
+            np.testing.assert_array_equal(decoded, cached)
+        finally:
+            pcm_cache.configure(None)
@@ -9,6 +9,7 @@ from processors.basic_processors import (
     TempoProcessor,
     TimeSignatureProcessor,
     KeyProcessor,
+    FastKeyProcessor,
 )
 
 
@@ -26,6 +27,13 @@ class TestBasicProcessors:
         key_processor = KeyProcessor(song())
         assert key_processor.process() == snapshot
 
+    def test_fast_key_processor(self):
+        assert FastKeyProcessor(song()).process() == KeyProcessor(song()).process()
+
+    def test_fast_key_processor_batch(self):
+        results = FastKeyProcessor.process_batch([song(), song()])
+        assert results == [KeyProcessor(song()).process()] * 2
+
     def test_time_signature_processor(self):
         time_signature_processor = TimeSignatureProcessor(song())
         assert time_signature_processor.process() == "3/8"
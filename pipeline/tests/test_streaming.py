@@ -0,0 +1,67 @@
+import os
+from functools import partial
+
+import numpy as np
+import pytest
+import soundfile
+
+from processors import streaming
+
+SONG = os.path.join(os.path.dirname(__file__), "test.mp3")
+
+
+def window_length(window):
+    return window.length
+
+
+class TestStreaming:
+    def test_windows_cover_the_recording(self):
+        windows = list(streaming.iter_windows(SONG, 30, context_seconds=1))
+        info = soundfile.info(SONG)
+        assert sum(window.length for window in windows) == info.frames
+        assert [window.start for window in windows] == [
+            i * 30 * info.samplerate for i in range(len(windows))
+        ]
+        # the first window is padded with zeros, the others start with the end of the previous one
+        assert np.all(windows[0].audio[: info.samplerate] == 0)
+        first, second = windows[0], windows[1]
+        np.testing.assert_array_equal(
+            second.audio[: second.context],
+            first.audio[first.context + first.length - second.context :][
+                : second.context
+            ],
+        )
+
+    def test_map_windows_keeps_order(self):
+        lengths = streaming.map_windows(window_length, SONG, 30, workers=2)
+        assert lengths == [window.length for window in streaming.iter_windows(SONG, 30)]
+
+    def test_streamed_rms_matches_whole_file(self):
+        es = pytest.importorskip("essentia.standard")
+        sample_rate = soundfile.info(SONG).samplerate
+        frame_size = int(sample_rate / 16)
+        hop_size = int(frame_size / 2)
+        # the frames of the whole file, as AudioRMSProcessor computes them for short recordings
+        audio = es.MonoLoader(filename=SONG, sampleRate=sample_rate)()
+        rms = es.RMS()
+        whole = [
+            rms(frame)
+            for frame in es.FrameGenerator(
+                audio, frameSize=frame_size, hopSize=hop_size
+            )
+        ]
+        windows = streaming.map_windows(
+            partial(streaming.rms_window, frame_size=frame_size, hop_size=hop_size),
+            SONG,
+            window_seconds=17,
+            context_seconds=streaming.RMS_CONTEXT_SECONDS,
+            workers=1,
+        )
+        streamed = [x for window in windows for x in window]
+        assert len(streamed) == len(whole)
+        # the decoders of essentia and soundfile differ in the last bits
+        np.testing.assert_allclose(streamed, whole, atol=1e-5)
+
+    def test_bpm_from_ticks(self):
+        assert streaming.bpm_from_ticks([0.0, 0.5, 1.0, 1.5]) == 120
+        assert streaming.bpm_from_ticks([1.0]) == 0
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+# the client of upload is created on import, it never connects in these tests
+os.environ.setdefault("ELASTIC_HOST", "http://localhost:9200")
+os.environ.setdefault("ELASTIC_USER", "elastic")
+os.environ.setdefault("ELASTIC_PASSWORD", "elastic")
+
+import upload  # noqa: E402
+
+
+class FakeClient:
+    """Answers bulk requests with the statuses of the documents, one list of statuses per request."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def bulk(self, operations):
+        # index actions are followed by their document, delete actions aren't
+        actions = [
+            (action, operation[action]["_id"])
+            for operation in operations
+            for action in ["index", "delete"]
+            if action in operation
+        ]
+        self.requests.append([file_hash for _, file_hash in actions])
+        statuses = self.responses[len(self.requests) - 1]
+        items = []
+        for (action, _), status in zip(actions, statuses):
+            result = {"status": status}
+            # ElasticSearch answers deletes of missing documents with 404 and no error
+            if status >= 300 and not (action == "delete" and status == 404):
+                result["error"] = {"type": "rejected", "reason": str(status)}
+            items.append({action: result})
+        return {"items": items}
+
+
+def documents(count):
+    return [{"file_hash_sha256": f"hash{i}", "title": str(i)} for i in range(count)]
+
+
+class TestBulkIndex:
+    @pytest.fixture(autouse=True)
+    def no_backoff(self, monkeypatch):
+        monkeypatch.setattr(upload.time, "sleep", lambda seconds: None)
+
+    def test_overloaded_documents_are_retried(self, monkeypatch):
+        client = FakeClient([[201, 429, 429], [429, 201], [201]])
+        monkeypatch.setattr(upload, "client", client)
+        upload.bulk_index(documents(3), "songs")
+        assert client.requests == [
+            ["hash0", "hash1", "hash2"],
+            ["hash1", "hash2"],
+            ["hash1"],
+        ]
+
+    def test_rejected_documents_fail_after_the_rest_are_sent(self, monkeypatch):
+        client = FakeClient([[201, 400], [201, 201]])
+        monkeypatch.setattr(upload, "client", client)
+        with pytest.raises(upload.BulkIndexError) as error:
+            upload.bulk_index(documents(4), "songs", chunk_size=2)
+        assert len(client.requests) == 2
+        assert [file_hash for file_hash, _ in error.value.failures] == ["hash1"]
+
+    def test_retries_run_out(self, monkeypatch):
+        client = FakeClient([[429]] * (upload.BULK_MAX_RETRIES + 1))
+        monkeypatch.setattr(upload, "client", client)
+        with pytest.raises(upload.BulkIndexError):
+            upload.bulk_index(documents(1), "songs")
+        assert len(client.requests) == upload.BULK_MAX_RETRIES + 1
+
+
+class TestBulkDelete:
+    def test_missing_documents_are_ignored(self, monkeypatch):
+        client = FakeClient([[200, 404]])
+        monkeypatch.setattr(upload, "client", client)
+        upload.bulk_delete(["hash0", "hash1"], "songs")
+        assert client.requests == [["hash0", "hash1"]]
+
+    def test_failed_deletes_raise(self, monkeypatch):
+        client = FakeClient([[200, 200, 503, 200]])
+        monkeypatch.setattr(upload, "client", client)
+        with pytest.raises(upload.BulkIndexError) as error:
+            upload.bulk_delete(["hash0", "hash1"], "songs", blob_index="songs-blobs")
+        assert [file_hash for file_hash, _ in error.value.failures] == ["hash0"]
@@ -0,0 +1,50 @@
+import os
+
+from watch import WatchManifest, get_watch_manifest_file
+
+
+def write(path, content: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+class TestWatch:
+    def test_get_watch_manifest_file(self):
+        assert (
+            get_watch_manifest_file("out/results.json.zst") == "out/results.watch.json"
+        )
+
+    def test_files_are_ready_once_they_stop_changing(self, tmp_path):
+        write(tmp_path / "a.musicxml", "<score-partwise/>")
+        manifest = WatchManifest(str(tmp_path / "results.watch.json"), str(tmp_path))
+        assert manifest.scan() == ([], [])
+        ready, deleted = manifest.scan()
+        assert [name for name, _, _ in ready] == ["a.musicxml"]
+        assert deleted == []
+
+    def test_changed_and_deleted_files(self, tmp_path):
+        write(tmp_path / "a.musicxml", "<score-partwise/>")
+        write(tmp_path / "b.musicxml", "<score-partwise/>")
+        manifest = WatchManifest(str(tmp_path / "results.watch.json"), str(tmp_path))
+        manifest.scan()
+        for name, signature, file_hash in manifest.scan()[0]:
+            manifest.add(name, signature, file_hash)
+        manifest.save()
+
+        # touching a file without changing it doesn't process it again
+        os.utime(tmp_path / "a.musicxml", ns=(0, 0))
+        write(tmp_path / "b.musicxml", "<score-partwise></score-partwise>")
+        manifest = WatchManifest(str(tmp_path / "results.watch.json"), str(tmp_path))
+        manifest.scan()
+        ready, _ = manifest.scan()
+        assert [name for name, _, _ in ready] == ["b.musicxml"]
+        assert manifest.files["a.musicxml"]["mtime_ns"] == 0
+
+        os.remove(tmp_path / "a.musicxml")
+        assert manifest.scan()[1] == ["a.musicxml"]
+
+    def test_failed_files_have_no_results(self, tmp_path):
+        manifest = WatchManifest(str(tmp_path / "results.watch.json"), str(tmp_path))
+        manifest.add("a.musicxml", {"size": 1, "mtime_ns": 1}, "abc")
+        manifest.add("b.musicxml", {"size": 1, "mtime_ns": 1}, "def", failed=True)
+        assert manifest.hashes() == {"abc"}
@@ -1,5 +1,7 @@
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import urllib3
 from tqdm import tqdm
@@ -9,6 +11,12 @@ from dotenv import load_dotenv
 import typer
 from typer_config.decorators import use_yaml_config
 
+import index_versions
+import metrics
+import partitioning
+from helpers import get_blob_file, merge, open_ndjson, split_document
+from output import is_manifest, read_manifest
+
 app = typer.Typer()
 
 load_dotenv()
@@ -31,39 +39,245 @@ else:
     )
 
 
-def index_document(json_str: str, index: str):
-    """Indexes a single document in the ElasticSearch database."""
-    try:
-        json.loads(json_str)
-    except json.JSONDecodeError as e:
-        raise e
+# documents are sent in bulk requests of at most this many documents or bytes
+BULK_CHUNK_SIZE = 500
+BULK_MAX_CHUNK_BYTES = 50 * 1024 * 1024
+# how many times documents rejected with 429 (Too Many Requests) are retried
+BULK_MAX_RETRIES = 3
+
+
+def prepare_document(json_str: str) -> dict:
+    """Parses a single JSON document and prepares it for indexing."""
     json_obj = json.loads(json_str)
     if "_source" in json_obj:  # if from dump, extract only source
         json_obj = json_obj["_source"]
         # clean all the _ keys
-        for key in json_obj.keys():
+        for key in list(json_obj.keys()):
             if key.startswith("_"):
                 del json_obj[key]
     if "file_hash_sha256" not in json_obj:
         raise ValueError("file_hash_sha256 field is missing")
-    client.index(
-        index=index, document=json.dumps(json_obj), id=json_obj["file_hash_sha256"]
-    )
+    return json_obj
+
 
+# blob documents are only fetched by id, nothing in them is searchable
+BLOB_MAPPING = {
+    "dynamic": False,
+    "properties": {
+        "file_hash_sha256": {"type": "keyword"},
+        "corpus_id": {"type": "keyword"},
+    },
+}
 
-def merge(source, destination):
+
+class BulkIndexError(Exception):
+    """Documents rejected by ElasticSearch, raised once all the other documents were sent."""
+
+    def __init__(self, failures: list[tuple[str, dict]], action: str = "indexed"):
+        self.failures = failures
+        super().__init__(
+            f"{len(failures)} documents were not {action}, e.g. {failures[0][0]}: {failures[0][1]}"
+        )
+
+
+def send_bulk(actions: list[tuple[str, dict, str]]) -> list[tuple[str, dict]]:
     """
-    Deep merge two dictionaries. https://stackoverflow.com/questions/20656135/python-deep-merge-dictionary-data
+    Indexes (index, document, routing) triples with a single bulk request, routing is None for the default one.
+    Documents rejected with 429 are retried with a backoff. Returns the file hashes and errors of the documents
+    that were rejected otherwise or ran out of retries.
     """
-    for key, value in source.items():
-        if isinstance(value, dict):
-            # get node or create one
-            node = destination.setdefault(key, {})
-            merge(value, node)
-        else:
-            destination[key] = value
+    failures = []
+    retries = 0
+    while len(actions) > 0:
+        operations = []
+        for index, document, routing in actions:
+            operation = {"_index": index, "_id": document["file_hash_sha256"]}
+            if routing is not None:
+                operation["routing"] = routing
+            operations.append({"index": operation})
+            operations.append(document)
+
+        with metrics.bulk_request_seconds.time():
+            response = client.bulk(operations=operations)
+        metrics.last_progress.set(time.time())
+
+        to_retry = []
+        for action, item in zip(actions, response["items"]):
+            result = item["index"]
+            if "error" not in result:
+                metrics.documents_indexed.inc()
+                continue
+            metrics.bulk_rejections.inc(status=result["status"])
+            if result["status"] == 429 and retries < BULK_MAX_RETRIES:
+                to_retry.append(action)
+            else:
+                tqdm.write(
+                    f"Document {action[1]['file_hash_sha256']} was rejected: {result['error']}"
+                )
+                failures.append((action[1]["file_hash_sha256"], result["error"]))
+
+        actions = to_retry
+        if len(actions) > 0:
+            retries += 1
+            time.sleep(2**retries)
+    return failures
+
+
+def bulk_index(
+    documents,
+    index: str,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    blob_index: str = None,
+    index_partitioning: str = partitioning.PARTITIONING_NONE,
+):
+    """
+    Indexes an iterable of documents with bulk requests. If blob_index is set, the blob fields of the documents
+    are split off and indexed there. The documents are routed by their corpus as index_partitioning says.
+    Raises BulkIndexError after sending all the documents if any of them were rejected.
+    """
+    failures = []
+    chunk = []
+    chunk_bytes = 0
+    for document in documents:
+        blob = None
+        if blob_index is not None:
+            document, blob = split_document(document)
+        target, routing = partitioning.get_target(
+            index, document.get("corpus_id"), index_partitioning
+        )
+        chunk.append((target, document, routing))
+        chunk_bytes += len(json.dumps(document))
+        if blob is not None:
+            chunk.append((blob_index, blob, None))
+            chunk_bytes += len(json.dumps(blob))
+        if len(chunk) >= chunk_size or chunk_bytes >= BULK_MAX_CHUNK_BYTES:
+            failures += send_bulk(chunk)
+            chunk = []
+            chunk_bytes = 0
+    if len(chunk) > 0:
+        failures += send_bulk(chunk)
+    if len(failures) > 0:
+        raise BulkIndexError(failures)
+
+
+def bulk_delete(
+    file_hashes,
+    index: str,
+    blob_index: str = None,
+    index_partitioning: str = partitioning.PARTITIONING_NONE,
+    corpus_id: str = None,
+):
+    """
+    Deletes the documents of the file hashes in the corpus and their blob documents. Missing documents are
+    ignored. Raises BulkIndexError if any of the others were not deleted.
+    """
+    target, routing = partitioning.get_target(index, corpus_id, index_partitioning)
+    operation = {"_index": target}
+    if routing is not None:
+        operation["routing"] = routing
+    operations = [
+        {"delete": {**operation, "_id": file_hash}} for file_hash in file_hashes
+    ]
+    if blob_index is not None:
+        operations += [
+            {"delete": {"_index": blob_index, "_id": file_hash}}
+            for file_hash in file_hashes
+        ]
+    if len(operations) == 0:
+        return
+    with metrics.bulk_request_seconds.time():
+        response = client.bulk(operations=operations)
+    metrics.last_progress.set(time.time())
+
+    failures = []
+    for operation, item in zip(operations, response["items"]):
+        result = item["delete"]
+        if "error" not in result or result["status"] == 404:
+            continue
+        metrics.bulk_rejections.inc(status=result["status"])
+        tqdm.write(
+            f"Document {operation['delete']['_id']} was not deleted: {result['error']}"
+        )
+        failures.append((operation["delete"]["_id"], result["error"]))
+    if len(failures) > 0:
+        raise BulkIndexError(failures, "deleted")
+
+
+def prepare_index(
+    index: str,
+    mapping: dict,
+    delete_index: bool = False,
+    merge_mapping: bool = False,
+    blob_index: str = None,
+) -> str:
+    """
+    Creates the index and the blob index if they don't exist yet and puts the mapping. Returns the partitioning of
+    the index, which is kept from its creation (see generate-mapping --partitioning).
+    """
+    mapping, settings = partitioning.split_settings(mapping)
+    requested_partitioning = mapping.get("_meta", {}).get("partitioning")
+    index_partitioning = partitioning.get_index_partitioning(client, index)
+    if delete_index is True and index_partitioning is not None:
+        if index_versions.is_versioned(client, index):
+            raise typer.BadParameter(
+                f"{index} is an alias of versioned indices, load a new version with --new-version instead"
+            )
+        if index_partitioning == partitioning.PARTITIONING_INDEX:
+            raise typer.BadParameter(
+                f"{index} is an alias of corpus indices, delete the indices of the corpora instead"
+            )
+        client.indices.delete(index=index)
+        index_partitioning = None
+
+    if index_partitioning is None:
+        index_partitioning = requested_partitioning or partitioning.PARTITIONING_NONE
+    elif requested_partitioning not in (None, index_partitioning):
+        raise typer.BadParameter(
+            f"{index} is partitioned by {index_partitioning}, not {requested_partitioning}. Load it again with "
+            "--new-version or --delete-index to change it"
+        )
 
-    return destination
+    merged_mapping = mapping
+
+    if merge_mapping is True and client.indices.exists(index=index):
+        existing_mapping = client.indices.get_mapping(index=index)
+        # keyed by the concrete index if index is an alias
+        existing_mapping_dict = next(iter(existing_mapping.values()))["mappings"]
+        merged_mapping = merge(mapping, existing_mapping_dict)
+
+    properties = merged_mapping["properties"]
+    if index_partitioning == partitioning.PARTITIONING_INDEX:
+        # corpus indices are created from the template when their first document arrives
+        partitioning.put_corpus_template(client, index, merged_mapping, settings)
+        # the corpus_id of existing corpus indices is already set
+        properties = {
+            key: value for key, value in properties.items() if key != "corpus_id"
+        }
+    elif not client.indices.exists(index=index):
+        client.indices.create(
+            index=index,
+            settings=settings or None,
+            mappings={
+                key: value for key, value in mapping.items() if key != "properties"
+            },
+        )
+
+    if client.indices.exists(index=index):
+        client.indices.put_mapping(
+            index=index, properties=properties
+        )  # this is so we don't ignore 400 errors on mapping syntax
+
+    prepare_blob_index(blob_index, delete_index)
+    return index_partitioning
+
+
+def prepare_blob_index(blob_index: str, delete_index: bool = False):
+    if blob_index is not None:
+        if delete_index is True:
+            client.options(ignore_status=404).indices.delete(index=blob_index)
+        client.options(ignore_status=400).indices.create(
+            index=blob_index, mappings=BLOB_MAPPING
+        )
 
 
 @app.command()
@@ -73,7 +287,9 @@ def upload(
     json_file: Annotated[
         str,
         typer.Option(
-            help="Path to the JSON file to upload. It should feature one JSON file for each line."
+            help="Path to the JSON file to upload. It should feature one JSON file for each line. "
+            "Files ending with .gz or .zst are decompressed while reading. A manifest written by "
+            "`process --shards` uploads all the shards in parallel."
         ),
     ] = None,
     json_dir: Annotated[
@@ -91,18 +307,68 @@ def upload(
     delete_index: Annotated[
         bool, typer.Option(help="Whether to delete the index before uploading.")
     ] = False,
+    new_version: Annotated[
+        bool,
+        typer.Option(
+            help="Upload into a new version of the index, e.g. 'songs-v8', and point the index name, an alias, to "
+            "it once the upload is done. Searches use the previous version until then."
+        ),
+    ] = False,
+    reindex_live: Annotated[
+        bool,
+        typer.Option(
+            help="With --new-version, first copy the documents of the live version with ElasticSearch's _reindex, "
+            "e.g. to apply a new mapping without processing the files again. Uploaded documents replace them."
+        ),
+    ] = False,
+    keep_versions: Annotated[
+        int,
+        typer.Option(
+            help="Number of versions of the index kept for `rollback`, including the live one"
+        ),
+    ] = index_versions.KEEP_VERSIONS,
     merge_mapping: Annotated[
         bool, typer.Option(help="Whether to merge the mapping with the existing one.")
     ] = False,
+    chunk_size: Annotated[
+        int, typer.Option(help="Number of documents sent in a single bulk request.")
+    ] = BULK_CHUNK_SIZE,
+    metrics_file: Annotated[
+        str,
+        typer.Option(help="Periodically write OpenMetrics metrics of the run here"),
+    ] = None,
+    metrics_port: Annotated[
+        int,
+        typer.Option(help="Serve OpenMetrics metrics of the run on this local port"),
+    ] = None,
+    parallel: Annotated[
+        int,
+        typer.Option(help="Number of shards of a manifest uploaded at the same time"),
+    ] = 4,
+    blob_index: Annotated[
+        str,
+        typer.Option(
+            help="Index for the original files and raw audio arrays, e.g. 'songs-blobs'. They are split off the "
+            "documents and the blob file written by `process --split-blobs` is uploaded as well."
+        ),
+    ] = None,
 ):
     """Uploads JSON files to the ElasticSearch database."""
     if json_file is not None and json_dir is not None:
         raise typer.BadParameter("Cannot specify both json_file and json_dir")
 
-    if json_file is None and json_dir is None:
+    if json_file is None and json_dir is None and not reindex_live:
         raise typer.BadParameter("Must specify either json_file or json_dir")
 
+    if new_version and delete_index:
+        raise typer.BadParameter("Cannot specify both new_version and delete_index")
+
+    if reindex_live and not new_version:
+        raise typer.BadParameter("reindex_live requires new_version")
+
     if mapping_file is None:
+        if json_file is None and json_dir is None:
+            raise typer.BadParameter("Must specify mapping_file when reindexing only")
         if json_file is not None:
             mapping_file = os.path.join(os.path.dirname(json_file), "mapping.json")
             if os.path.exists(mapping_file) is False:
@@ -114,34 +380,133 @@ def upload(
 
     with open(mapping_file, "r", encoding="utf-8") as f:
         mapping = json.load(f)
-    if delete_index is True:
-        client.options(ignore_status=404).indices.delete(index=index)
-    client.options(ignore_status=400).indices.create(index=index)
 
-    merged_mapping = mapping
+    metrics.registry.start(metrics_file, metrics_port)
+    try:
+        if new_version:
+            # the new version is partitioned like the live one
+            mapping = partitioning.inherit_partitioning(client, index, mapping)
+            index_partitioning = partitioning.get_partitioning(mapping)
+            if index_partitioning == partitioning.PARTITIONING_INDEX:
+                raise typer.BadParameter(
+                    "Corpus indices are not versioned, use --new-version with routed indices"
+                )
+            # the blob documents are only fetched by id and keep their mapping, they are not versioned
+            prepare_blob_index(blob_index)
+            with index_versions.NewVersion(
+                client, index, mapping, merge_mapping, reindex_live, keep_versions
+            ) as version_index:
+                upload_documents(
+                    version_index,
+                    json_file,
+                    json_dir,
+                    chunk_size,
+                    parallel,
+                    blob_index,
+                    index_partitioning,
+                )
+        else:
+            index_partitioning = prepare_index(
+                index, mapping, delete_index, merge_mapping, blob_index
+            )
+            upload_documents(
+                index,
+                json_file,
+                json_dir,
+                chunk_size,
+                parallel,
+                blob_index,
+                index_partitioning,
+            )
+    finally:
+        metrics.registry.flush()
 
-    if merge_mapping is True:
-        existing_mapping = client.indices.get_mapping(index=index)
-        existing_mapping_dict = existing_mapping[index]["mappings"]
-        merged_mapping = merge(mapping, existing_mapping_dict)
 
-    client.indices.put_mapping(
-        index=index, properties=merged_mapping["properties"]
-    )  # this is so we don't ignore 400 errors on mapping syntax
+@app.command()
+def rollback(
+    index: str,
+    version: Annotated[
+        int,
+        typer.Option(
+            help="Version to point the index to, by default the one before the live version"
+        ),
+    ] = None,
+):
+    """Points the alias of a versioned index back to an older version, see `upload --new-version`."""
+    try:
+        target = index_versions.rollback(client, index, version)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    print(f"{index} now points to {target}")
 
-    if json_file is not None:
-        with open(json_file, "r", encoding="utf-8") as f:
-            for i, line in tqdm(enumerate(f)):
-                try:
-                    index_document(line, index)
-                except json.JSONDecodeError:
-                    print(f"Line {i} is not valid JSON. Skipping...")
+
+def upload_documents(
+    index: str,
+    json_file: str,
+    json_dir: str,
+    chunk_size: int,
+    parallel: int,
+    blob_index: str = None,
+    index_partitioning: str = partitioning.PARTITIONING_NONE,
+):
+    """Uploads a JSON file, all the shards of a manifest or a directory of JSON files into the index."""
+    if json_file is not None and is_manifest(json_file):
+        shard_files = read_manifest(json_file)
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            futures = [
+                executor.submit(
+                    upload_file,
+                    shard_file,
+                    index,
+                    chunk_size,
+                    blob_index,
+                    index_partitioning,
+                )
+                for shard_file in shard_files
+            ]
+            for future in futures:
+                future.result()
+    elif json_file is not None:
+        upload_file(json_file, index, chunk_size, blob_index, index_partitioning)
 
     if json_dir is not None:
-        for file in tqdm(os.listdir(json_dir)):
-            if file.endswith(".json"):
-                with open(os.path.join(json_dir, file), "r", encoding="utf-8") as f:
-                    try:
-                        index_document(f, index)
-                    except json.JSONDecodeError:
-                        print(f"{json_file} is not valid JSON. Skipping...")
+        bulk_index(
+            read_json_dir(json_dir), index, chunk_size, blob_index, index_partitioning
+        )
+
+
+def upload_file(
+    json_file: str,
+    index: str,
+    chunk_size: int,
+    blob_index: str = None,
+    index_partitioning: str = partitioning.PARTITIONING_NONE,
+):
+    """Uploads a file with one JSON document per line and its blob file if blob_index is set."""
+    bulk_index(
+        read_json_file(json_file), index, chunk_size, blob_index, index_partitioning
+    )
+    blob_file = get_blob_file(json_file)
+    if blob_index is not None and os.path.exists(blob_file):
+        bulk_index(read_json_file(blob_file), blob_index, chunk_size)
+
+
+def read_json_file(json_file: str):
+    """Yields the documents of a file with one JSON document per line."""
+    with open_ndjson(json_file) as f:
+        for i, line in tqdm(enumerate(f), desc=os.path.basename(json_file)):
+            try:
+                yield prepare_document(line)
+            except json.JSONDecodeError:
+                print(f"Line {i} is not valid JSON. Skipping...")
+
+
+def read_json_dir(json_dir: str):
+    """Yields the documents of a directory where each JSON file is a separate document."""
+    for file in tqdm(os.listdir(json_dir)):
+        if file.endswith(".json"):
+            with open(os.path.join(json_dir, file), "r", encoding="utf-8") as f:
+                try:
+                    yield prepare_document(f.read())
+                except json.JSONDecodeError:
+                    print(f"{file} is not valid JSON. Skipping...")
@@ -0,0 +1,130 @@
+"""
+Incremental processing of a corpus directory for `process --watch`. A manifest next to the results keeps the size,
+modification time and hash of every processed file, so only new and changed files are processed and the results of
+deleted files are removed.
+"""
+
+import json
+import os
+
+from helpers import (
+    check_audio_extension_allowed,
+    filter_files,
+    hash_file,
+    split_compression,
+)
+
+# seconds between the scans of the directory
+WATCH_INTERVAL_SECONDS = 5
+WATCH_MANIFEST_SUFFIX = ".watch.json"
+
+
+def get_watch_manifest_file(out_file: str) -> str:
+    """Returns the manifest of a results file, e.g. results.json.zst -> results.watch.json"""
+    path, _ = split_compression(out_file)
+    root, _ = os.path.splitext(path)
+    return root + WATCH_MANIFEST_SUFFIX
+
+
+def get_stem_files(path: str) -> list[str]:
+    """Returns the vocals and accompaniment of a recording, which the audio processors read next to it."""
+    root, _ = os.path.splitext(path)
+    return [root + ".vocals.mp3", root + ".accompaniment.mp3"]
+
+
+def get_signature(path: str) -> dict:
+    """
+    Returns the size and modification time of the file. Recordings include their stems, so they are processed
+    again once the stems are extracted.
+    """
+    stat = os.stat(path)
+    signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if check_audio_extension_allowed(path):
+        signature["stems"] = [
+            [os.path.getsize(stem), os.stat(stem).st_mtime_ns]
+            if os.path.exists(stem)
+            else None
+            for stem in get_stem_files(path)
+        ]
+    return signature
+
+
+class WatchManifest:
+    """
+    The signature and hash of every file of in_dir whose results are in the output. Files that failed are kept
+    too, marked as failed, so they are only processed again when they change.
+    """
+
+    def __init__(self, path: str, in_dir: str):
+        self.path = path
+        self.in_dir = in_dir
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.files = json.load(f)["files"]
+        # signatures of the previous scan, files are only ready once they stopped changing
+        self._previous = {}
+
+    def scan(self) -> tuple[list[tuple[str, dict, str]], list[str]]:
+        """
+        Compares the directory with the manifest. Returns the new or changed files that didn't change since the
+        previous scan as (name, signature, hash), and the names of the deleted files.
+        """
+        signatures = {}
+        for name in filter_files(sorted(os.listdir(self.in_dir))):
+            path = os.path.join(self.in_dir, name)
+            try:
+                if os.path.isfile(path):
+                    signatures[name] = get_signature(path)
+            except FileNotFoundError:
+                # deleted while scanning
+                continue
+
+        ready = []
+        for name, signature in signatures.items():
+            entry = self.files.get(name)
+            if entry is not None and _same_signature(entry, signature):
+                continue
+            # still being copied into the directory
+            if self._previous.get(name) != signature:
+                continue
+            file_hash = hash_file(os.path.join(self.in_dir, name))
+            if (
+                entry is not None
+                and entry["hash"] == file_hash
+                and entry.get("stems") == signature.get("stems")
+            ):
+                # touched without changing the content
+                self.files[name] = {**entry, **signature}
+                continue
+            ready.append((name, signature, file_hash))
+
+        deleted = [name for name in self.files if name not in signatures]
+        self._previous = signatures
+        return ready, deleted
+
+    def add(self, name: str, signature: dict, file_hash: str, failed: bool = False):
+        self.files[name] = {**signature, "hash": file_hash, "failed": failed}
+
+    def remove(self, name: str) -> str:
+        """Removes the file and returns its hash, None if it wasn't in the manifest."""
+        entry = self.files.pop(name, None)
+        return entry["hash"] if entry is not None else None
+
+    def get_hash(self, name: str) -> str:
+        entry = self.files.get(name)
+        return entry["hash"] if entry is not None else None
+
+    def hashes(self) -> set[str]:
+        """Returns the hashes of the files whose results are in the output."""
+        return {entry["hash"] for entry in self.files.values() if not entry["failed"]}
+
+    def save(self):
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"in_dir": os.path.abspath(self.in_dir), "files": self.files}, f)
+        os.replace(tmp_file, self.path)
+
+
+def _same_signature(entry: dict, signature: dict) -> bool:
+    return all(entry.get(key) == value for key, value in signature.items())
@@ -0,0 +1,63 @@
+import {
+  Card,
+  CardContent,
+  CardHeader,
+  List,
+  ListItemButton,
+  ListItemText,
+} from "@mui/material";
+import { Link } from "@remix-run/react";
+import { useTranslation } from "react-i18next";
+
+export interface SimilarSong {
+  id: string;
+  title?: string;
+  subtitle?: string;
+}
+
+interface SimilarCardProps {
+  songs: SimilarSong[];
+  /**
+   * Path of the detail pages, e.g. "/xml"
+   */
+  linkPrefix: string;
+}
+
+/**
+ * The songs with the most similar embedding, see searchSimilar.
+ */
+export const SimilarCard: React.FC<SimilarCardProps> = ({
+  songs,
+  linkPrefix,
+}) => {
+  const { t } = useTranslation("components");
+  return (
+    <Card
+      sx={{
+        height: "100%",
+      }}
+    >
+      <CardHeader title={t("similar.title")} />
+      <CardContent>
+        {songs.length === 0 ? (
+          t("similar.none")
+        ) : (
+          <List dense disablePadding>
+            {songs.map((song) => (
+              <ListItemButton
+                key={song.id}
+                component={Link}
+                to={`${linkPrefix}/${song.id}`}
+              >
+                <ListItemText
+                  primary={song.title ?? t("similar.noTitle")}
+                  secondary={song.subtitle}
+                />
+              </ListItemButton>
+            ))}
+          </List>
+        )}
+      </CardContent>
+    </Card>
+  );
+};
@@ -1,7 +1,7 @@
 import { LoaderFunctionArgs } from "@remix-run/node";
 import { useLoaderData } from "@remix-run/react";
 import invariant from "tiny-invariant";
-import { elastic } from "~/services/Elastic";
+import { AUDIO_RAW_SERIES, getDocument } from "~/services/Elastic";
 import { AudioResult } from "~/src/DataTypes";
 import { MAccordion } from "~/components/MAccordion";
 import { Grid } from "@mui/material";
@@ -10,36 +10,55 @@ import { useTranslation } from "react-i18next";
 import { MetadataCardAudio } from "~/routes/audio/MetadataCardAudio";
 import { BasicDataCardAudio } from "~/routes/audio/BasicDataCardAudio";
 import { GraphAudio } from "~/routes/audio/GraphAudio";
+import { SimilarCard } from "~/components/SimilarCard";
+import { searchSimilar } from "~/services/SearchService";
 
 export const handle = {
   i18n: ["audio"],
 };
 
+// number of similar recordings shown on the page
+const SIMILAR_SONGS = 5;
+
 export const loader = async ({ params }: LoaderFunctionArgs) => {
   invariant(params.id, "Missing song ID");
-  try {
-    const data = await elastic.get<AudioResult>({
-      index: "audio",
-      id: params.id,
+  // the chart draws the downsampled series
+  const data = await getDocument<AudioResult>(
+    "audio",
+    params.id,
+    AUDIO_RAW_SERIES,
+  );
+  if (!data) {
+    throw new Response(null, {
+      status: 404,
+      statusText: "Pesem ni bila najdena.",
     });
-    return data;
-    // eslint-disable-next-line
-  } catch (e: any) {
-    if (e.meta?.body?.found === false) {
-      throw new Response(null, {
-        status: 404,
-        statusText: "Pesem ni bila najdena.",
-      });
-    } else {
-      throw e;
-    }
   }
+  // the embedding of the profile the recording was processed with
+  const [algorithm, embedding] =
+    Object.entries(data._source?.embedding ?? {})[0] ?? [];
+  const similar = embedding?.vector
+    ? await searchSimilar(
+        "audio",
+        `embedding.${algorithm}.vector`,
+        embedding.vector,
+        SIMILAR_SONGS,
+        data._id,
+      ).catch(() => [])
+    : [];
+  return {
+    data,
+    similar: similar.map((hit) => ({
+      id: hit._id,
+      title: hit._source?.metadata.title,
+    })),
+  };
 };
 
 export const AudioContext = createContext<AudioResult>({} as AudioResult);
 
 export default function Song() {
-  const data = useLoaderData<typeof loader>();
+  const { data, similar } = useLoaderData<typeof loader>();
   const audio = data._source!;
   const { t } = useTranslation("audio");
 
@@ -58,6 +77,9 @@ export default function Song() {
               <GraphAudio audioResults={[audio]}/>
             </MAccordion>
           </Grid>
+          <Grid item xs={12}>
+            <SimilarCard songs={similar} linkPrefix="/audio" />
+          </Grid>
         </Grid>
       </AudioContext.Provider>
     </>
@@ -3,11 +3,12 @@ import { useContext } from "react";
 import { useTranslation } from "react-i18next";
 import { InfoCard } from "~/components/InfoCard";
 import { AudioContext } from "~/routes/audio.$id";
-import { secondsToString } from "~/utils/helpers";
+import { getAlgorithm, secondsToString } from "~/utils/helpers";
 
 export const BasicDataCardAudio: React.FC = () => {
   const audio = useContext(AudioContext);
   const { t } = useTranslation("audio");
+  const key = getAlgorithm(audio.key);
   return (
     <Card
       sx={{
@@ -26,13 +27,13 @@ export const BasicDataCardAudio: React.FC = () => {
           <Grid item>
             <InfoCard
               title={t("basicDataCard.tempo")}
-              value={audio.bpm.essentia_multifeature.bpm}
+              value={getAlgorithm(audio.bpm)?.bpm}
             />
           </Grid>
           <Grid item>
             <InfoCard
               title={t("basicDataCard.key")}
-              value={audio.key.essentia_key_extractor.key + " "  + audio.key.essentia_key_extractor.scale}
+              value={key ? key.key + " " + key.scale : "-"}
             />
           </Grid>
         </Grid>
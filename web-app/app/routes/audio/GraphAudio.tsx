@@ -16,7 +16,7 @@ import {
   Tooltip,
 } from "chart.js";
 import { Line } from "react-chartjs-2";
-import { chartColorsRGB, secondsToString } from "~/utils/helpers";
+import { chartColorsRGB, getAlgorithm, secondsToString } from "~/utils/helpers";
 import {
   Checkbox,
   FormControlLabel,
@@ -27,7 +27,7 @@ import {
   Stack,
   Typography,
 } from "@mui/material";
-import { AudioResult } from "~/src/DataTypes";
+import { AudioResult, SeriesPyramid } from "~/src/DataTypes";
 import { midiData } from "~/routes/audio/MidiData";
 
 Chart.register(annotationPlugin);
@@ -113,6 +113,34 @@ const calculateMovingAverage = (
   return results;
 };
 
+// the series are drawn at the finest zoom level of their pyramid with at most this many points in view
+const MAX_VISIBLE_POINTS = 1000;
+
+/**
+ * Returns the bucket means of the finest level of the pyramid that fits the span in seconds and their time step,
+ * no points if the recording was processed before the pyramids were stored
+ */
+const pyramidLevel = (
+  pyramid: SeriesPyramid | undefined,
+  timestep: number,
+  span = 0
+) => {
+  const bucketSizes = Object.keys(pyramid ?? {})
+    .map(Number)
+    .sort((a, b) => a - b);
+  if (!pyramid || bucketSizes.length === 0) {
+    return { values: [] as number[], timestep };
+  }
+  const bucketSize =
+    bucketSizes.find(
+      (size) => span / (timestep * size) <= MAX_VISIBLE_POINTS
+    ) ?? bucketSizes[bucketSizes.length - 1];
+  return {
+    values: pyramid[bucketSize.toString()].mean,
+    timestep: timestep * bucketSize,
+  };
+};
+
 interface GraphAudioProps {
   audioResults: AudioResult[];
 }
@@ -126,7 +154,7 @@ export const GraphAudio: React.FC<GraphAudioProps> = ({ audioResults }) => {
   const [xRange, setXRange] = useState([0, duration]);
 
   const makeBeatTickAnnotations = (audio: AudioResult): AnnotationOptions[] => {
-    const beatTicks = audio.bpm.essentia_multifeature.beat_ticks;
+    const beatTicks = getAlgorithm(audio.bpm)?.beat_ticks ?? [];
     return beatTicks.map((tick) => {
       return {
         type: "line",
@@ -139,11 +167,16 @@ export const GraphAudio: React.FC<GraphAudioProps> = ({ audioResults }) => {
   };
 
   const makeChordAnnotations = (audio: AudioResult): AnnotationOptions[] => {
-    const chords = audio.chords.autochord.chord_start.map((start, i) => {
+    // the fast profile skips chords
+    const autochord = getAlgorithm(audio.chords);
+    if (!autochord) {
+      return [];
+    }
+    const chords = autochord.chord_start.map((start, i) => {
       return {
         start,
-        end: audio.chords.autochord.chord_end[i],
-        name: audio.chords.autochord.chord_name[i],
+        end: autochord.chord_end[i],
+        name: autochord.chord_name[i],
       };
     });
     return chords.map((chord) => {
@@ -170,7 +203,9 @@ export const GraphAudio: React.FC<GraphAudioProps> = ({ audioResults }) => {
 
   const totalVoiceRMS = useMemo(() => {
     const loudness = audioResults.map((audio) => {
-      return audio.loudness.rms.loudness_vocals;
+      const rms = getAlgorithm(audio.loudness)!;
+      return pyramidLevel(rms.pyramid?.loudness_vocals, rms.timestep_seconds)
+        .values;
     });
     const lengths = loudness.map((loud) => loud.length);
     const squares = loudness.map((loud) => loud.map((val) => val ** 2));
@@ -183,7 +218,9 @@ export const GraphAudio: React.FC<GraphAudioProps> = ({ audioResults }) => {
 
   const totalInstrumentalRMS = useMemo(() => {
     const loudness = audioResults.map((audio) => {
-      return audio.loudness.rms.loudness_instrumental;
+      const rms = getAlgorithm(audio.loudness)!;
+      return pyramidLevel(rms.pyramid?.loudness_instrumental, rms.timestep_seconds)
+        .values;
     });
     const lengths = loudness.map((loud) => loud.length);
     const squares = loudness.map((loud) => loud.map((val) => val ** 2));
@@ -196,34 +233,40 @@ export const GraphAudio: React.FC<GraphAudioProps> = ({ audioResults }) => {
 
   console.log(totalVoiceRMS, totalInstrumentalRMS);
 
+  const span = xRange[1] - xRange[0];
+
   const makePitchContourData = (audio: AudioResult, voiceRms: number, instrumentalRms: number) => {
     const cullingRMSThreshold = 0.3;
-    const pesto = audio.pitch_contour.pesto;
-    const timestep = pesto.time_step_ms;
+    const pesto = getAlgorithm(audio.pitch_contour)!;
+    const rms = getAlgorithm(audio.loudness)!;
 
     const makePitchContourDataset = (
-      datapoints: number[],
+      pyramid: SeriesPyramid | undefined,
       title: string,
       type: "instrumental" | "voice"
     ): ChartDataset<"line"> => {
+      const contour = pyramidLevel(pyramid, pesto.time_step_ms / 1000, span);
+      const loudness = pyramidLevel(
+        type == "voice"
+          ? rms.pyramid?.loudness_vocals
+          : rms.pyramid?.loudness_instrumental,
+        rms.timestep_seconds,
+        span
+      );
       const datapointsSmoothed = calculateMovingMedian(
-        datapoints,
+        contour.values,
         smoothing + 1
       );
       const dataPointsWithTime = datapointsSmoothed.map((val, i) => {
         return {
-          x: i * (timestep / 1000),
+          x: i * contour.timestep,
           y: val,
         };
       });
       const datapointFilteredRMS = dataPointsWithTime.map((data, i) => {
         // Find the closest RMS value of the datapoint
-        const rms = audio.loudness.rms;
-        const rmsIndex = Math.round(data.x / rms.timestep_seconds);
-        const rmsValue =
-          type == "voice"
-            ? rms.loudness_vocals[rmsIndex]
-            : rms.loudness_instrumental[rmsIndex];
+        const rmsIndex = Math.round(data.x / loudness.timestep);
+        const rmsValue = loudness.values[rmsIndex];
         return {
           x: data.x,
           y: rmsValue > cullingRMSThreshold * (type == "voice" ? voiceRms : instrumentalRms) ? data.y : Number.NaN,
@@ -237,12 +280,12 @@ export const GraphAudio: React.FC<GraphAudioProps> = ({ audioResults }) => {
 
     return [
       makePitchContourDataset(
-        pesto.pitch_contour_hz_voice,
+        pesto.pyramid?.pitch_contour_hz_voice,
         t("graphAudio.voiceContour"),
         "voice"
       ),
       makePitchContourDataset(
-        pesto.pitch_contour_hz_instrumental,
+        pesto.pyramid?.pitch_contour_hz_instrumental,
         t("graphAudio.instrumentalContour"),
         "instrumental"
       ),
@@ -250,30 +293,37 @@ export const GraphAudio: React.FC<GraphAudioProps> = ({ audioResults }) => {
   };
 
   const makeLoudnessData = (audio: AudioResult): ChartDataset<"line">[] => {
-    const rms = audio.loudness.rms;
+    const rms = getAlgorithm(audio.loudness)!;
 
     const makeLoudnessDataset = (
-      data: number[],
+      pyramid: SeriesPyramid | undefined,
       title: string
     ): ChartDataset<"line"> => {
+      const loudness = pyramidLevel(pyramid, rms.timestep_seconds, span);
       return {
         label: title,
         hidden: true,
         yAxisID: "y2",
-        data: data.map((val, i) => {
+        data: loudness.values.map((val, i) => {
           return {
             y: val,
-            x: i * rms.timestep_seconds,
+            x: i * loudness.timestep,
           };
         }),
       };
     };
 
     return [
-      makeLoudnessDataset(rms.loudness_total, t("graphAudio.loudnessTotal")),
-      makeLoudnessDataset(rms.loudness_vocals, t("graphAudio.loudnessVocals")),
       makeLoudnessDataset(
-        rms.loudness_instrumental,
+        rms.pyramid?.loudness_total,
+        t("graphAudio.loudnessTotal")
+      ),
+      makeLoudnessDataset(
+        rms.pyramid?.loudness_vocals,
+        t("graphAudio.loudnessVocals")
+      ),
+      makeLoudnessDataset(
+        rms.pyramid?.loudness_instrumental,
         t("graphAudio.loudnessInstrumental")
       ),
     ];
@@ -314,7 +364,7 @@ export const GraphAudio: React.FC<GraphAudioProps> = ({ audioResults }) => {
       audioResults.map((audio, i) => {
         return [...makePitchContourData(audio, totalVoiceRMS[i], totalInstrumentalRMS[i]), ...makeLoudnessData(audio)];
       }),
-    [audioResults, smoothing]
+    [audioResults, smoothing, span]
   );
 
   const charts = useMemo(() => {
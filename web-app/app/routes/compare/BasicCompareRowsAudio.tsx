@@ -3,7 +3,7 @@ import { CardActionArea, Typography } from "@mui/material";
 import { useNavigate } from "@remix-run/react";
 import { useTranslation } from "react-i18next";
 import { AudioResult, SongResult } from "~/src/DataTypes";
-import { secondsToString } from "~/utils/helpers";
+import { getAlgorithm, secondsToString } from "~/utils/helpers";
 
 interface Props {
   audio: SearchHit<AudioResult>;
@@ -32,12 +32,12 @@ export const CompareDurationAudio: React.FC<Props> = ({ audio}) => {
 };
 
 export const CompareTempoAudio: React.FC<Props> = ({ audio}) => {
-  const tempo = audio._source!.bpm.essentia_multifeature.bpm.toFixed(2);
+  const tempo = getAlgorithm(audio._source?.bpm)?.bpm.toFixed(2);
   return <Typography>{tempo ?? "-"}</Typography>;
 };
 
 export const CompareKeyAudio: React.FC<Props> = ({ audio}) => {
-  const keyExtract = audio._source?.key.essentia_key_extractor;
+  const keyExtract = getAlgorithm(audio._source?.key);
   const str = keyExtract ? keyExtract.key + " " + keyExtract.scale : "-"
   return <Typography>{str}</Typography>;
 };
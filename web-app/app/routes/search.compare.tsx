@@ -8,6 +8,7 @@ import { useLoaderData } from "@remix-run/react";
 import { LoaderFunctionArgs } from "@remix-run/server-runtime";
 import { useTranslation } from "react-i18next";
 import { elastic } from "~/services/Elastic";
+import { withBlobs } from "~/services/BlobService";
 import { AudioResult, SongResult } from "~/src/DataTypes";
 import { CompareList } from "./compare/CompareList";
 import Search, { SearchType } from "~/routes/search";
@@ -48,6 +49,10 @@ export const loader = async ({ request }: LoaderFunctionArgs) => {
   if ((data.hits.total as SearchTotalHits).value !== ids.length) {
     throw new Error("Not all ids found");
   }
+  await withBlobs(
+    searchType == SearchType.Audio ? "audio" : "songs",
+    data.hits.hits,
+  );
 
   return {
     xmlHits:
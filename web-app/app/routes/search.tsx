@@ -22,7 +22,7 @@ import {
   useRef,
   useState,
 } from "react";
-import { elastic } from "~/services/Elastic";
+import { AUDIO_RAW_SERIES, elastic } from "~/services/Elastic";
 import { AudioResult, SongResult } from "~/src/DataTypes";
 import {
   SearchHit,
@@ -111,6 +111,7 @@ export const loader = async ({ request }: LoaderFunctionArgs) => {
   if (searchType == SearchType.Audio) {
     compareData = await elastic.search<AudioResult>({
       index: "audio",
+      _source_excludes: AUDIO_RAW_SERIES,
       query: {
         ids: {
           values: compareIds,
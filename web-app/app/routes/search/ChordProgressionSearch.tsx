@@ -0,0 +1,32 @@
+import { TextField } from "@mui/material";
+import { useTranslation } from "react-i18next";
+import { useControlledState } from "../../utils/useControlledState";
+
+interface ChordProgressionSearchProps {
+  chordProgression?: string;
+}
+
+export const ChordProgressionSearch: React.FC<ChordProgressionSearchProps> = ({
+  chordProgression,
+}) => {
+  const { t } = useTranslation("search");
+  const [chordProgressionState, setChordProgressionState] = useControlledState(
+    chordProgression ?? ""
+  );
+
+  return (
+    <TextField
+      sx={{
+        width: "20rem",
+      }}
+      name="chordProgression"
+      label={t("chordProgression")}
+      placeholder="ii V I"
+      helperText={t("chordProgressionHelper")}
+      value={chordProgressionState}
+      onChange={(e) => {
+        setChordProgressionState(e.target.value);
+      }}
+    />
+  );
+};
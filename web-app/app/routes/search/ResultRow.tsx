@@ -19,7 +19,6 @@ import { InfoCard } from "~/components/InfoCard";
 import { useTranslation } from "react-i18next";
 import { SearchType } from "~/routes/search";
 import { ReactNode } from "react";
-import { SongResult } from "~/src/DataTypes";
 
 export interface ResultRowProps {
   searchHit: SearchHit<{ corpus_id: string } & unknown>;
@@ -54,13 +53,6 @@ export const ResultRow: React.FC<ResultRowProps> = ({
     return URL.createObjectURL(blob);
   };
 
-  const createDownloadLinkXML = () => {
-    const blob = new Blob([(searchHit._source as SongResult).original_file], {
-      type: "application/xml",
-    });
-    return URL.createObjectURL(blob);
-  };
-
   const onAddToComparison = () => {
     setParams((params) => {
       const compareIds = params.get("compareIds");
@@ -200,7 +192,8 @@ export const ResultRow: React.FC<ResultRowProps> = ({
           <Tooltip title={t("downloadMusicXML")}>
             <IconButton
               component="a"
-              href={createDownloadLinkXML()}
+              // search results don't include the original file
+              href={`/xml/${searchHit._id}/original`}
               download={`${title}.musicxml`}
               target="_blank"
               style={{ marginLeft: 0 }}
@@ -5,7 +5,7 @@ import { InfoCard } from "~/components/InfoCard";
 import { useTranslation } from "react-i18next";
 import { SearchType } from "~/routes/search";
 import { ResultRow } from "~/routes/search/ResultRow";
-import { secondsToString } from "~/utils/helpers";
+import { getAlgorithm, secondsToString } from "~/utils/helpers";
 
 export interface ResultRowAudioProps {
   audioHit: SearchHit<AudioResult>;
@@ -35,7 +35,7 @@ export const ResultRowAudio: React.FC<ResultRowAudioProps> = ({
         />
       <InfoCard
         title={t("tempoBPM")}
-        value={song.bpm.essentia_multifeature.bpm}
+        value={getAlgorithm(song.bpm)?.bpm}
       />
     </ResultRow>
   );
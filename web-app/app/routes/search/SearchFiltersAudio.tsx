@@ -6,6 +6,7 @@ import { CorpusSelect } from "~/routes/search/CorpusSelect";
 import { useMemo } from "react";
 import { TempoSlider } from "~/routes/search/TempoSlider";
 import { DurationSlider } from "~/routes/search/DurationSlider";
+import { ChordProgressionSearch } from "~/routes/search/ChordProgressionSearch";
 
 interface SearchFiltersAudioProps {
   params: Record<string, string>;
@@ -67,6 +68,9 @@ export const SearchFiltersAudio: React.FC<SearchFiltersAudioProps> = ({
           </Grid>
         </Grid>
       </FilterGroupCollapse>
+      <FilterGroupCollapse title={t("patternFilters")}>
+        <ChordProgressionSearch chordProgression={params.chordProgression} />
+      </FilterGroupCollapse>
     </>
   );
 };
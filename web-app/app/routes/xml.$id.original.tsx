@@ -0,0 +1,30 @@
+import { LoaderFunctionArgs } from "@remix-run/node";
+import invariant from "tiny-invariant";
+import { getOriginalFile } from "~/services/BlobService";
+
+/**
+ * Serves the original MusicXML of a song, which is not part of the search results.
+ */
+export const loader = async ({ params }: LoaderFunctionArgs) => {
+  invariant(params.id, "Missing song ID");
+  let originalFile: string | undefined;
+  try {
+    originalFile = await getOriginalFile(params.id);
+    // eslint-disable-next-line
+  } catch (e: any) {
+    if (e.meta?.body?.found !== false) {
+      throw e;
+    }
+  }
+  if (originalFile === undefined) {
+    throw new Response(null, {
+      status: 404,
+      statusText: "Pesem ni bila najdena.",
+    });
+  }
+  return new Response(originalFile, {
+    headers: {
+      "Content-Type": "application/xml",
+    },
+  });
+};
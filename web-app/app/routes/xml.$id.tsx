@@ -1,7 +1,8 @@
 import { LoaderFunctionArgs } from "@remix-run/node";
 import { useLoaderData } from "@remix-run/react";
 import invariant from "tiny-invariant";
-import { elastic } from "~/services/Elastic";
+import { getDocument } from "~/services/Elastic";
+import { withBlobs } from "~/services/BlobService";
 import { SongResult } from "~/src/DataTypes";
 import { MetadataCardXML } from "./xml/MetadataCardXML";
 import { MAccordion } from "~/components/MAccordion";
@@ -13,36 +14,51 @@ import { useTranslation } from "react-i18next";
 import { SheetMusic } from "./xml/SheetMusic";
 import { ContourGraph } from "~/components/ContourGraph";
 import { NGramHistogram } from "~/components/NGramHistogram";
+import { SimilarCard } from "~/components/SimilarCard";
+import { searchSimilar } from "~/services/SearchService";
 
 export const handle = {
   i18n: ["xml"],
 };
 
+// number of similar songs shown on the page
+const SIMILAR_SONGS = 5;
+
 export const loader = async ({ params }: LoaderFunctionArgs) => {
   invariant(params.id, "Missing song ID");
-  try {
-    const data = await elastic.get<SongResult>({
-      index: "songs",
-      id: params.id,
+  const data = await getDocument<SongResult>("songs", params.id);
+  if (!data) {
+    throw new Response(null, {
+      status: 404,
+      statusText: "Pesem ni bila najdena.",
     });
-    return data;
-    // eslint-disable-next-line
-  } catch (e: any) {
-    if (e.meta?.body?.found === false) {
-      throw new Response(null, {
-        status: 404,
-        statusText: "Pesem ni bila najdena.",
-      });
-    } else {
-      throw e;
-    }
   }
+  // the original file and raw arrays may be in a separate blob document
+  await withBlobs("songs", [data]);
+  const vector = data._source?.embedding?.vector;
+  const similar = vector
+    ? await searchSimilar(
+        "songs",
+        "embedding.vector",
+        vector,
+        SIMILAR_SONGS,
+        data._id,
+      ).catch(() => [])
+    : [];
+  return {
+    data,
+    similar: similar.map((hit) => ({
+      id: hit._id,
+      title: hit._source?.metadata.title,
+      subtitle: (hit._source as SongResult | undefined)?.metadata.composer,
+    })),
+  };
 };
 
 export const SongContext = createContext<SongResult>({} as SongResult);
 
 export default function Song() {
-  const data = useLoaderData<typeof loader>();
+  const { data, similar } = useLoaderData<typeof loader>();
   const song = data._source!;
   const { t } = useTranslation("xml");
 
@@ -59,6 +75,9 @@ export default function Song() {
           <Grid item xs={12}>
             <BasicDataCardXML />
           </Grid>
+          <Grid item xs={12}>
+            <SimilarCard songs={similar} linkPrefix="/xml" />
+          </Grid>
           <Grid item xs={12}>
             <Stack direction="column">
               <MAccordion title={t("sheetMusic.title")}>
@@ -0,0 +1,81 @@
+import { elastic, getDocument } from "~/services/Elastic";
+
+/**
+ * Indices with the original files and raw audio arrays, which the pipeline can split off the search documents
+ * (`upload --blob-index`). Blob documents have the same id as their search document.
+ */
+export const BLOB_INDICES = {
+  songs: "songs-blobs",
+  audio: "audio-blobs",
+} as const;
+
+const mergeDeep = (
+  target: Record<string, unknown>,
+  source: Record<string, unknown>,
+) => {
+  for (const [key, value] of Object.entries(source)) {
+    const targetValue = target[key];
+    if (
+      typeof value === "object" &&
+      value !== null &&
+      !Array.isArray(value) &&
+      typeof targetValue === "object" &&
+      targetValue !== null
+    ) {
+      mergeDeep(
+        targetValue as Record<string, unknown>,
+        value as Record<string, unknown>,
+      );
+    } else {
+      target[key] = value;
+    }
+  }
+  return target;
+};
+
+/**
+ * Fetches the blob documents of the songs and merges them into their sources, so the hits look like they
+ * were never split. Songs without a blob document are left as they are.
+ */
+export const withBlobs = async <
+  T extends { _id?: string; _source?: unknown },
+>(
+  index: keyof typeof BLOB_INDICES,
+  hits: T[],
+): Promise<T[]> => {
+  const ids = hits.map((hit) => hit._id).filter((id) => id !== undefined);
+  if (ids.length === 0) return hits;
+
+  const blobs = await elastic.mget<Record<string, unknown>>(
+    {
+      index: BLOB_INDICES[index],
+      ids: ids as string[],
+    },
+    { ignore: [404] },
+  );
+  const blobsById: Record<string, Record<string, unknown>> = {};
+  for (const doc of blobs.docs ?? []) {
+    if ("found" in doc && doc.found && doc._source) {
+      blobsById[doc._id] = doc._source;
+    }
+  }
+
+  for (const hit of hits) {
+    if (hit._id && hit._source && blobsById[hit._id]) {
+      mergeDeep(hit._source as Record<string, unknown>, blobsById[hit._id]);
+    }
+  }
+  return hits;
+};
+
+/**
+ * Returns the original MusicXML of a song from the search document or its blob document.
+ */
+export const getOriginalFile = async (
+  id: string,
+): Promise<string | undefined> => {
+  const song = await getDocument<{ original_file?: string }>("songs", id);
+  if (!song) return undefined;
+  await withBlobs("songs", [song]);
+  return song._source?.original_file;
+};
@@ -10,3 +10,45 @@ export const elastic = new Client({
     rejectUnauthorized: false, // for self-signed certificates
   },
 });
+
+/**
+ * Fetches a document by id. An ids query instead of a get, because a get needs the routing of documents routed by
+ * corpus and can't read through an alias of per-corpus indices.
+ */
+/**
+ * Full resolution audio time series, pages only fetch their downsampled pyramids
+ */
+export const AUDIO_RAW_SERIES = [
+  "pitch_contour.*.pitch_contour_hz_voice",
+  "pitch_contour.*.pitch_contour_hz_instrumental",
+  "loudness.*.loudness_total",
+  "loudness.*.loudness_vocals",
+  "loudness.*.loudness_instrumental",
+];
+
+export const getDocument = async <T>(
+  index: string,
+  id: string,
+  sourceExcludes?: string[],
+) => {
+  const data = await elastic.search<T>({
+    index,
+    size: 1,
+    _source_excludes: sourceExcludes,
+    query: {
+      ids: {
+        values: [id],
+      },
+    },
+  });
+  return data.hits.hits[0];
+};
+
+/**
+ * Routing of a search limited to the corpuses, so it only touches their shards when the pipeline routes the
+ * documents by corpus (`generate-mapping --partitioning routing`).
+ */
+export const corpusRouting = (corpusIds: string[]) =>
+  process.env.ELASTIC_CORPUS_ROUTING === "true" && corpusIds.length > 0
+    ? corpusIds.join(",")
+    : undefined;
@@ -7,11 +7,12 @@ import {
   AggregationsStringTermsAggregate,
   AggregationsStringTermsBucket,
 } from "@elastic/elasticsearch/lib/api/types";
-import { elastic } from "~/services/Elastic";
+import { corpusRouting, elastic } from "~/services/Elastic";
 
 const getCorpusCount = async (corpusId: string, index: "audio" | "songs") => {
   return await elastic.count({
     index: index,
+    routing: corpusRouting([corpusId]),
     query: {
       term: {
         corpus_id: corpusId,
@@ -84,11 +85,55 @@ export const getCorpusIdsFromIndex = async (index: "audio" | "songs") => {
   return allCorpusIds.filter((x) => enabledIds.contains(x));
 };
 
+/**
+ * Turns the counts stored by the aggregate-corpus command into the most common terms buckets
+ */
+const countsToBuckets = (
+  counts: Record<string, number>,
+  size = 10,
+): AggregationsStringTermsBucket[] => {
+  return Object.entries(counts)
+    .sort((a, b) => b[1] - a[1])
+    .slice(0, size)
+    .map(([key, doc_count]) => ({ key, doc_count }));
+};
+
 export const aggregateCorpusXML = async (corpusId: string) => {
-  const corpusCount = await getCorpusCount(corpusId, "songs");
+  // precomputed aggregates only need a single document fetch and a count, they are used while they still count
+  // the songs in the index. Corpuses without a document are aggregated from their songs.
+  const [corpusDocument, corpusCount] = await Promise.all([
+    elastic.get<Corpus>(
+      {
+        index: "corpuses",
+        id: corpusId,
+      },
+      { ignore: [404] },
+    ),
+    getCorpusCount(corpusId, "songs"),
+  ]);
+  const aggregates = corpusDocument._source?.aggregates;
+  if (aggregates && aggregates.song_count === corpusCount.count) {
+    const ambitus = aggregates.ambitus;
+    return {
+      corpusName: corpusDocument._source!.corpus_name,
+      corpusId,
+      songCount: aggregates.song_count,
+      composersCount: aggregates.composers_count,
+      metrumBuckets: countsToBuckets(aggregates.time_signatures),
+      keysBuckets: countsToBuckets(aggregates.keys),
+      ambitusStats: {
+        count: ambitus.count,
+        min: ambitus.min,
+        max: ambitus.max,
+        avg: ambitus.avg,
+        sum: ambitus.avg === null ? 0 : ambitus.avg * ambitus.count,
+      } as AggregationsStatsAggregate,
+    };
+  }
 
   const corpus = elastic.search({
     index: "songs",
+    routing: corpusRouting([corpusId]),
     size: 0,
     query: {
       term: {
@@ -139,13 +184,47 @@ export const aggregateCorpusXML = async (corpusId: string) => {
 };
 
 export const aggregateCorpusAudio = async (corpusId: string) => {
+  // profiles store the tempo under their own algorithm names, a histogram can't take a wildcard so the tempo of
+  // whichever algorithm computed it is read by a runtime field
+  const tempoMappings = await elastic.indices.getFieldMapping({
+    index: "audio",
+    fields: "bpm.*.bpm",
+  });
+  const tempoFields = [
+    ...new Set(
+      Object.values(tempoMappings).flatMap((index) =>
+        Object.keys(index.mappings),
+      ),
+    ),
+  ].sort();
+
   const corpus = await elastic.search({
     index: "audio",
+    routing: corpusRouting([corpusId]),
     size: 0,
+    query: {
+      term: {
+        corpus_id: corpusId,
+      },
+    },
+    runtime_mappings: {
+      tempo: {
+        type: "double",
+        script: {
+          source: `for (String field : params.fields) {
+            if (doc.containsKey(field) && doc[field].size() > 0) {
+              emit(doc[field].value);
+              return;
+            }
+          }`,
+          params: { fields: tempoFields },
+        },
+      },
+    },
     aggs: {
       tempo_buckets: {
         histogram: {
-          field: "bpm.essentia_multifeature.bpm",
+          field: "tempo",
           interval: 5,
           min_doc_count: 5,
           extended_bounds: {
@@ -171,9 +250,29 @@ export type CorpusAggregateXML = Awaited<ReturnType<typeof aggregateCorpusXML>>;
 export type CorpusAggregateAudio = Awaited<
   ReturnType<typeof aggregateCorpusAudio>
 >;
+/**
+ * Aggregates written to the corpus document by the aggregate-corpus command of the pipeline
+ */
+export interface CorpusAggregates {
+  song_count: number;
+  composers_count: number;
+  time_signatures: Record<string, number>;
+  keys: Record<string, number>;
+  ambitus: {
+    count: number;
+    min: number | null;
+    max: number | null;
+    avg: number | null;
+    histogram: Record<string, number>;
+  };
+  ngram_rhythm: Record<string, number>;
+  ngram_pitch: Record<string, number>;
+}
+
 export interface Corpus {
   corpus_name: string;
   enabled?: boolean;
+  aggregates?: CorpusAggregates;
   license?: {
     url: string;
     description?: string;
@@ -6,8 +6,9 @@ import {
   AggregationsAggregate,
   SearchTotalHits,
 } from "@elastic/elasticsearch/lib/api/types";
-import { elastic } from "~/services/Elastic";
-import { SongResult } from "~/src/DataTypes";
+import { createHash } from "crypto";
+import { corpusRouting, elastic } from "~/services/Elastic";
+import { AudioResult, SongResult } from "~/src/DataTypes";
 import { noteToMidi } from "~/utils/notes";
 import { getEnabledCorpusIds } from "./IndexService";
 
@@ -20,8 +21,14 @@ export const searchXML = async (
 > => {
   return elastic.search<SongResult>({
     index: "songs",
+    routing:
+      "corpus" in params && params.corpus !== "none"
+        ? corpusRouting(params.corpus.split(","))
+        : undefined,
     from: (page - 1) * pageSize,
     size: pageSize,
+    // only needed for downloads and the detail page, which fetch it themselves
+    _source_excludes: ["original_file"],
     query: await constructQueryXML(params),
   });
 };
@@ -138,11 +145,20 @@ export const constructQueryXML = async (
 
   // RHYTHM NGRAM QUERY
   if ("rhythmNgram" in params && params.rhythmNgram.trim() !== "") {
-    queries.push({
-      match_phrase: {
-        "rhythm.rhythm_string": params.rhythmNgram,
-      },
-    });
+    const durations = params.rhythmNgram.trim().split(/\s+/);
+    queries.push(
+      ...constructShingleQueries("rhythm.rhythm_shingles", durations),
+    );
+    if (
+      durations.length < MIN_SHINGLE_SIZE ||
+      durations.length > MAX_SHINGLE_SIZE
+    ) {
+      queries.push({
+        match_phrase: {
+          "rhythm.rhythm_string": params.rhythmNgram,
+        },
+      });
+    }
   }
 
   // MELODIC NGRAM QUERY
@@ -157,16 +173,26 @@ export const constructQueryXML = async (
     for (let i = 1; i < midiNumbers.length; i++) {
       midiNumbersRelative.push(midiNumbers[i] - midiNumbers[i - 1]); // we leave out the first note as we have no idea what the starting note is
     }
+    // the intervals must match in both the relative and absolute search
+    const intervals = midiNumbersRelative.map((x) => x.toString());
+    queries.push(
+      ...constructShingleQueries("contour.melodic_contour_shingles", intervals),
+    );
     if (
       "melodicNgramRelative" in params &&
       params.melodicNgramRelative === "on"
     ) {
-      queries.push({
-        match_phrase: {
-          "contour.melodic_contour_string_relative":
-            midiNumbersRelative.join(" "),
-        },
-      });
+      if (
+        intervals.length < MIN_SHINGLE_SIZE ||
+        intervals.length > MAX_SHINGLE_SIZE
+      ) {
+        queries.push({
+          match_phrase: {
+            "contour.melodic_contour_string_relative":
+              midiNumbersRelative.join(" "),
+          },
+        });
+      }
     } else {
       queries.push({
         match_phrase: {
@@ -184,6 +210,38 @@ export const constructQueryXML = async (
   };
 };
 
+// Must stay in sync with SHINGLE_SIZES and shingle_hash in pipeline/processors/shingles.py
+const MIN_SHINGLE_SIZE = 2;
+const MAX_SHINGLE_SIZE = 6;
+
+const shingleHash = (tokens: string[]) =>
+  createHash("sha1").update(tokens.join(" ")).digest("hex").substring(0, 16);
+
+/**
+ * Splits the tokens into the longest indexed shingles and returns a term query
+ * for each of them. If the tokens fit into a single shingle this is an exact
+ * match, otherwise all the overlapping shingles must be present, which narrows
+ * down the candidates for a phrase query.
+ */
+const constructShingleQueries = (
+  field: string,
+  tokens: string[],
+): QueryDslQueryContainer[] => {
+  if (tokens.length < MIN_SHINGLE_SIZE) {
+    return [];
+  }
+  const size = Math.min(tokens.length, MAX_SHINGLE_SIZE);
+  const hashes = new Set<string>();
+  for (let i = 0; i + size <= tokens.length; i++) {
+    hashes.add(shingleHash(tokens.slice(i, i + size)));
+  }
+  return [...hashes].map((hash) => ({
+    term: {
+      [field]: hash,
+    },
+  }));
+};
+
 const constructEnabledQuery = async (): Promise<QueryDslQueryContainer> => {
   return {
     terms: {
@@ -230,58 +288,57 @@ const constructEducationalQuery = (params: Record<string, string>) => {
   const eduFilters = params.edu.split(",");
   const filterQueries: QueryDslQueryContainer[] = [];
 
+  // The features used here are precomputed by the EducationalProcessor in the pipeline
+  const consecutiveSemitones: QueryDslQueryContainer = {
+    term: {
+      "educational.consecutive_semitones": true,
+    },
+  };
+  const onlyDupleTimeSignatures: QueryDslQueryContainer = {
+    term: {
+      "educational.duple_time_signatures": true,
+    },
+  };
+
   for (const filter of eduFilters) {
     switch (filter) {
       case "IF1":
+        // IF1: Only intervals up to a major third, no consecutive semitones
         filterQueries.push({
           bool: {
             must: [
               {
-                regexp: {
-                  "contour.melodic_contour_string_relative.keyword":
-                    "(-?(0|1|2|3|4))( +-?(0|1|2|3|4))*",
-                },
-              },
-            ],
-            must_not: [
-              {
-                regexp: {
-                  "contour.melodic_contour_string_relative.keyword": ".*1 1.*",
-                },
-              },
-              {
-                regexp: {
-                  "contour.melodic_contour_string_relative.keyword":
-                    ".*-1 -1.*",
+                range: {
+                  "educational.max_abs_interval": {
+                    lte: 4,
+                  },
                 },
               },
             ],
+            must_not: [consecutiveSemitones],
           },
         });
         break;
       case "IF2":
+        // IF2: Intervals up to a fifth without the tritone, no consecutive semitones
         filterQueries.push({
           bool: {
             must: [
               {
-                regexp: {
-                  "contour.melodic_contour_string_relative.keyword":
-                    "(-?(0|1|2|3|4|5|7))(\\s+-?(0|1|2|3|4|5|7))*",
+                range: {
+                  "educational.max_abs_interval": {
+                    lte: 7,
+                  },
                 },
               },
             ],
             must_not: [
               {
-                regexp: {
-                  "contour.melodic_contour_string_relative.keyword": ".*1 1.*",
-                },
-              },
-              {
-                regexp: {
-                  "contour.melodic_contour_string_relative.keyword":
-                    ".*-1 -1.*",
+                term: {
+                  "educational.interval_sizes": 6,
                 },
               },
+              consecutiveSemitones,
             ],
           },
         });
@@ -306,9 +363,9 @@ const constructEducationalQuery = (params: Record<string, string>) => {
                 },
               },
               {
-                script: {
-                  script: {
-                    source: `doc['ambitus.max_note'].value - doc['ambitus.min_note'].value <= 12`,
+                range: {
+                  "ambitus.ambitus_semitones": {
+                    lte: 12,
                   },
                 },
               },
@@ -337,9 +394,9 @@ const constructEducationalQuery = (params: Record<string, string>) => {
                 },
               },
               {
-                script: {
-                  script: {
-                    source: `doc['ambitus.max_note'].value - doc['ambitus.min_note'].value <= 12`,
+                range: {
+                  "ambitus.ambitus_semitones": {
+                    lte: 12,
                   },
                 },
               },
@@ -353,51 +410,12 @@ const constructEducationalQuery = (params: Record<string, string>) => {
           bool: {
             must: [
               // 1. Time Signature must be 2/4, 4/4, or 2/2
+              onlyDupleTimeSignatures,
+              // 2. At least 90% eighth ("1/2") or quarter ("1/1") notes
               {
-                script: {
-                  script: {
-                    source: `
-                 def allowed = ['2/4', '4/4', '2/2'];
-                for (value in doc['time_signature']) {
-                  if (!allowed.contains(value)) {
-                    return false;
-                  }
-                }
-                return true;
-                    `,
-                  },
-                },
-              },
-              // 2. At least 80% eighth (0.5) or quarter (1.0) notes
-              {
-                script: {
-                  script: {
-                    lang: "painless",
-                    // Access _source directly to avoid fielddata issues on text fields
-                    source: `
-                      String rhythmString = doc['rhythm.rhythm_string_no_rests.keyword'].value;
-                      if (rhythmString.isEmpty()) {
-                          return false; // Empty string doesn't meet criteria
-                      }
-
-                      String[] values = rhythmString.splitOnToken(' ');
-                      int totalCount = values.length;
-                      int eighthQuarterCount = 0;
-
-                      if (totalCount == 0) {
-                        return false; // No notes means it doesn't meet the criteria
-                      }
-
-                      for (String val : values) {
-                        // Check for quarter notes ("1/1") and eighth notes ("1/2")
-                        if (val.equals("1/1") || val.equals("1/2")) {
-                          eighthQuarterCount++;
-                        }
-                      }
-
-                      // Calculate percentage and compare
-                      return (double)eighthQuarterCount / totalCount >= 0.9;
-                    `,
+                range: {
+                  "educational.quarter_eighth_ratio": {
+                    gte: 0.9,
                   },
                 },
               },
@@ -417,51 +435,12 @@ const constructEducationalQuery = (params: Record<string, string>) => {
           bool: {
             must: [
               // 1. Time Signature must be 2/4, 4/4, or 2/2
-              {
-                script: {
-                  script: {
-                    source: `
-                 def allowed = ['2/4', '4/4', '2/2'];
-                for (value in doc['time_signature']) {
-                  if (!allowed.contains(value)) {
-                    return false;
-                  }
-                }
-                return true;
-                    `,
-                  },
-                },
-              },
+              onlyDupleTimeSignatures,
               // 2. At least 70% eighth ("1/2"), quarter ("1/1"), or half ("2/1") notes
               {
-                script: {
-                  script: {
-                    lang: "painless",
-                    // Access _source directly to avoid fielddata issues on text fields
-                    source: `
-                      String rhythmString = doc['rhythm.rhythm_string_no_rests.keyword'].value;
-                      if (rhythmString.isEmpty()) {
-                          return false; // Empty string doesn't meet criteria
-                      }
-
-                      String[] values = rhythmString.splitOnToken(' ');
-                      int totalCount = values.length;
-                      int targetNoteCount = 0;
-
-                      if (totalCount == 0) {
-                        return false; // No notes means it doesn't meet the criteria
-                      }
-
-                      for (String val : values) {
-                        // Check for eighth ("1/2"), quarter ("1/1"), or half ("2/1") notes
-                        if (val.equals("1/2") || val.equals("1/1") || val.equals("2/1")) {
-                          targetNoteCount++;
-                        }
-                      }
-
-                      // Calculate percentage and compare
-                      return (double)targetNoteCount / totalCount >= 0.7;
-                    `,
+                range: {
+                  "educational.quarter_eighth_half_ratio": {
+                    gte: 0.7,
                   },
                 },
               },
@@ -481,51 +460,12 @@ const constructEducationalQuery = (params: Record<string, string>) => {
           bool: {
             must: [
               // 1. Time Signature must be 2/4, 4/4, or 2/2
-              {
-                script: {
-                  script: {
-                    source: `
-                 def allowed = ['2/4', '4/4', '2/2'];
-                for (value in doc['time_signature']) {
-                  if (!allowed.contains(value)) {
-                    return false;
-                  }
-                }
-                return true;
-                    `,
-                  },
-                },
-              },
+              onlyDupleTimeSignatures,
               // 2. At least 70% eighth ("1/2"), quarter ("1/1"), or half ("2/1") notes
               {
-                script: {
-                  script: {
-                    lang: "painless",
-                    // Access _source directly to avoid fielddata issues on text fields
-                    source: `
-                      String rhythmString = doc['rhythm.rhythm_string_no_rests.keyword'].value;
-                      if (rhythmString.isEmpty()) {
-                          return false; // Empty string doesn't meet criteria
-                      }
-
-                      String[] values = rhythmString.splitOnToken(' ');
-                      int totalCount = values.length;
-                      int targetNoteCount = 0;
-
-                      if (totalCount == 0) {
-                        return false; // No notes means it doesn't meet the criteria
-                      }
-
-                      for (String val : values) {
-                        // Check for eighth ("1/2"), quarter ("1/1"), or half ("2/1") notes
-                        if (val.equals("1/2") || val.equals("1/1") || val.equals("2/1")) {
-                          targetNoteCount++;
-                        }
-                      }
-
-                      // Calculate percentage and compare
-                      return (double)targetNoteCount / totalCount >= 0.7;
-                    `,
+                range: {
+                  "educational.quarter_eighth_half_ratio": {
+                    gte: 0.7,
                   },
                 },
               },
@@ -548,41 +488,15 @@ const constructEducationalQuery = (params: Record<string, string>) => {
             must: [
               // 1. Must have a single time signature (any type)
               {
-                script: {
-                  script: {
-                    source: "doc['time_signature'].length == 1",
-                  },
+                term: {
+                  "educational.time_signature_count": 1,
                 },
               },
-              // 2. At least 70% eighth ("1/2"), quarter ("1/1"), or half ("2/1") notes
+              // 2. At least 80% eighth ("1/2"), quarter ("1/1"), or half ("2/1") notes
               {
-                script: {
-                  script: {
-                    lang: "painless",
-                    source: `
-                      String rhythmString = doc['rhythm.rhythm_string_no_rests.keyword'].value;
-                      if (rhythmString.isEmpty()) {
-                          return false; // Empty string doesn't meet criteria
-                      }
-
-                      String[] values = rhythmString.splitOnToken(' ');
-                      int totalCount = values.length;
-                      int targetNoteCount = 0;
-
-                      if (totalCount == 0) {
-                        return false; // No notes means it doesn't meet the criteria
-                      }
-
-                      for (String val : values) {
-                        // Check for eighth ("1/2"), quarter ("1/1"), or half ("2/1") notes
-                        if (val.equals("1/2") || val.equals("1/1") || val.equals("2/1")) {
-                          targetNoteCount++;
-                        }
-                      }
-
-                      // Calculate percentage and compare
-                      return (double)targetNoteCount / totalCount >= 0.8;
-                    `,
+                range: {
+                  "educational.quarter_eighth_half_ratio": {
+                    gte: 0.8,
                   },
                 },
               },
@@ -606,7 +520,7 @@ const constructEducationalQuery = (params: Record<string, string>) => {
   }
 
   if (filterQueries.length > 0) {
-    // Combine all filter scripts under a single 'must' clause
+    // Combine all filters under a single 'must' clause
     return {
       bool: {
         must: filterQueries,
@@ -616,7 +530,6 @@ const constructEducationalQuery = (params: Record<string, string>) => {
 
   return null;
 };
-
 export const constructQueryAudio = async (
   params: Record<string, string>,
 ): Promise<QueryDslQueryContainer> => {
@@ -660,6 +573,29 @@ export const constructQueryAudio = async (
     }
   }
 
+  // CHORD PROGRESSION, Roman numerals relative to the key like "ii V I"
+  if ("chordProgression" in params && params.chordProgression.trim() !== "") {
+    // repeated chords are collapsed in the indexed progressions
+    const numerals = params.chordProgression
+      .trim()
+      .split(/[\s,-]+/)
+      .filter((numeral, i, all) => i === 0 || numeral !== all[i - 1]);
+    if (numerals.length < MIN_SHINGLE_SIZE) {
+      queries.push({
+        term: {
+          "chords.autochord.chord_roman": numerals[0],
+        },
+      });
+    } else {
+      queries.push(
+        ...constructShingleQueries(
+          "chords.autochord.chord_progression_shingles",
+          numerals,
+        ),
+      );
+    }
+  }
+
   queries.push(await constructEnabledQuery());
   return {
     bool: {
@@ -668,6 +604,33 @@ export const constructQueryAudio = async (
   };
 };
 
+/**
+ * Finds the songs with the most similar embedding vector in the field with an
+ * approximate kNN query, without the song with the given ID.
+ */
+export const searchSimilar = async (
+  index: "songs" | "audio",
+  field: string,
+  vector: number[],
+  size: number,
+  id: string,
+) => {
+  const response = await elastic.search<SongResult | AudioResult>({
+    index,
+    knn: {
+      field,
+      query_vector: vector,
+      // the song itself is the nearest neighbour
+      k: size + 1,
+      num_candidates: Math.max(100, size * 10),
+      filter: await constructEnabledQuery(),
+    },
+    size: size + 1,
+    _source: ["metadata"],
+  });
+  return response.hits.hits.filter((hit) => hit._id !== id).slice(0, size);
+};
+
 export const getAvailableTimeSignatures = async () => {
   const data = await elastic.search({
     index: "songs",
@@ -41,6 +41,10 @@ export interface SongResult extends Record<string, unknown> {
      * Indexes of the start of each measure
      */
     measure_starts: number[];
+    /**
+     * Numbers of the measures starting at `measure_starts`, as written in the score
+     */
+    measure_numbers: number[];
     /**
      * Relative pitches, only UP, DOWN, SAME, e.g. "U U U D S"
      */
@@ -53,6 +57,10 @@ export interface SongResult extends Record<string, unknown> {
      * The pitch values are absolute and are MIDI pitch values.
      */
     melodic_contour_string_absolute: string;
+    /**
+     * Hashed n-grams of the relative pitches, used for melodic search
+     */
+    melodic_contour_shingles: string[];
   };
   key: {
     /**
@@ -74,10 +82,57 @@ export interface SongResult extends Record<string, unknown> {
      * Indexes of the start of each measure
      */
     measure_starts: number[];
+    /**
+     * Numbers of the measures starting at `measure_starts`, as written in the score
+     */
+    measure_numbers: number[];
     /**
      * Number of rests in the song
      */
     num_rests: number;
+    /**
+     * Hashed n-grams of the durations, used for rhythm search
+     */
+    rhythm_shingles: string[];
+  };
+  /**
+   * Precomputed features used by the educational filters
+   */
+  educational: {
+    /**
+     * Largest melodic interval in semitones, regardless of direction
+     */
+    max_abs_interval: number | null;
+    /**
+     * All the melodic interval sizes in semitones used in the song
+     */
+    interval_sizes: number[];
+    /**
+     * Whether the melody has two semitone steps in a row in the same direction
+     */
+    consecutive_semitones: boolean;
+    /**
+     * Share of the notes that are quarter or eighth notes
+     */
+    quarter_eighth_ratio: number | null;
+    /**
+     * Share of the notes that are half, quarter or eighth notes
+     */
+    quarter_eighth_half_ratio: number | null;
+    time_signature_count: number;
+    /**
+     * Whether all the time signatures are 2/4, 4/4 or 2/2
+     */
+    duple_time_signatures: boolean;
+  };
+  /**
+   * Fixed-length feature vector for finding similar songs
+   */
+  embedding: {
+    /**
+     * Unit length interval histogram, pitch-class profile and duration histogram; null if the song has no notes
+     */
+    vector: number[] | null;
   };
   /**
    * The number of occurences of each rhythmic ngram in the song. Keys are the
@@ -107,9 +162,19 @@ export interface SongResult extends Record<string, unknown> {
   original_file: string;
 }
 
+/**
+ * Downsampled time series, keyed by the number of raw data points in each bucket
+ */
+export type SeriesPyramid = Record<
+  string,
+  { min: number[]; max: number[]; mean: number[] }
+>;
+
 /**
  * K - union type of string that are already known algorithms
  * T - type of the data point
+ *
+ * Other profiles store their results under other names, e.g. `essentia_degara_fast`, read them with getAlgorithm
  */
 type AudioFeature<K extends string, T> = Record<K, T>;
 
@@ -153,9 +218,34 @@ export interface AudioResult extends Record<string, unknown> {
        * Time step between data points in milliseconds
        */
       time_step_ms: number;
+      /**
+       * Median, 5th and 95th percentile of the voiced pitch of the vocals in HZ, null if nothing is voiced
+       */
+      voice_pitch_median_hz: number | null;
+      voice_pitch_low_hz: number | null;
+      voice_pitch_high_hz: number | null;
+      /**
+       * Range between `voice_pitch_low_hz` and `voice_pitch_high_hz` in semitones
+       */
+      voice_pitch_range_semitones: number | null;
+      /**
+       * Percentage of the vocal frames with a pitch
+       */
+      voiced_percent: number | null;
+      /**
+       * Downsampled contours for overview charts, which fetch them instead of the full series. Missing in
+       * recordings processed before they were stored
+       */
+      pyramid?: Record<
+        "pitch_contour_hz_voice" | "pitch_contour_hz_instrumental",
+        SeriesPyramid
+      >;
     }
   >;
-  chords: AudioFeature<
+  /**
+   * Missing in recordings processed with the fast profile
+   */
+  chords?: AudioFeature<
     "autochord",
     {
       /**
@@ -164,6 +254,16 @@ export interface AudioResult extends Record<string, unknown> {
       chord_start: number[];
       chord_end: number[];
       chord_name: string[];
+      /**
+       * Changes between different chords per minute, null without chords
+       */
+      chord_changes_per_minute: number | null;
+      distinct_chords: number;
+      /**
+       * Roman numerals of the chords in the key of the recording, repeated chords collapsed
+       */
+      chord_roman: string[];
+      chord_progression_shingles: string[];
     }
   >;
   loudness: AudioFeature<
@@ -185,6 +285,22 @@ export interface AudioResult extends Record<string, unknown> {
        * Time step between data points in seconds
        */
       timestep_seconds: number;
+      /**
+       * Mean loudness of the non-silent frames in dB
+       */
+      loudness_mean_db: number | null;
+      /**
+       * Dynamics, the range between the 10th and 95th percentile of the loudness in dB
+       */
+      loudness_range_db: number | null;
+      /**
+       * Downsampled loudness for overview charts, which fetch them instead of the full series. Missing in
+       * recordings processed before they were stored
+       */
+      pyramid?: Record<
+        "loudness_total" | "loudness_vocals" | "loudness_instrumental",
+        SeriesPyramid
+      >;
     }
   >;
   key: AudioFeature<
@@ -204,6 +320,15 @@ export interface AudioResult extends Record<string, unknown> {
       confidence: number;
     }
   >;
+  embedding: AudioFeature<
+    "chroma_loudness",
+    {
+      /**
+       * Unit length chroma and loudness statistics of the song
+       */
+      vector: number[] | null;
+    }
+  >;
   metadata: {
     title: string;
     filename: string;
@@ -29,3 +29,10 @@ export const hexToRGB = (hex: string) => {
 export const chartColorsRGB = chartColorsHex.map(hexToRGB);
 
 export const getColorHex = (i: number) => chartColorsHex[i % chartColorsHex.length];
+
+/**
+ * Returns the results of an audio feature whatever algorithm computed them, e.g. `bpm.essentia_degara_fast` in
+ * recordings processed with the fast profile, or undefined if the feature is missing.
+ */
+export const getAlgorithm = <T,>(feature?: Record<string, T>): T | undefined =>
+  feature ? Object.values(feature)[0] : undefined;